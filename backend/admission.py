@@ -0,0 +1,228 @@
+"""
+LLM 呼び出しのアドミッション制御
+
+- 同時実行数（ollama.chat の並列数）を制限する
+- 待ち行列は有限。満杯なら 429 + Retry-After で即座に断る
+- 待ち行列は優先度付き（短いプロンプトを先に通す）
+  事前生成テーブル・テンプレートの回答は LLM を使わないので、ここには来ない
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from typing import Optional
+
+from .metrics import metrics, MS_BUCKETS
+
+
+# ========== 設定 ==========
+
+class AdmissionConfig:
+    """アドミッション制御の設定（環境変数で上書き可）"""
+
+    # 同時に LLM を使えるリクエスト数
+    MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "2"))
+    # 待ち行列の長さ（これを超えたら 429）
+    MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "16"))
+    # 待ち行列での最大待ち時間（秒）。超えたら 503 相当で諦める
+    MAX_WAIT_SEC = float(os.getenv("LLM_MAX_WAIT_SEC", "30"))
+
+    # 優先度判定: この文字数未満のプロンプトは「短い」とみなす
+    SHORT_PROMPT_CHARS = 1500
+
+    # 優先度（小さいほど先）
+    PRIORITY_SHORT = 0
+    PRIORITY_NORMAL = 1
+
+
+def priority_for(prompt: str) -> int:
+    """リクエストの優先度を決める（安いリクエストほど小さい値）"""
+    if len(prompt) < AdmissionConfig.SHORT_PROMPT_CHARS:
+        return AdmissionConfig.PRIORITY_SHORT
+    return AdmissionConfig.PRIORITY_NORMAL
+
+
+# ========== 例外 ==========
+
+class QueueFullError(Exception):
+    """待ち行列が満杯（429 を返す）"""
+
+    status_code = 429
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"LLM queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class QueueTimeoutError(Exception):
+    """待ち行列で MAX_WAIT_SEC を超えた（503 を返す）"""
+
+    status_code = 503
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"LLM queue wait timed out, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+# ========== スロット ==========
+
+class Slot:
+    """
+    取得済みの実行枠。release() は何度呼んでもよい（冪等）。
+
+    Streaming ではジェネレータ終了時と BackgroundTask の両方から
+    release() されるため、二重解放を防ぐ必要がある。
+    """
+
+    def __init__(self, controller: "AdmissionController", wait_ms: float, priority: int):
+        self._controller = controller
+        self._released = False
+        self._lock = threading.Lock()
+        self.wait_ms = wait_ms
+        self.priority = priority
+        self.acquired_at = time.perf_counter()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        held_sec = time.perf_counter() - self.acquired_at
+        self._controller._release_threadsafe(held_sec)
+
+
+# ========== コントローラ ==========
+
+class AdmissionController:
+    """優先度付き・有限待ち行列のセマフォ"""
+
+    def __init__(
+        self,
+        max_concurrency: int = AdmissionConfig.MAX_CONCURRENCY,
+        max_queue: int = AdmissionConfig.MAX_QUEUE,
+        max_wait_sec: float = AdmissionConfig.MAX_WAIT_SEC,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait_sec = max_wait_sec
+
+        self._active = 0
+        self._waiters = []               # heap: (priority, seq, future)
+        self._seq = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # 1リクエストあたりの LLM 占有時間（秒）の指数移動平均
+        self._avg_hold_sec = 5.0
+
+    # ---------- 状態 ----------
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, f in self._waiters if not f.done())
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def retry_after(self) -> int:
+        """待ち行列が捌けるまでの目安（秒）"""
+        waves = (self.queue_depth + self._active) / max(self.max_concurrency, 1)
+        return max(1, int(round(waves * self._avg_hold_sec)))
+
+    def _update_gauges(self):
+        metrics.set_gauge("llm_queue_depth", self.queue_depth)
+        metrics.set_gauge("llm_active", self._active)
+
+    # ---------- 取得 ----------
+
+    async def acquire(self, priority: int = AdmissionConfig.PRIORITY_NORMAL) -> Slot:
+        """
+        実行枠を取得する。空きがなければ優先度順に待つ。
+
+        Raises:
+            QueueFullError: 待ち行列が満杯
+            QueueTimeoutError: max_wait_sec 以内に枠が空かなかった
+        """
+        self._loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+
+        if self._active < self.max_concurrency and self.queue_depth == 0:
+            self._active += 1
+            self._update_gauges()
+            return self._admitted(start, priority)
+
+        if self.queue_depth >= self.max_queue:
+            metrics.inc("llm_rejected_total", reason="queue_full")
+            raise QueueFullError(self.retry_after())
+
+        fut = self._loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        self._update_gauges()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout=self.max_wait_sec)
+        except asyncio.TimeoutError:
+            if not fut.done():
+                fut.cancel()
+                self._prune()
+                metrics.inc("llm_rejected_total", reason="wait_timeout")
+                raise QueueTimeoutError(self.retry_after())
+            # タイムアウトと同時に枠が渡された場合はそのまま使う
+        except asyncio.CancelledError:
+            # クライアントが待機中に切断した
+            if fut.done() and not fut.cancelled():
+                self._release(0.0)
+            else:
+                fut.cancel()
+                self._prune()
+            raise
+
+        return self._admitted(start, priority)
+
+    def _admitted(self, start: float, priority: int) -> Slot:
+        wait_ms = (time.perf_counter() - start) * 1000
+        metrics.observe("llm_queue_wait_ms", wait_ms, MS_BUCKETS, priority=priority)
+        metrics.inc("llm_admitted_total", priority=priority)
+        return Slot(self, wait_ms, priority)
+
+    def _prune(self):
+        self._waiters = [w for w in self._waiters if not w[2].done()]
+        heapq.heapify(self._waiters)
+        self._update_gauges()
+
+    # ---------- 解放 ----------
+
+    def _release_threadsafe(self, held_sec: float):
+        """ワーカースレッドから呼ばれても安全に解放する"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            self._release(held_sec)
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._release(held_sec)
+        else:
+            loop.call_soon_threadsafe(self._release, held_sec)
+
+    def _release(self, held_sec: float):
+        if held_sec > 0:
+            self._avg_hold_sec = 0.8 * self._avg_hold_sec + 0.2 * held_sec
+
+        # 待っている人がいれば枠をそのまま譲る（_active は減らさない）
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(True)
+                self._update_gauges()
+                return
+
+        self._active = max(0, self._active - 1)
+        self._update_gauges()
+
+
+admission = AdmissionController()
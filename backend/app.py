@@ -1,9 +1,14 @@
 from fastapi.responses import StreamingResponse
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
 from typing import Dict
 from .schemas import PromptRequest, ReplyResponse
-import ollama
+from .streaming import StreamConfig, encode_event, coalesce_tokens
+from .metrics import metrics, record_eval_stats, record_output_length, record_context_stats
+from .admission import admission, priority_for, QueueFullError, QueueTimeoutError
+from .singleflight import SingleFlight, TokenBroadcast, flight_key
 import os
 import sys
 import time
@@ -12,12 +17,25 @@ from pathlib import Path
 
 # rag モジュールを import できるようにパスを追加
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "rag")))
-from rag_demo3 import load_jsonl, build_chroma, rag_retrieve_extended, ask_ollama
+from gomi_rag import (
+    load_jsonl, build_chroma, get_client, get_collection,
+    rag_retrieve_extended, ask_ollama, extract_eval_stats, GenerationTimeout, StreamCounter
+)
+from gomi_rag import shared
+from gomi_rag.quantized import quantized_collection
+from gomi_rag.prompt_builder import build_messages, SectionTracker
+from answer_template import TemplateConfig, can_render, render_answer
+from answer_table import AnswerTable
+from gomi_rag.embedding import embedding_stats
+from gomi_rag.ollama_client import (
+    OllamaConfig, ModelConfig, GenerationConfig, generation_options, get_async_client, warmup
+)
+# GPU / ホストのリソースサンプラはフロントエンドと共通
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "front-streaming")))
+from gpu_stats import get_sampler
 
 app = FastAPI()
 
-import chromadb
-
 # ---- Global paths ----
 BASE_DIR = Path(__file__).resolve().parent
 RAG_DIR = BASE_DIR.parent / "rag"
@@ -27,12 +45,13 @@ GOMI_JSONL = RAG_DIR / "rag_docs_merged.jsonl"
 AREA_JSONL = RAG_DIR / "area.jsonl"
 
 # ---- 1. Initialize ChromaDB client (only once) ----
-chroma_client = chromadb.PersistentClient(path=str(CHROMA_PATH))
+# CHROMA_MODE=embedded: backend/chroma_db を直接開く / http: Chroma サーバに接続（gomi_rag.store）
+# 起動時に接続しておき、サーバに届かなければここで失敗させる
+chroma_client = get_client(str(CHROMA_PATH))
 
 
 # ---- 2. Utility: get existing collection or build if missing ----
 def get_or_build_collection(
-    client: chromadb.Client,
     name: str,
     docs: list[str] | None = None,
     meta: list[dict] | None = None,
@@ -43,13 +62,25 @@ def get_or_build_collection(
     Otherwise, raise an error.
     """
     try:
-        return client.get_collection(name)
+        return get_collection(name, str(CHROMA_PATH))
     except Exception:
         if docs is None or meta is None:
             raise RuntimeError(
                 f"Collection '{name}' not found and no data provided to build it."
             )
-        return build_chroma(docs, meta, name=name)
+        return build_chroma(docs, meta, name=name, persist_dir=str(CHROMA_PATH))
+
+
+def load_table(path, key: str):
+    """
+    JSONL のメタデータを読み込む。
+    SHARED_DATA=1 ならスナップショットを mmap した TableView（全ワーカーでページキャッシュを共有）、
+    0 なら従来どおり dict のリスト。
+    """
+    if shared.ENABLED:
+        table = shared.open_table(path, key)
+        return table.snap.docs(), table
+    return load_jsonl(path, key=key)
 
 
 # =========================
@@ -57,18 +88,16 @@ def get_or_build_collection(
 # =========================
 
 # Load documents and metadata from JSONL
-gomi_docs, gomi_meta = load_jsonl(
-    os.path.abspath(GOMI_JSONL),
-    key="品名",
-)
+gomi_docs, gomi_meta = load_table(os.path.abspath(GOMI_JSONL), "品名")
 
 # Get existing collection or build it if missing
 gomi_collection = get_or_build_collection(
-    client=chroma_client,
     name="gomi",
     docs=gomi_docs,
     meta=gomi_meta,
 )
+# 検索は mmap した埋め込み行列で行う（HNSW インデックスをワーカーごとに読み込まない）
+gomi_collection = shared.shared_collection(gomi_collection, "品名")
 
 # Extract item names for exact / candidate matching
 # ========== 注意：Hybrid Grounding システムでは不要 ==========
@@ -82,18 +111,15 @@ gomi_collection = get_or_build_collection(
 # =========================
 
 # Load documents and metadata from JSONL
-area_docs, area_meta = load_jsonl(
-    os.path.abspath(AREA_JSONL),
-    key="町名",
-)
+area_docs, area_meta = load_table(os.path.abspath(AREA_JSONL), "町名")
 
 # Get existing collection or build it if missing
 area_collection = get_or_build_collection(
-    client=chroma_client,
     name="area",
     docs=area_docs,
     meta=area_meta,
 )
+area_collection = shared.shared_collection(area_collection, "町名")
 
 
 # =========================
@@ -102,10 +128,39 @@ area_collection = get_or_build_collection(
 
 # Only try to load the collection; never rebuild automatically
 try:
-    knowledge_collection = chroma_client.get_collection("knowledge")
+    knowledge_collection = get_collection("knowledge", str(CHROMA_PATH))
 except Exception:
     knowledge_collection = None
 
+# KNOWLEDGE_QUANTIZATION=int8 / binary なら量子化コードで走査し float で再ランクする（gomi_rag.quantized）
+if knowledge_collection is not None:
+    knowledge_collection = quantized_collection(knowledge_collection, "file")
+
+
+# =========================
+# answer table (precomputed answers, optional)
+# =========================
+
+# rag/answer_table.py で事前生成したテーブル。無ければ None
+answer_table = AnswerTable.load(RAG_DIR / "answer_table")
+
+
+# =========================
+# model warmup (startup)
+# =========================
+
+@app.on_event("startup")
+async def warmup_models():
+    """生成モデルと Embedding モデルを事前ロードする（最初のユーザにロード時間を払わせない）"""
+    if OllamaConfig.WARMUP:
+        await run_in_threadpool(warmup)
+
+
+@app.on_event("startup")
+async def start_resource_sampler():
+    """GPU / CPU / RSS のバックグラウンド計測を開始する（/api/resources はキャッシュを返すだけ）"""
+    get_sampler()
+
 
 # =========================
 # Debug output (optional)
@@ -117,6 +172,10 @@ if knowledge_collection:
     print("knowledge collection size:", knowledge_collection.count())
 else:
     print("knowledge collection not found")
+if answer_table:
+    print("answer table size:", len(answer_table), f"(model={answer_table.meta.get('model')})")
+else:
+    print("answer table not found")
 
 # # ==== DB 構築 ==== (gomi/area はそのまま)
 # gomi_docs, gomi_meta = load_jsonl(
@@ -152,13 +211,15 @@ else:
 # ==== ログ保存用ユーティリティ ====
 LOG_FILE = Path(os.path.abspath(os.path.join(os.path.dirname(__file__), "logs.jsonl")))
 
-def save_log(user_input: str, assistant_output: str, mode: str):
+def save_log(user_input: str, assistant_output: str, mode: str, eval_stats: dict | None = None):
     log = {
         "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
         "mode": mode,
         "user": user_input,
         "assistant": assistant_output,
     }
+    if eval_stats:
+        log["eval"] = eval_stats
     LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
     with open(LOG_FILE, "a", encoding="utf-8") as f:
         f.write(json.dumps(log, ensure_ascii=False) + "\n")
@@ -166,23 +227,104 @@ def save_log(user_input: str, assistant_output: str, mode: str):
 
 
 
+# Blocking モードの生成期限（秒）。超えたら Ollama 側の生成を止めて 504 を返す
+LLM_DEADLINE_SEC = float(os.getenv("LLM_DEADLINE_SEC", "120"))
+
+
+# ==== LLM 実行枠の取得 ====
+async def acquire_llm_slot(prompt: str):
+    """
+    LLM の実行枠を取得する。待ち行列が満杯なら 429、
+    待ち時間切れなら 503 を Retry-After 付きで返す。
+    """
+    try:
+        return await admission.acquire(priority_for(prompt))
+    except (QueueFullError, QueueTimeoutError) as e:
+        print(f"🚦 アドミッション拒否({e.status_code}): {e}")
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+
+# ==== LLM を使わない回答（事前生成テーブル / テンプレート） ====
+def answer_without_llm(req: PromptRequest, details: dict, endpoint: str):
+    """
+    高置信度・非曖昧な品名なら LLM を使わずに回答文を返す。
+    1. 事前生成テーブル（answer_table）にあればそれを返す
+    2. 無ければテンプレートで組み立てる
+    使えない場合は (None, None)（理由はメトリクスに記録）。
+
+    Returns:
+        (回答文, "table" | "template")
+    """
+    if not (TemplateConfig.ENABLED and req.allow_template):
+        metrics.inc("answers_total", path="llm", endpoint=endpoint)
+        return None, None
+    ok, reason = can_render(details)
+    if not ok:
+        metrics.inc("template_skipped_total", reason=reason)
+        metrics.inc("answers_total", path="llm", endpoint=endpoint)
+        return None, None
+
+    meta = details["grounding_result"].primary_candidate.metadata
+    area_rows = details.get("area_rows") or []
+    area_row = area_rows[0] if area_rows else None
+
+    reply = answer_table.lookup(meta, area_row) if answer_table else None
+    path = "table"
+    if reply is None:
+        reply = render_answer(meta, area_row)
+        path = "template"
+
+    print(f"⚡ LLM 不使用の回答（{path}）")
+    metrics.inc("answers_total", path=path, endpoint=endpoint)
+    return reply, path
+
+
 # ==== Blocking モード ====
+# 同じ質問が処理中なら、その結果を共有する
+respond_flights = SingleFlight("respond")
+
+
+def mark_coalesced(references: list):
+    """共有された結果であることを performance に記録する"""
+    for ref in references:
+        if isinstance(ref, dict) and ref.get("type") == "performance":
+            ref["coalesced"] = True
+
+
 @app.post("/api/bot/respond")
 async def rag_respond(req: PromptRequest):
+    result, was_shared = await respond_flights.do(
+        flight_key(req.prompt, req.allow_template),
+        lambda: respond_pipeline(req),
+    )
+    if was_shared:
+        print("🔗 処理中の同一リクエストの結果を共有")
+        mark_coalesced(result["references"])
+        save_log(req.prompt, result["reply"], mode="Blocking(API)(coalesced)")
+    return result
+
+
+async def respond_pipeline(req: PromptRequest):
     # ========== 性能監視開始 ==========
     import time
     request_start = time.perf_counter()
     
     # ========== RAG検索監視 ==========
     retrieval_start = time.perf_counter()
-    rag_prompt, references = rag_retrieve_extended(
+    rag_prompt, references, details = await run_in_threadpool(
+        rag_retrieve_extended,
         req.prompt,
         gomi_collection,
         knowledge_collection=knowledge_collection,
         area_collection=area_collection,
         known_items=None,
         area_meta=area_meta,
-        top_k=2
+        top_k=2,
+        return_details=True
     )
     retrieval_time = (time.perf_counter() - retrieval_start) * 1000
     
@@ -190,28 +332,76 @@ async def rag_respond(req: PromptRequest):
     print(rag_prompt)
     print("\n===== DEBUG: FULL PROMPT END =====\n")
     print(f"\n⏱️  RAG検索耗時: {retrieval_time:.2f}ms")
+    context_stats = details.get("context") or {}
+    record_context_stats(context_stats, endpoint="respond")
+
+    # ========== 事前生成テーブル / テンプレート回答（LLM 不使用） ==========
+    fast_reply, fast_path = answer_without_llm(req, details, endpoint="respond")
+    if fast_reply is not None:
+        total_time = (time.perf_counter() - request_start) * 1000
+        print(f"⏱️  総処理時間: {total_time:.2f}ms")
+        references.append({
+            "type": "performance",
+            "answer_path": fast_path,
+            "retrieval_time_ms": round(retrieval_time, 2),
+            "total_time_ms": round(total_time, 2),
+        })
+        save_log(req.prompt, fast_reply, mode=f"Blocking(API)({fast_path})")
+        return {
+            "reply": fast_reply,
+            "references": references
+        }
 
     # ========== LLM推理監視 ==========
+    slot = await acquire_llm_slot(rag_prompt)
     llm_start = time.perf_counter()
-    reply = ask_ollama(rag_prompt)
+    try:
+        reply, eval_stats = await run_in_threadpool(
+            ask_ollama, rag_prompt, return_stats=True, deadline_sec=LLM_DEADLINE_SEC, endpoint="respond"
+        )
+    except GenerationTimeout as e:
+        # Ollama は読み取りスレッドが接続を閉じるまで生成を続けるので、それまで実行枠を持ったままにする
+        e.when_stopped(slot.release)
+        print(f"🛑 LLM生成タイムアウト: {e.elapsed_ms:.0f}ms で中断（{len(e.partial)}文字）")
+        metrics.inc("llm_cancelled_total", endpoint="respond", reason="deadline")
+        if e.partial:
+            save_log(req.prompt, e.partial, mode="Blocking(API)(cancelled)")
+        raise HTTPException(status_code=504, detail=str(e))
+    except BaseException:
+        slot.release()
+        raise
+    slot.release()
     llm_time = (time.perf_counter() - llm_start) * 1000
+    record_eval_stats(eval_stats, endpoint="respond")
+    record_output_length(reply, eval_stats.get("stop_reason"), endpoint="respond")
     
     # ========== 総時間計算 ==========
     total_time = (time.perf_counter() - request_start) * 1000
     
+    print(f"⏱️  待ち行列: {slot.wait_ms:.2f}ms (priority={slot.priority})")
     print(f"⏱️  LLM推理耗時: {llm_time:.2f}ms")
     print(f"⏱️  総処理時間: {total_time:.2f}ms ({total_time/1000:.2f}s)")
-    print(f"📊 時間分配: RAG={retrieval_time/total_time*100:.1f}% | LLM={llm_time/total_time*100:.1f}%\n")
+    print(f"📊 時間分配: RAG={retrieval_time/total_time*100:.1f}% | LLM={llm_time/total_time*100:.1f}%")
+    print(f"📊 Tokens: prompt={eval_stats['prompt_tokens']} ({eval_stats['prompt_eval_ms']}ms) | "
+          f"output={eval_stats['output_tokens']} ({eval_stats['tokens_per_sec']} tok/s)\n")
     
     # 性能数据添加到响应中
-    if references and isinstance(references, list):
+    if isinstance(references, list):
         references.append({
             "type": "performance",
+            "answer_path": "llm",
             "retrieval_time_ms": round(retrieval_time, 2),
+            "queue_wait_ms": round(slot.wait_ms, 2),
             "llm_time_ms": round(llm_time, 2),
-            "total_time_ms": round(total_time, 2)
+            "total_time_ms": round(total_time, 2),
+            # プロンプトトークン: context_tokens_est は推定、prompt_tokens は Ollama の実測
+            "context_tokens_est": context_stats.get("tokens_est"),
+            "context_budget": context_stats.get("budget"),
+            **eval_stats,
         })
 
+    save_log(req.prompt, reply, mode="Blocking(API)", eval_stats=eval_stats)
+
     return {
         "reply": reply,
         "references": references
@@ -220,25 +410,175 @@ async def rag_respond(req: PromptRequest):
 
 
 # ==== Streaming モード ====
+from fastapi import Request
 from fastapi.responses import StreamingResponse
+import anyio
 import json
 
-@app.post("/api/bot/respond_stream")
-async def rag_respond_stream(req: PromptRequest):
-    # ========== 性能監視開始 ==========
-    import time
-    request_start = time.perf_counter()
+# ストリーミングは AsyncClient を使う（キャンセルが上流まで伝わるように）
+async_ollama = get_async_client()
+
+# 切断確認の間隔（秒）。Starlette 側の切断検知に加えて念のため確認する
+DISCONNECT_CHECK_INTERVAL = 0.5
+
+
+class ClientDisconnected(Exception):
+    """Streaming 中にクライアントが切断した"""
+
+
+def fast_stream_response(req: PromptRequest, reply: str, references: list, fmt: str, perf: dict):
+    """LLM 不使用の回答を Streaming 形式（text / イベント）で返す"""
+    save_log(req.prompt, reply, mode=f"Streaming(API,{fmt})({perf['answer_path']})")
+
+    if fmt == "text":
+        return StreamingResponse(
+            iter([reply]),
+            media_type=StreamConfig.MEDIA_TYPES["text"],
+            headers={"X-References": json.dumps(references + [perf], ensure_ascii=True)}
+        )
+
+    def events():
+        if references:
+            yield encode_event("references", references, fmt)
+        yield encode_event("token", {"text": reply}, fmt)
+        yield encode_event("metrics", perf, fmt)
+        yield encode_event("done", {"chars": len(reply)}, fmt)
+
+    return StreamingResponse(
+        events(),
+        media_type=StreamConfig.MEDIA_TYPES[fmt],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# 同じ質問が生成中なら、そのトークンストリームを共有する
+stream_flights = SingleFlight("respond_stream")
+
+
+async def llm_token_gen(rag_prompt: str, state: dict, request_start: float):
+    """
+    Ollama からトークンを受け取り、計測値を state に記録する。
+
+    TokenBroadcast のタスクから読まれる。購読者が全員離脱してタスクが
+    キャンセルされたら、上流ストリームを閉じて生成を止める。
+    【出力形式】の4項目を出し終えた時点（SectionTracker）でも生成を止める。
+    最終イベントを待たずに止めた場合の評価カウンタは StreamCounter の推定値。
+    """
+    llm_start = time.perf_counter()
+    counter = StreamCounter(ModelConfig.ANSWER)
+    stream = None
+    upstream_done = False
+    stop = False
+    tracker = SectionTracker() if GenerationConfig.EARLY_STOP else None
+    try:
+        stream = await async_ollama.chat(
+            model=ModelConfig.ANSWER,
+            # Blocking と同じ固定プレフィックスを使う（KV キャッシュ再利用）
+            messages=build_messages(rag_prompt),
+            stream=True,
+            keep_alive=OllamaConfig.KEEP_ALIVE,
+            options=generation_options("respond_stream")
+        )
+        async for event in stream:
+            # 最終イベント（done=True）にだけ評価カウンタが入っている
+            if event.get("done"):
+                upstream_done = True
+                state["eval"] = extract_eval_stats(event, model=ModelConfig.ANSWER)
+                state["stop_reason"] = state["eval"]["stop_reason"]
+            counter.seen(event)
+            content = event.get("message", {}).get("content", "")
+            if tracker:
+                content, stop = tracker.feed(content)
+            if content:
+                # 记录首字节时间 (TTFB - Time To First Byte)
+                if state.get("first_token_ms") is None:
+                    state["first_token_ms"] = (time.perf_counter() - llm_start) * 1000
+                    print(f"⏱️  首Token耗時(TTFB): {state['first_token_ms']:.2f}ms")
+                
+                state["collected"] += content
+                yield content
+            if stop:
+                print(f"✂️  4項目を出力済みのため生成を停止（{len(state['collected'])}文字）")
+                state["stop_reason"] = "sections"
+                break
+        if tracker and not stop:
+            tail = tracker.finish()
+            if tail:
+                state["collected"] += tail
+                yield tail
+        state["completed"] = True
+    except Exception as e:
+        print(f"⚠️ Streaming生成エラー: {e}")
+        state["error"] = str(e)
+        raise
+    finally:
+        # 上流が終わっていなければ閉じて生成を止める（早期停止・全員切断・タイムアウト等）
+        if stream is not None and not upstream_done:
+            with anyio.CancelScope(shield=True):
+                await stream.aclose()
+        if not upstream_done and counter.tokens:
+            state["eval"] = extract_eval_stats(
+                counter.final_event(state.get("stop_reason") or "cancelled"), model=ModelConfig.ANSWER
+            )
+        # LLM完成时间
+        state["llm_time_ms"] = (time.perf_counter() - llm_start) * 1000
+        state["total_time_ms"] = (time.perf_counter() - request_start) * 1000
+
+
+def finish_stream(state: dict, prompt: str, retrieval_time: float, mode: str):
+    """生成 1 回につき 1 度だけ呼ばれる（ログ・メトリクス）"""
+    llm_time = state.get("llm_time_ms")
+    total_time = state.get("total_time_ms")
+    first_token_time = state.get("first_token_ms")
+    if state.get("error"):
+        metrics.inc("llm_errors_total", endpoint="respond_stream")
+        mode += "(error)"
+    elif not state.get("completed"):
+        # 読まれない出力に GPU を使い続けないよう中断した
+        print(f"🛑 Streaming中断（クライアント切断）: {len(state['collected'])}文字で停止")
+        metrics.inc("llm_cancelled_total", endpoint="respond_stream", reason="client_disconnect")
+        mode += "(cancelled)"
+    if llm_time is not None:
+        print(f"⏱️  LLM流式生成耗時: {llm_time:.2f}ms")
+        print(f"⏱️  総処理時間: {total_time:.2f}ms ({total_time/1000:.2f}s)")
+        print(f"📊 時間分配: RAG={retrieval_time/total_time*100:.1f}% | LLM={llm_time/total_time*100:.1f}%")
+        if first_token_time:
+            print(f"📊 TTFB={first_token_time:.2f}ms | 生成={llm_time-first_token_time:.2f}ms")
+    if state.get("subscribers", 1) > 1:
+        print(f"🔗 共有ストリーム: {state['subscribers']}リクエスト")
+        mode += f"(shared x{state['subscribers']})"
+    eval_stats = state.get("eval")
+    if eval_stats:
+        print(f"📊 Tokens: prompt={eval_stats['prompt_tokens']} ({eval_stats['prompt_eval_ms']}ms) | "
+              f"output={eval_stats['output_tokens']} ({eval_stats['tokens_per_sec']} tok/s)\n")
+        record_eval_stats(eval_stats, endpoint="respond_stream")
+    if state.get("completed"):
+        record_output_length(state["collected"], state.get("stop_reason"), endpoint="respond_stream")
     
+    if state["collected"]:
+        save_log(prompt, state["collected"], mode=mode, eval_stats=eval_stats)
+
+
+async def prepare_stream(req: PromptRequest, flight, request_start: float) -> dict:
+    """
+    検索 → LLM 不使用の回答 or LLM 生成の開始まで（先行リクエストのみ実行）。
+
+    Returns:
+        {"kind": "fast", "reply", "references", "perf"} または
+        {"kind": "llm", "references", "perf", "state", "broadcast"}
+    """
     # ========== RAG検索監視 ==========
     retrieval_start = time.perf_counter()
-    rag_prompt, references = rag_retrieve_extended(
+    rag_prompt, references, details = await run_in_threadpool(
+        rag_retrieve_extended,
         req.prompt,
         gomi_collection,
         knowledge_collection=knowledge_collection,
         area_collection=area_collection,
         known_items=None,
         area_meta=area_meta,
-        top_k=2
+        top_k=2,
+        return_details=True
     )
     retrieval_time = (time.perf_counter() - retrieval_start) * 1000
     
@@ -246,55 +586,187 @@ async def rag_respond_stream(req: PromptRequest):
     print("\n===== DEBUG: FULL PROMPT START =====\n")
     print(rag_prompt)
     print("\n===== DEBUG: FULL PROMPT END =====\n")
+    context_stats = details.get("context") or {}
+    record_context_stats(context_stats, endpoint="respond_stream")
     
-    # 性能情報を references に追加
-    if references and isinstance(references, list):
-        references.append({
+    # ========== 事前生成テーブル / テンプレート回答（LLM 不使用） ==========
+    fast_reply, fast_path = answer_without_llm(req, details, endpoint="respond_stream")
+    if fast_reply is not None:
+        return {
+            "kind": "fast",
+            "reply": fast_reply,
+            "references": references,
+            "perf": {
+                "type": "performance",
+                "answer_path": fast_path,
+                "retrieval_time_ms": round(retrieval_time, 2),
+                "total_time_ms": round((time.perf_counter() - request_start) * 1000, 2),
+            },
+        }
+    
+    # ========== LLM 実行枠（満杯なら 429） ==========
+    slot = await acquire_llm_slot(rag_prompt)
+    print(f"⏱️  待ち行列: {slot.wait_ms:.2f}ms (priority={slot.priority})")
+    
+    state = {"collected": "", "subscribers": 1}
+
+    def on_done():
+        # 生成が終わった時点で次のリクエストに枠を譲る
+        slot.release()
+        stream_flights.forget(flight)
+        finish_stream(state, req.prompt, retrieval_time, mode=f"Streaming(API,{req.stream_format})")
+
+    broadcast = TokenBroadcast(llm_token_gen(rag_prompt, state, request_start), on_done=on_done)
+    flight.on_abandon = broadcast.cancel
+    return {
+        "kind": "llm",
+        "references": references,
+        # 性能情報（LLM 完了後に埋める）
+        "perf": {
             "type": "performance",
-            "retrieval_time_ms": round(retrieval_time, 2)
-        })
+            "answer_path": "llm",
+            "retrieval_time_ms": round(retrieval_time, 2),
+            "queue_wait_ms": round(slot.wait_ms, 2),
+            "context_tokens_est": context_stats.get("tokens_est"),
+            "context_budget": context_stats.get("budget"),
+        },
+        "state": state,
+        "broadcast": broadcast,
+    }
 
-    def stream_gen():
-        collected = ""
-        llm_start = time.perf_counter()
-        first_token_time = None
-        
-        stream = ollama.chat(
-            model="swallow:latest",
-            messages=[{"role": "user", "content": rag_prompt}],
-            stream=True
-        )
-        
-        for event in stream:
-            content = event.get("message", {}).get("content", "")
-            if content:
-                # 记录首字节时间 (TTFB - Time To First Byte)
-                if first_token_time is None:
-                    first_token_time = (time.perf_counter() - llm_start) * 1000
-                    print(f"⏱️  首Token耗時(TTFB): {first_token_time:.2f}ms")
-                
-                collected += content
+
+@app.post("/api/bot/respond_stream")
+async def rag_respond_stream(req: PromptRequest, request: Request):
+    # ========== 性能監視開始 ==========
+    import time
+    request_start = time.perf_counter()
+    fmt = req.stream_format
+    
+    # ========== single-flight（同じ質問が処理中なら相乗り） ==========
+    flight, lease, leader = stream_flights.join(flight_key(req.prompt, req.allow_template))
+    try:
+        if leader:
+            plan = await stream_flights.lead(flight, lambda: prepare_stream(req, flight, request_start))
+            if plan["kind"] == "fast":
+                stream_flights.forget(flight)
+        else:
+            plan = await flight.wait()
+            print("🔗 処理中の同一リクエストに相乗り")
+    except BaseException:
+        lease.release()
+        raise
+    
+    references = list(plan["references"])
+    perf = dict(plan["perf"])
+    if not leader:
+        perf["coalesced"] = True
+    
+    if plan["kind"] == "fast":
+        lease.release()
+        return fast_stream_response(req, plan["reply"], references, fmt, perf)
+    
+    broadcast, state = plan["broadcast"], plan["state"]
+    if not leader:
+        state["subscribers"] += 1
+        # 途中参加の時点で生成済みだった文字数（その分はバッファから即座に送る）
+        perf["joined_at_chars"] = len(state["collected"])
+    # text モードはヘッダー送信時点の値しか返せないため、ここで追加
+    if fmt == "text" and references:
+        references.append(perf)
+
+    async def tokens():
+        """共有ストリームを読む。このリクエストのクライアント切断も確認する"""
+        last_check = time.perf_counter()
+        async for chunk in broadcast.stream():
+            yield chunk
+            now = time.perf_counter()
+            if now - last_check >= DISCONNECT_CHECK_INTERVAL:
+                last_check = now
+                if await request.is_disconnected():
+                    raise ClientDisconnected()
+
+    async def stream_gen():
+        """従来モード: トークンをそのまま text/plain で返す"""
+        try:
+            async for content in tokens():
                 yield content
-        
-        # LLM完成时间
-        llm_time = (time.perf_counter() - llm_start) * 1000
-        total_time = (time.perf_counter() - request_start) * 1000
-        
-        print(f"⏱️  LLM流式生成耗時: {llm_time:.2f}ms")
-        print(f"⏱️  総処理時間: {total_time:.2f}ms ({total_time/1000:.2f}s)")
-        print(f"📊 時間分配: RAG={retrieval_time/total_time*100:.1f}% | LLM={llm_time/total_time*100:.1f}%")
-        if first_token_time:
-            print(f"📊 TTFB={first_token_time:.2f}ms | 生成={llm_time-first_token_time:.2f}ms\n")
-        
-        if collected:
-            save_log(req.prompt, collected, mode="Streaming(API)")
+        except ClientDisconnected:
+            pass
+        finally:
+            # 全員が離脱すると上流の生成が止まる
+            lease.release()
+
+    async def event_gen():
+        """イベントモード: references / token / metrics / done を順に返す"""
+        try:
+            # 検索結果は生成前に 1 回だけ送る（生成開始前に確定している。text モードは X-References ヘッダー）
+            if references:
+                yield encode_event("references", references, fmt)
+            
+            try:
+                async for chunk in coalesce_tokens(tokens()):
+                    yield encode_event("token", {"text": chunk}, fmt)
+            except ClientDisconnected:
+                return
+            except Exception as e:
+                yield encode_event("error", {"message": str(e)}, fmt)
+            
+            if state.get("llm_time_ms") is not None:
+                perf["llm_time_ms"] = round(state["llm_time_ms"], 2)
+                perf["total_time_ms"] = round(state["total_time_ms"], 2)
+            if state.get("first_token_ms") is not None:
+                perf["ttfb_ms"] = round(state["first_token_ms"], 2)
+            if state.get("eval"):
+                perf.update(state["eval"])
+            yield encode_event("metrics", perf, fmt)
+            yield encode_event("done", {"chars": len(state["collected"])}, fmt)
+        finally:
+            lease.release()
+
+    if fmt == "text":
+        # 📌 references を JSON にしてヘッダーに埋め込む（従来互換）
+        return StreamingResponse(
+            stream_gen(),
+            media_type=StreamConfig.MEDIA_TYPES["text"],
+            headers={"X-References": json.dumps(references, ensure_ascii=True)},
+            # ジェネレータが一度も回らずに切断された場合でも離脱扱いにする
+            background=BackgroundTask(lease.release)
+        )
 
-    # 📌 references を JSON にしてヘッダーに埋め込む
     return StreamingResponse(
-        stream_gen(),
-        media_type="text/plain",
-        headers={"X-References": json.dumps(references, ensure_ascii=True)}
+        event_gen(),
+        media_type=StreamConfig.MEDIA_TYPES[fmt],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(lease.release)
     )
 
+
+# ==== メトリクス ====
+@app.get("/api/metrics")
+async def get_metrics():
+    """プロセス内メトリクス（モデル別 tokens/sec ヒストグラム等）を返す"""
+    snapshot = metrics.snapshot()
+    counters = snapshot["counters"]
+    llm_free = sum(v for k, v in counters.items() if k.startswith("answers_total{") and "path=llm" not in k)
+    total = sum(v for k, v in counters.items() if k.startswith("answers_total{"))
+    # LLM を使わずに返せた割合（事前生成テーブル＋テンプレート）
+    snapshot["llm_free_ratio"] = round(llm_free / total, 4) if total else None
+    # Embedding コアレッサのバッチ充填状況
+    snapshot["embedding"] = embedding_stats()
+    return snapshot
+
+
+# ==== リソース監視 ====
+@app.get("/api/resources")
+async def get_resources(limit: int = 60):
+    """GPU（全デバイス）とホスト CPU / メモリ / RSS の最新値と直近の履歴"""
+    sampler = get_sampler()
+    return {
+        "interval_sec": sampler.interval_sec,
+        "snapshot": sampler.snapshot(),
+        "history": sampler.history(limit=max(0, limit)),
+    }
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+uvicorn ワーカー数ごとのメモリ計測（SHARED_DATA の有無を比較）
+
+各設定で `uvicorn backend.app:app --workers N` を起動し、起動完了後に
+ワーカープロセスの /proc/<pid>/smaps_rollup を読む。
+
+    Rss      ワーカーが触れたページ（共有ページも各ワーカーに数えられる）
+    Pss      共有ページを共有しているプロセス数で割ったもの（合計が実際の使用量）
+    Private  そのワーカーだけが持つページ（ヒープ上の dict / HNSW インデックスなど）
+    Shared   他のプロセスと共有しているページ（mmap したスナップショット・埋め込み行列など）
+
+使い方（リポジトリのルートで実行。Ollama のウォームアップは無効にする）:
+    python backend/benchmark_workers.py
+    python backend/benchmark_workers.py --workers 1 4 8 --settle 5 --out benchmark_workers.json
+"""
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+FIELDS = ("Rss", "Pss", "Private_Clean", "Private_Dirty", "Shared_Clean", "Shared_Dirty")
+
+
+def read_smaps(pid: int) -> dict:
+    """smaps_rollup の主要な値（MB）"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts and parts[0].rstrip(":") in FIELDS:
+                values[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss_mb": values.get("Rss", 0.0),
+        "pss_mb": values.get("Pss", 0.0),
+        "private_mb": values.get("Private_Clean", 0.0) + values.get("Private_Dirty", 0.0),
+        "shared_mb": values.get("Shared_Clean", 0.0) + values.get("Shared_Dirty", 0.0),
+    }
+
+
+def child_pids(parent: int) -> list:
+    """parent の子プロセス（multiprocessing の resource_tracker は除く）"""
+    pids = []
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+            cmdline = (entry / "cmdline").read_bytes().replace(b"\0", b" ").decode(errors="replace")
+        except OSError:
+            continue
+        # stat: pid (comm) state ppid ...（comm に空白が入り得るので ")" 以降を読む）
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        if ppid == parent and "resource_tracker" not in cmdline:
+            pids.append(int(entry.name))
+    return sorted(pids)
+
+
+def wait_ready(port: int, workers: int, proc, timeout: float) -> list:
+    """API が応答し、ワーカーが揃うまで待つ"""
+    deadline = time.time() + timeout
+    url = f"http://127.0.0.1:{port}/api/resources?limit=1"
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"uvicorn が終了しました (exit {proc.returncode})")
+        pids = child_pids(proc.pid) if workers > 1 else [proc.pid]
+        try:
+            with urllib.request.urlopen(url, timeout=2):
+                pass
+            if len(pids) >= workers:
+                return pids[:workers]
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"{timeout}s 以内に起動しませんでした")
+
+
+def measure(workers: int, shared: bool, port: int, settle: float, timeout: float) -> dict:
+    env = dict(os.environ, SHARED_DATA="1" if shared else "0", OLLAMA_WARMUP="0")
+    cmd = [sys.executable, "-m", "uvicorn", "backend.app:app", "--port", str(port), "--log-level", "warning"]
+    if workers > 1:
+        cmd += ["--workers", str(workers)]
+    proc = subprocess.Popen(cmd, cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        pids = wait_ready(port, workers, proc, timeout)
+        # 全ワーカーが起動処理（コレクション・テーブルの読み込み）を終えるまで待つ
+        time.sleep(settle)
+        per_worker = [read_smaps(pid) for pid in pids]
+    finally:
+        proc.send_signal(signal.SIGINT)
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+    def mean(key):
+        return round(sum(w[key] for w in per_worker) / len(per_worker), 1)
+
+    return {
+        "workers": workers,
+        "shared": shared,
+        "rss_mb_per_worker": mean("rss_mb"),
+        "pss_mb_per_worker": mean("pss_mb"),
+        "private_mb_per_worker": mean("private_mb"),
+        "shared_mb_per_worker": mean("shared_mb"),
+        "pss_mb_total": round(sum(w["pss_mb"] for w in per_worker), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="uvicorn ワーカー数ごとの RSS / PSS を計測する")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--settle", type=float, default=5.0, help="起動後に計測まで待つ秒数")
+    parser.add_argument("--timeout", type=float, default=180.0, help="起動待ちの上限（秒）")
+    parser.add_argument("--out", default="benchmark_workers.json", help="結果の保存先")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'workers':>7} {'shared':>6} | {'RSS/w':>8} {'PSS/w':>8} {'Private/w':>10} {'Shared/w':>9} | {'PSS合計':>8}")
+    for workers in args.workers:
+        for shared in (False, True):
+            try:
+                r = measure(workers, shared, args.port, args.settle, args.timeout)
+            except (RuntimeError, TimeoutError) as e:
+                print(f"{workers:>7} {str(shared):>6} | ⚠️ {e}")
+                continue
+            results.append(r)
+            print(f"{workers:>7} {str(shared):>6} | {r['rss_mb_per_worker']:>7.1f}M {r['pss_mb_per_worker']:>7.1f}M "
+                  f"{r['private_mb_per_worker']:>9.1f}M {r['shared_mb_per_worker']:>8.1f}M | {r['pss_mb_total']:>7.1f}M")
+
+    Path(args.out).write_text(json.dumps(results, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    print(f"✅ 保存: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
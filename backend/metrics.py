@@ -0,0 +1,169 @@
+"""
+プロセス内メトリクス（カウンタ / ヒストグラム）
+
+Prometheus 等の外部依存を入れずに、/api/metrics から JSON で参照できる
+最小限の集計を提供する。ラベルは model=... のようなキーワード引数で渡す。
+"""
+
+import bisect
+import threading
+from typing import Dict, List, Tuple
+
+
+# ========== バケット定義 ==========
+
+# tokens/sec（生成側・プロンプト評価側とも）
+RATE_BUCKETS = [1, 2, 5, 10, 20, 30, 50, 75, 100, 200, 500, 1000, 2000]
+# トークン数
+TOKEN_BUCKETS = [16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192]
+# 出力文字数（回答の長さのテール）
+CHAR_BUCKETS = [64, 128, 256, 384, 512, 768, 1024, 1536, 2048, 4096]
+# 時間（ms）
+MS_BUCKETS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000]
+
+
+# ========== ヒストグラム ==========
+
+class Histogram:
+    """固定バケットのヒストグラム（上限値で振り分け、最後は +Inf）"""
+
+    def __init__(self, buckets: List[float]):
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        idx = bisect.bisect_left(self.buckets, value)
+        self.counts[idx] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float):
+        """バケット上限による近似分位点"""
+        if self.count == 0:
+            return None
+        target = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def to_dict(self):
+        labels = [f"le_{b:g}" for b in self.buckets] + ["le_inf"]
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 2),
+            "avg": round(self.sum / self.count, 2) if self.count else None,
+            "p50": self.quantile(0.50),
+            "p90": self.quantile(0.90),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+# ========== レジストリ ==========
+
+def _key(name: str, labels: Dict[str, str]) -> Tuple:
+    return (name,) + tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class MetricsRegistry:
+    """スレッドセーフなメトリクス置き場"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple, float] = {}
+        self._gauges: Dict[Tuple, float] = {}
+        self._histograms: Dict[Tuple, Histogram] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            k = _key(name, labels)
+            self._counters[k] = self._counters.get(k, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges[_key(name, labels)] = value
+
+    def observe(self, name: str, value, buckets: List[float] = MS_BUCKETS, **labels):
+        if value is None:
+            return
+        with self._lock:
+            k = _key(name, labels)
+            h = self._histograms.get(k)
+            if h is None:
+                h = self._histograms[k] = Histogram(buckets)
+            h.observe(float(value))
+
+    def counter_value(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(_key(name, labels), 0)
+
+    def snapshot(self) -> dict:
+        def _fmt(k):
+            name, *labels = k
+            return name + ("{" + ",".join(f"{a}={b}" for a, b in labels) + "}" if labels else "")
+
+        with self._lock:
+            return {
+                "counters": {_fmt(k): v for k, v in self._counters.items()},
+                "gauges": {_fmt(k): v for k, v in self._gauges.items()},
+                "histograms": {_fmt(k): h.to_dict() for k, h in self._histograms.items()},
+            }
+
+
+metrics = MetricsRegistry()
+
+
+# ========== Ollama 評価カウンタの記録 ==========
+
+def record_eval_stats(stats: dict, endpoint: str):
+    """
+    extract_eval_stats() の結果をモデル別ヒストグラムに集計する。
+
+    プロンプト評価と生成を分けて持つことで、容量見積もりで
+    「入力トークンのコスト」と「出力トークンのコスト」を別々に使える。
+    """
+    if not stats:
+        return
+    model = stats.get("model") or "unknown"
+    metrics.inc("llm_requests_total", model=model, endpoint=endpoint)
+    metrics.inc("llm_prompt_tokens_total", stats.get("prompt_tokens") or 0, model=model)
+    metrics.inc("llm_output_tokens_total", stats.get("output_tokens") or 0, model=model)
+    metrics.observe("llm_tokens_per_sec", stats.get("tokens_per_sec"), RATE_BUCKETS, model=model)
+    metrics.observe("llm_prompt_tokens_per_sec", stats.get("prompt_tokens_per_sec"), RATE_BUCKETS, model=model)
+    metrics.observe("llm_output_tokens", stats.get("output_tokens"), TOKEN_BUCKETS, model=model)
+    metrics.observe("llm_prompt_tokens", stats.get("prompt_tokens"), TOKEN_BUCKETS, model=model)
+    metrics.observe("llm_prompt_eval_ms", stats.get("prompt_eval_ms"), MS_BUCKETS, model=model)
+    metrics.observe("llm_eval_ms", stats.get("eval_ms"), MS_BUCKETS, model=model)
+    if stats.get("cold_load"):
+        # モデルが VRAM から追い出されていて、ロードを待ったリクエスト
+        metrics.inc("llm_cold_loads_total", model=model, endpoint=endpoint)
+        metrics.observe("llm_load_ms", stats.get("load_ms"), MS_BUCKETS, model=model)
+
+
+def record_context_stats(context: dict, endpoint: str):
+    """
+    コンテキストパッカーの結果（details["context"]）を集計する。
+    推定トークン数の分布と、予算超過で除外・切り詰めしたヒット数を見る。
+    """
+    if not context:
+        return
+    metrics.observe("context_tokens_est", context.get("tokens_est"), TOKEN_BUCKETS, endpoint=endpoint)
+    metrics.inc("context_hits_dropped_total", context.get("dropped") or 0, endpoint=endpoint)
+    metrics.inc("context_hits_truncated_total", context.get("truncated") or 0, endpoint=endpoint)
+    metrics.inc("context_hits_deduped_total", context.get("deduped") or 0, endpoint=endpoint)
+
+
+def record_output_length(text: str, stop_reason, endpoint: str):
+    """
+    回答の長さを停止理由別に集計する（p90 / p99 でテールを見る）。
+    stop_reason: "sections"（4項目で早期停止）/ "stop" / "length"（num_predict 到達）/ None
+    """
+    reason = stop_reason or "unknown"
+    metrics.inc("llm_stop_total", endpoint=endpoint, reason=reason)
+    metrics.observe("llm_output_chars", len(text or ""), CHAR_BUCKETS, endpoint=endpoint)
+    metrics.observe("llm_output_chars", len(text or ""), CHAR_BUCKETS, endpoint=endpoint, stop=reason)
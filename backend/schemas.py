@@ -1,7 +1,13 @@
+from typing import Literal
+
 from pydantic import BaseModel
 
 class PromptRequest(BaseModel):
     prompt: str
+    # Streaming のみ有効: "text"（従来）/ "ndjson" / "sse"
+    stream_format: Literal["text", "ndjson", "sse"] = "text"
+    # False にすると高置信度の品名でも必ず LLM で回答する
+    allow_template: bool = True
 
 class ReplyResponse(BaseModel):
-    reply: str
\ No newline at end of file
+    reply: str
@@ -0,0 +1,203 @@
+"""
+同一リクエストの single-flight 化
+
+町内で同じお知らせが出ると、数秒の間に同じ質問（「粗大ごみの出し方」等）が集中する。
+正規化して同じになるプロンプトが処理中なら、後から来たリクエストは
+新たに Grounding / LLM 生成を走らせず、先行リクエストの結果を共有する。
+
+- Blocking: 先行リクエストの結果（Future）を待つ
+- Streaming: TokenBroadcast で生成中のトークンを配信する。途中参加者は
+  それまでにバッファされた分を受け取ってから、ライブのストリームに追従する
+- 共有している全リクエストが離脱したら生成を中止する（参照カウント）
+"""
+
+import asyncio
+import copy
+import re
+import unicodedata
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+from .metrics import metrics
+
+
+# ========== キー ==========
+
+# 末尾の句読点・記号は質問の同一性に影響しない
+_TRAILING_PUNCT = re.compile(r"[\s?？。!！、,.]+$")
+
+
+def flight_key(prompt: str, *variant) -> str:
+    """
+    single-flight のキー。NFKC 正規化・空白除去・末尾の句読点除去をしたプロンプトに
+    回答内容を変えるリクエスト属性（allow_template 等）を付ける。
+    """
+    text = unicodedata.normalize("NFKC", prompt or "")
+    text = _TRAILING_PUNCT.sub("", re.sub(r"\s+", "", text))
+    return "\t".join([text, *map(str, variant)])
+
+
+# ========== Flight ==========
+
+class Lease:
+    """Flight への参加。release() は何度呼んでもよい（冪等）"""
+
+    def __init__(self, flight: "Flight"):
+        self._flight = flight
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self._flight._leave()
+
+
+class Flight:
+    """処理中の 1 リクエスト分の結果と、それを待つ参加者の数"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.refs = 0
+        # 参加者が 0 になったときに呼ぶ（生成の中止）
+        self.on_abandon: Optional[Callable[[], None]] = None
+
+    def enter(self) -> Lease:
+        self.refs += 1
+        return Lease(self)
+
+    def _leave(self):
+        self.refs -= 1
+        if self.refs == 0 and self.on_abandon:
+            self.on_abandon()
+
+    def set_result(self, result):
+        if not self.future.done():
+            self.future.set_result(result)
+
+    def set_exception(self, exc: BaseException):
+        if not self.future.done():
+            self.future.set_exception(exc)
+            # 待っている参加者がいなくても「未取得の例外」警告を出さない
+            self.future.exception()
+
+    async def wait(self):
+        # 待つ側がキャンセルされても共有の Future は取り消さない
+        return await asyncio.shield(self.future)
+
+
+class SingleFlight:
+    """キー → 処理中の Flight"""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self._flights: Dict[str, Flight] = {}
+
+    def join(self, key: str) -> Tuple[Flight, Lease, bool]:
+        """
+        Returns:
+            (Flight, Lease, 先行リクエストか)
+        """
+        flight = self._flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = Flight(key)
+            self._flights[key] = flight
+        else:
+            metrics.inc("singleflight_coalesced_total", endpoint=self.endpoint)
+        metrics.set_gauge("singleflight_inflight", len(self._flights), endpoint=self.endpoint)
+        return flight, flight.enter(), leader
+
+    def forget(self, flight: Flight):
+        """以降の同一リクエストは新しく処理させる"""
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+        metrics.set_gauge("singleflight_inflight", len(self._flights), endpoint=self.endpoint)
+
+    async def lead(self, flight: Flight, fn: Callable[[], Awaitable]):
+        """
+        先行リクエストとして fn() を実行し、結果を待っている参加者に渡す。
+        失敗した場合は例外を参加者にも渡し、以降の同一リクエストは新しく処理させる。
+        """
+        try:
+            result = await fn()
+        except BaseException as e:
+            flight.set_exception(e)
+            self.forget(flight)
+            raise
+        flight.set_result(result)
+        return result
+
+    async def do(self, key: str, fn: Callable[[], Awaitable]) -> Tuple[object, bool]:
+        """
+        Blocking 用。先行リクエストは fn() を実行し、後続はその結果のコピーを受け取る。
+
+        Returns:
+            (結果, 共有された結果か)
+        """
+        flight, lease, leader = self.join(key)
+        try:
+            if not leader:
+                return copy.deepcopy(await flight.wait()), True
+            return await self.lead(flight, fn), False
+        finally:
+            if leader:
+                self.forget(flight)
+            lease.release()
+
+
+# ========== Streaming 配信 ==========
+
+class TokenBroadcast:
+    """
+    1 本のトークンストリームを複数の購読者に配る。
+
+    上流はバックグラウンドタスクで読み進め、チャンクはすべてバッファに残す。
+    購読者は先頭から読むので、途中参加でも全文を受け取れる。
+    """
+
+    def __init__(self, source: AsyncIterator[str], on_done: Optional[Callable[[], None]] = None):
+        self.chunks = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._source = source
+        self._on_done = on_done
+        self._changed = asyncio.Event()
+        self._task = asyncio.create_task(self._pump())
+        self._task.add_done_callback(self._finished)
+
+    async def _pump(self):
+        async for chunk in self._source:
+            self.chunks.append(chunk)
+            self._notify()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def _finished(self, task: asyncio.Task):
+        # タスクが一度も実行されずにキャンセルされた場合もここは必ず呼ばれる
+        self.done = True
+        if not task.cancelled() and task.exception() is not None:
+            self.error = task.exception()
+        self._notify()
+        if self._on_done:
+            self._on_done()
+
+    def cancel(self):
+        """上流の生成を中止する（購読者が全員離脱したとき）"""
+        if not self.done:
+            self._task.cancel()
+
+    async def stream(self) -> AsyncIterator[str]:
+        """バッファ済みのチャンクから順に返し、その後はライブで追従する"""
+        i = 0
+        while True:
+            while i < len(self.chunks):
+                yield self.chunks[i]
+                i += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
@@ -0,0 +1,122 @@
+"""
+Streaming 応答用ユーティリティ
+
+- イベントストリーム形式（NDJSON / SSE）のエンコード
+- トークンの時間・サイズウィンドウによる結合（coalescing）
+"""
+
+import asyncio
+import json
+import time
+from typing import AsyncIterator
+
+
+# ========== 設定 ==========
+
+class StreamConfig:
+    """Streaming 応答の設定"""
+
+    # "text" は従来互換（text/plain + X-References ヘッダー）
+    FORMATS = ("text", "ndjson", "sse")
+
+    MEDIA_TYPES = {
+        "text": "text/plain; charset=utf-8",
+        "ndjson": "application/x-ndjson; charset=utf-8",
+        "sse": "text/event-stream; charset=utf-8",
+    }
+
+    # トークン結合ウィンドウ（どちらかに達したら送信）
+    COALESCE_MS = 40
+    COALESCE_CHARS = 48
+
+
+# ========== イベントエンコード ==========
+
+def encode_event(event: str, data, fmt: str) -> str:
+    """
+    1イベントを文字列にエンコードする。
+
+    - ndjson: {"event": "...", "data": ...}\\n
+    - sse:    event: ...\\ndata: {...}\\n\\n
+
+    ヘッダーと違い UTF-8 のまま送れるので ensure_ascii=False を使う。
+    """
+    payload = json.dumps(data, ensure_ascii=False)
+    if fmt == "sse":
+        return f"event: {event}\ndata: {payload}\n\n"
+    return json.dumps({"event": event, "data": data}, ensure_ascii=False) + "\n"
+
+
+# ========== トークン結合 ==========
+
+async def coalesce_tokens(
+    tokens: AsyncIterator[str],
+    max_ms: float = StreamConfig.COALESCE_MS,
+    max_chars: int = StreamConfig.COALESCE_CHARS,
+) -> AsyncIterator[str]:
+    """
+    細かいトークンをまとめて送信回数を減らす。
+
+    最初のチャンクは TTFB を悪化させないよう即時に送り、
+    以降は max_ms 経過 または max_chars 到達でまとめて送る。
+    時間ウィンドウはタイマーで判定するので、上流が止まっていても溜めた分は max_ms で送る。
+    """
+    it = tokens.__aiter__()
+    buf = []
+    size = 0
+    window_start = None
+    first = True
+    pending = None
+
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(it.__anext__())
+            if buf:
+                remaining = max_ms / 1000 - (time.perf_counter() - window_start)
+                # タイムアウトしても次のトークン待ち（pending）は取り消さずに持ち越す
+                done, _ = await asyncio.wait({pending}, timeout=max(0.0, remaining))
+                if not done:
+                    yield "".join(buf)
+                    buf = []
+                    size = 0
+                    continue
+            else:
+                await asyncio.wait({pending})
+
+            task, pending = pending, None
+            try:
+                tok = task.result()
+            except StopAsyncIteration:
+                break
+            if not tok:
+                continue
+            if first:
+                first = False
+                yield tok
+                continue
+
+            if not buf:
+                window_start = time.perf_counter()
+            buf.append(tok)
+            size += len(tok)
+
+            elapsed_ms = (time.perf_counter() - window_start) * 1000
+            if size >= max_chars or elapsed_ms >= max_ms:
+                yield "".join(buf)
+                buf = []
+                size = 0
+
+        if buf:
+            yield "".join(buf)
+    finally:
+        if pending is not None:
+            pending.cancel()
+            try:
+                await pending
+            except (asyncio.CancelledError, StopAsyncIteration, Exception):
+                pass
+        # 途中で閉じられた場合も上流（Ollama ストリーム）を確実に閉じる
+        aclose = getattr(tokens, "aclose", None)
+        if aclose is not None:
+            await aclose()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+アドミッション制御（backend/admission.py）の単体テスト
+
+リポジトリのルートで実行する:
+    python -m pytest backend/test_admission.py
+"""
+
+import asyncio
+
+import pytest
+
+from backend.admission import (
+    AdmissionConfig,
+    AdmissionController,
+    QueueFullError,
+    QueueTimeoutError,
+    priority_for,
+)
+
+
+def test_priority_for_prompt_length():
+    """短いプロンプトほど先に通す"""
+    assert priority_for("短い質問") == AdmissionConfig.PRIORITY_SHORT
+    assert priority_for("あ" * AdmissionConfig.SHORT_PROMPT_CHARS) == AdmissionConfig.PRIORITY_NORMAL
+    assert AdmissionConfig.PRIORITY_SHORT < AdmissionConfig.PRIORITY_NORMAL
+
+
+def test_queue_admits_by_priority_then_arrival():
+    """空きが出たら優先度順、同じ優先度は到着順に枠を渡す"""
+
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=8, max_wait_sec=5)
+        holder = await controller.acquire()
+        order = []
+
+        async def waiter(name, priority):
+            slot = await controller.acquire(priority)
+            order.append(name)
+            slot.release()
+
+        tasks = []
+        for name, priority in [("normal-1", 1), ("short-1", 0), ("normal-2", 1), ("short-2", 0)]:
+            tasks.append(asyncio.create_task(waiter(name, priority)))
+            await asyncio.sleep(0)
+        assert controller.queue_depth == 4
+
+        holder.release()
+        await asyncio.gather(*tasks)
+        return order, controller
+
+    order, controller = asyncio.run(scenario())
+    assert order == ["short-1", "short-2", "normal-1", "normal-2"]
+    assert controller.active == 0
+    assert controller.queue_depth == 0
+
+
+def test_queue_full_raises_429_with_retry_after():
+    """待ち行列が満杯なら待たずに QueueFullError（429 + Retry-After）"""
+
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=1, max_wait_sec=5)
+        holder = await controller.acquire()
+        queued = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFullError) as info:
+            await controller.acquire()
+        holder.release()
+        (await queued).release()
+        return info.value
+
+    error = asyncio.run(scenario())
+    assert error.status_code == 429
+    assert isinstance(error.retry_after, int) and error.retry_after >= 1
+
+
+def test_queue_wait_timeout_raises_503_with_retry_after():
+    """max_wait_sec 以内に枠が空かなければ QueueTimeoutError（503 + Retry-After）"""
+
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=4, max_wait_sec=0.05)
+        holder = await controller.acquire()
+        with pytest.raises(QueueTimeoutError) as info:
+            await controller.acquire()
+        depth = controller.queue_depth
+        holder.release()
+        return info.value, depth, controller
+
+    error, depth, controller = asyncio.run(scenario())
+    assert error.status_code == 503
+    assert error.retry_after >= 1
+    # 諦めた待ち手は行列から外れている
+    assert depth == 0
+    assert controller.active == 0
+
+
+def test_slot_release_is_idempotent():
+    """release() を二重に呼んでも枠は 1 つしか返らない"""
+
+    async def scenario():
+        controller = AdmissionController(max_concurrency=2, max_queue=4, max_wait_sec=5)
+        first = await controller.acquire()
+        second = await controller.acquire()
+        first.release()
+        first.release()
+        active = controller.active
+        second.release()
+        return active, controller.active
+
+    active_after_double_release, active_after_all = asyncio.run(scenario())
+    assert active_after_double_release == 1
+    assert active_after_all == 0
+
+
+def test_release_hands_slot_to_waiter():
+    """待ち手がいれば解放した枠をそのまま譲る（同時実行数は上限を超えない）"""
+
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=4, max_wait_sec=5)
+        holder = await controller.acquire()
+        queued = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        holder.release()
+        slot = await queued
+        active = controller.active
+        slot.release()
+        return active, controller.active
+
+    active_while_handed_over, active_after = asyncio.run(scenario())
+    assert active_while_handed_over == 1
+    assert active_after == 0
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+single-flight（backend/singleflight.py）の単体テスト
+
+リポジトリのルートで実行する:
+    python -m pytest backend/test_singleflight.py
+"""
+
+import asyncio
+
+import pytest
+
+from backend.singleflight import SingleFlight, TokenBroadcast, flight_key
+
+
+class Source:
+    """テスト用の上流ストリーム。feed() したチャンクを順に返し、閉じられたかを記録する"""
+
+    def __init__(self):
+        self.queue = asyncio.Queue()
+        self.closed = False
+
+    def feed(self, *chunks):
+        for chunk in chunks:
+            self.queue.put_nowait(chunk)
+
+    async def stream(self):
+        try:
+            while True:
+                chunk = await self.queue.get()
+                if chunk is None:
+                    return
+                if isinstance(chunk, BaseException):
+                    raise chunk
+                yield chunk
+        finally:
+            self.closed = True
+
+
+async def settle():
+    """バックグラウンドタスクを数回進める"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def collect(stream) -> list:
+    return [chunk async for chunk in stream]
+
+
+def test_flight_key_normalization():
+    """NFKC・空白・末尾の句読点の違いは同じキー、リクエスト属性の違いは別キー"""
+    assert flight_key("粗大ごみの出し方？", True) == flight_key("粗大ごみの 出し方", True)
+    assert flight_key("ＰＣの捨て方", True) == flight_key("PCの捨て方。", True)
+    assert flight_key("粗大ごみの出し方", True) != flight_key("粗大ごみの出し方", False)
+
+
+def test_do_runs_once_and_shares_copies():
+    """同時の同一リクエストは fn を 1 回だけ実行し、後続は結果のコピーを受け取る"""
+
+    async def scenario():
+        flights = SingleFlight("test")
+        calls = []
+        release = asyncio.Event()
+
+        async def fn():
+            calls.append(1)
+            await release.wait()
+            return {"reply": "回答", "references": []}
+
+        leader = asyncio.create_task(flights.do("k", fn))
+        await settle()
+        follower = asyncio.create_task(flights.do("k", fn))
+        await settle()
+        release.set()
+        return calls, await leader, await follower, flights
+
+    calls, (leader_result, leader_shared), (follower_result, follower_shared), flights = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert (leader_shared, follower_shared) == (False, True)
+    assert follower_result == leader_result
+    assert follower_result is not leader_result
+    # 終わった flight は忘れる（次の同一リクエストは新しく処理する）
+    assert flights._flights == {}
+
+
+def test_leader_exception_reaches_waiters():
+    """先行リクエストの例外は待っている参加者にも届き、flight は忘れられる"""
+
+    async def scenario():
+        flights = SingleFlight("test")
+        release = asyncio.Event()
+
+        async def fn():
+            await release.wait()
+            raise ValueError("検索に失敗")
+
+        leader = asyncio.create_task(flights.do("k", fn))
+        await settle()
+        follower = asyncio.create_task(flights.do("k", fn))
+        await settle()
+        release.set()
+        results = await asyncio.gather(leader, follower, return_exceptions=True)
+        return results, flights
+
+    results, flights = asyncio.run(scenario())
+    assert all(isinstance(r, ValueError) for r in results)
+    assert flights._flights == {}
+
+
+def test_lead_exception_reaches_stream_joiner():
+    """Streaming の先行処理（lead）が失敗したら、途中参加者の wait() も同じ例外になる"""
+
+    async def scenario():
+        flights = SingleFlight("test")
+        flight, lease, leader = flights.join("k")
+        joined, joiner_lease, joiner_leader = flights.join("k")
+        assert leader and not joiner_leader and joined is flight
+
+        async def prepare():
+            await asyncio.sleep(0)
+            raise RuntimeError("準備に失敗")
+
+        waiter = asyncio.create_task(joined.wait())
+        with pytest.raises(RuntimeError):
+            await flights.lead(flight, prepare)
+        with pytest.raises(RuntimeError):
+            await waiter
+        lease.release()
+        joiner_lease.release()
+        # 次の同一リクエストは新しい先行リクエストになる
+        _, new_lease, new_leader = flights.join("k")
+        new_lease.release()
+        return new_leader
+
+    assert asyncio.run(scenario())
+
+
+def test_broadcast_replays_buffer_to_late_joiner():
+    """途中参加の購読者はバッファ済みのチャンクを受け取ってからライブに追従する"""
+
+    async def scenario():
+        source = Source()
+        done = []
+        broadcast = TokenBroadcast(source.stream(), on_done=lambda: done.append(1))
+
+        first = asyncio.create_task(collect(broadcast.stream()))
+        source.feed("ご", "み")
+        await settle()
+        assert broadcast.chunks == ["ご", "み"]
+
+        late = asyncio.create_task(collect(broadcast.stream()))
+        await settle()
+        source.feed("の", "出し方", None)
+        return await first, await late, done, broadcast
+
+    first, late, done, broadcast = asyncio.run(scenario())
+    assert first == ["ご", "み", "の", "出し方"]
+    assert late == first
+    assert broadcast.done and broadcast.error is None
+    assert done == [1]
+
+
+def test_broadcast_error_reaches_subscribers():
+    """上流の例外は全購読者に届く（途中参加者にも）"""
+
+    async def scenario():
+        source = Source()
+        broadcast = TokenBroadcast(source.stream())
+        first = asyncio.create_task(collect(broadcast.stream()))
+        source.feed("a")
+        await settle()
+        source.feed(ConnectionError("Ollama 切断"))
+        await settle()
+        late = asyncio.create_task(collect(broadcast.stream()))
+        return await asyncio.gather(first, late, return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(r, ConnectionError) for r in results)
+
+
+def test_last_lease_release_cancels_upstream():
+    """共有している全リクエストが離脱したときだけ上流の生成を中止する"""
+
+    async def scenario():
+        flights = SingleFlight("test")
+        source = Source()
+        done = []
+        flight, leader_lease, _ = flights.join("k")
+        broadcast = TokenBroadcast(source.stream(), on_done=lambda: done.append(1))
+        flight.on_abandon = broadcast.cancel
+        _, joiner_lease, _ = flights.join("k")
+
+        source.feed("a")
+        await settle()
+        leader_lease.release()
+        leader_lease.release()  # 二重解放は無視される
+        await settle()
+        still_running = not broadcast.done and not source.closed
+
+        joiner_lease.release()
+        await settle()
+        return still_running, broadcast, source, done
+
+    still_running, broadcast, source, done = asyncio.run(scenario())
+    assert still_running
+    assert broadcast.done
+    assert source.closed
+    assert done == [1]
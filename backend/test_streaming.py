@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Streaming 応答ユーティリティ（backend/streaming.py）の単体テスト
+
+リポジトリのルートで実行する:
+    python -m pytest backend/test_streaming.py
+"""
+
+import asyncio
+import json
+
+from backend.streaming import coalesce_tokens, encode_event
+
+
+class Source:
+    """テスト用の上流トークン列。feed() したトークンを順に返し、閉じられたかを記録する"""
+
+    def __init__(self):
+        self.queue = asyncio.Queue()
+        self.closed = False
+
+    def feed(self, *tokens):
+        for tok in tokens:
+            self.queue.put_nowait(tok)
+
+    async def stream(self):
+        try:
+            while True:
+                tok = await self.queue.get()
+                if tok is None:
+                    return
+                yield tok
+        finally:
+            self.closed = True
+
+
+async def receive(out: list, stream):
+    async for chunk in stream:
+        out.append(chunk)
+
+
+async def settle():
+    """バックグラウンドタスクを進める（時間ウィンドウよりずっと短い）"""
+    await asyncio.sleep(0.005)
+
+
+def test_first_token_is_sent_immediately():
+    """最初のトークンはウィンドウを待たずにそのまま送る"""
+
+    async def scenario():
+        source = Source()
+        out = []
+        task = asyncio.create_task(receive(out, coalesce_tokens(source.stream(), max_ms=1000, max_chars=100)))
+        source.feed("粗")
+        await settle()
+        first = list(out)
+        source.feed(None)
+        await task
+        return first
+
+    assert asyncio.run(scenario()) == ["粗"]
+
+
+def test_window_flushes_while_upstream_is_paused():
+    """上流が止まっていても、溜めた分は max_ms 経過で送る"""
+
+    async def scenario():
+        source = Source()
+        out = []
+        task = asyncio.create_task(receive(out, coalesce_tokens(source.stream(), max_ms=30, max_chars=100)))
+        source.feed("粗", "大", "ご")
+        await settle()
+        before = list(out)
+        await asyncio.sleep(0.1)
+        after_pause = list(out)
+        source.feed("み", None)
+        await task
+        return before, after_pause, out, source
+
+    before, after_pause, out, source = asyncio.run(scenario())
+    assert before == ["粗"]
+    assert after_pause == ["粗", "大ご"]
+    assert out == ["粗", "大ご", "み"]
+    assert source.closed
+
+
+def test_size_flush():
+    """max_chars に達したら時間ウィンドウを待たずに送る"""
+
+    async def scenario():
+        source = Source()
+        out = []
+        task = asyncio.create_task(receive(out, coalesce_tokens(source.stream(), max_ms=10_000, max_chars=4)))
+        source.feed("a", "bc", "de", "f")
+        await settle()
+        flushed = list(out)
+        source.feed(None)
+        await task
+        return flushed, out
+
+    flushed, out = asyncio.run(scenario())
+    assert flushed == ["a", "bcde"]
+    assert out == ["a", "bcde", "f"]
+
+
+def test_end_of_stream_flushes_remainder():
+    """上流が終わったら残りをまとめて送り、空トークンは捨てる"""
+
+    async def scenario():
+        source = Source()
+        out = []
+        source.feed("ご", "み", "", "の", None)
+        await receive(out, coalesce_tokens(source.stream(), max_ms=10_000, max_chars=100))
+        return out
+
+    out = asyncio.run(scenario())
+    assert out == ["ご", "みの"]
+
+
+def test_closing_early_closes_upstream():
+    """受け手が途中でやめても上流のストリームを閉じる"""
+
+    async def scenario():
+        source = Source()
+        source.feed("a", "b")
+        stream = coalesce_tokens(source.stream(), max_ms=10_000, max_chars=100)
+        first = await stream.__anext__()
+        await stream.aclose()
+        return first, source
+
+    first, source = asyncio.run(scenario())
+    assert first == "a"
+    assert source.closed
+
+
+def test_encode_event_formats():
+    """NDJSON は 1 行の JSON、SSE は event / data 行。日本語はエスケープしない"""
+    line = encode_event("token", {"text": "ごみ"}, "ndjson")
+    assert line.endswith("\n") and json.loads(line) == {"event": "token", "data": {"text": "ごみ"}}
+    assert encode_event("done", {"chars": 2}, "sse") == 'event: done\ndata: {"chars": 2}\n\n'
+    assert "ごみ" in encode_event("token", {"text": "ごみ"}, "sse")
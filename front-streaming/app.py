@@ -1,25 +1,60 @@
 # app.py
 import sys
 import time
-import os
 import streamlit as st
 from typing import Optional
 import requests
+from requests.adapters import HTTPAdapter
 import json
 from pathlib import Path
 
-from gpu_stats import init_nvml_once, shutdown_nvml, get_gpu_stats
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from rag.user_knowledge import add_file_to_chroma
+from gpu_stats import shutdown_nvml, get_sampler
 
 st.set_page_config(page_title="Llama Chat (Streaming+Metrics)", page_icon="⏱️")
 
 LOG_FILE = Path("backend/logs.jsonl")
+API_BASE = "http://localhost:8000"
+# Streaming 表示の更新間隔（秒）。チャンクごとに全文を再描画せず、この間隔でまとめて描画する
+RENDER_INTERVAL_SEC = 0.1
 KNOWLEDGE_DIR = Path("knowledge_files")
 KNOWLEDGE_DIR.mkdir(exist_ok=True)
 
-# ---- NVML 初期化 ----
-init_nvml_once()
+# ---- リソース監視（バックグラウンドで計測。再実行ごとにはキャッシュを読むだけ） ----
+@st.cache_resource
+def resource_sampler():
+    return get_sampler()
+
+
+def render_resource_monitor(vram_box, util_box, host_box, chart_box):
+    """サンプラの最新値と直近の履歴をサイドバーに表示する"""
+    sampler = resource_sampler()
+    snap = sampler.snapshot()
+    if not snap:
+        vram_box.metric("VRAM (GB)", "N/A")
+        util_box.caption("計測中…")
+        return
+    gpus = snap["gpus"]
+    if gpus:
+        used = sum(g["used_gb"] for g in gpus)
+        total = sum(g["total_gb"] for g in gpus)
+        vram_box.metric("VRAM (GB)", f"{used:.2f}/{total:.2f}")
+        util_box.caption(" / ".join(f"[{g['index']}] {g['name']} | Util {g['util_percent']}%" for g in gpus))
+    else:
+        vram_box.metric("VRAM (GB)", "N/A")
+        util_box.caption("GPU not detected")
+    cpu = snap.get("cpu_percent")
+    host_box.caption(
+        f"CPU {cpu if cpu is not None else '-'}% | "
+        f"RAM {snap.get('mem_used_gb') or '-'}/{snap.get('mem_total_gb') or '-'} GB | "
+        f"RSS {snap.get('rss_mb') or '-'} MB"
+    )
+    history = sampler.history(limit=60)
+    if len(history) > 1:
+        rows = {"CPU %": [h.get("cpu_percent") for h in history]}
+        if gpus:
+            rows["GPU %"] = [max((g["util_percent"] for g in h["gpus"]), default=None) for h in history]
+        chart_box.line_chart(rows, height=120)
+
 
 
 # test_file = Path("knowledge_files/IIAI_AAI_2025_paper_0381 (3).pdf")
@@ -29,6 +64,31 @@ init_nvml_once()
 #     pass
 
 
+# ---- ナレッジ登録（重い依存は最初のアップロード時に読み込む） ----
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+
+@st.cache_resource(show_spinner="ナレッジ登録の準備中…")
+def knowledge_loader():
+    """rag.user_knowledge（pandas / chromadb / PyPDF2 / langchain）を初回だけ import する"""
+    # rag/ 内のモジュールは互いをトップレベル名で import するので rag/ もパスに入れる
+    for path in (ROOT_DIR, ROOT_DIR / "rag"):
+        if str(path) not in sys.path:
+            sys.path.append(str(path))
+    from rag.user_knowledge import add_file_to_chroma
+    return add_file_to_chroma
+
+
+# ---- HTTP セッション（接続をプールしてメッセージごとの TCP 接続を避ける） ----
+@st.cache_resource
+def http_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=8)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
 def save_log(user_input: str, assistant_output: str, mode: str, total_sec: float):
     log = {
         "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
@@ -40,6 +100,13 @@ def save_log(user_input: str, assistant_output: str, mode: str, total_sec: float
     with open(LOG_FILE, "a", encoding="utf-8") as f:
         f.write(json.dumps(log, ensure_ascii=False) + "\n")
 
+def busy_message(res) -> Optional[str]:
+    """バックエンドが混雑で断った場合（429/503）のメッセージ"""
+    if res.status_code in (429, 503):
+        retry = res.headers.get("Retry-After", "?")
+        return f"⚠️ ただいま混雑しています。{retry} 秒ほど待ってから再度お試しください。"
+    return None
+
 def load_logs(limit: int = 20):
     if not LOG_FILE.exists():
         return []
@@ -73,31 +140,29 @@ with st.sidebar:
     st.subheader("GPU / VRAM Monitor")
     vram_box = st.empty()
     util_box = st.empty()
-
-    stats = get_gpu_stats()
-    if stats:
-        used_gb, total_gb, util_p, name = stats
-        vram_box.metric("VRAM (GB)", f"{used_gb:.2f}/{total_gb:.2f}")
-        util_box.caption(f"{name} | Util {util_p}%")
-    else:
-        vram_box.metric("VRAM (GB)", "N/A")
-        util_box.caption("GPU not detected")
+    host_box = st.empty()
+    chart_box = st.empty()
+    render_resource_monitor(vram_box, util_box, host_box, chart_box)
 
     # 応答モード選択
     mode = st.radio("応答モードを選択", ["Blocking", "Streaming"], horizontal=True, key="response_mode")
+    allow_template = st.checkbox("高置信度の品名は LLM を使わず即答", value=True, key="allow_template")
 
     # ===== ナレッジファイル管理 =====
     st.subheader("ナレッジファイル管理")
 
     upload_file = st.file_uploader("ファイルをアップロード", type=["txt", "pdf", "csv", "json"])
-    if upload_file is not None:
+    # file_uploader は再実行のたびに同じファイルを返すので、登録済みなら何もしない
+    registered = st.session_state.setdefault("registered_files", set())
+    if upload_file is not None and (upload_file.name, upload_file.size) not in registered:
         save_path = KNOWLEDGE_DIR / upload_file.name
         with open(save_path, "wb") as f:
             f.write(upload_file.getbuffer())
         st.success(f"アップロードしました: {upload_file.name}")
 
         # ChromaDB に登録
-        add_file_to_chroma(save_path)
+        knowledge_loader()(save_path)
+        registered.add((upload_file.name, upload_file.size))
 
     # アップロード済みファイル一覧
     files = list(KNOWLEDGE_DIR.glob("*"))
@@ -125,6 +190,30 @@ if user_input:
     total_area  = col2.empty()
     tokps_area  = col3.empty()
     outtok_area = col4.empty()
+    stats_caption = st.empty()
+
+    def show_eval_metrics(perf: dict):
+        """サーバが返した Ollama の評価カウンタ（eval_count 等）を表示"""
+        tok_s = perf.get("tokens_per_sec")
+        out_tok = perf.get("output_tokens")
+        tokps_area.metric("Tokens/sec", tok_s if tok_s is not None else "-")
+        outtok_area.metric("Output tokens", out_tok if out_tok is not None else "-")
+
+    def show_client_rate(ttfb, last_token, token_events, text, perf: dict):
+        """
+        クライアントで観測した生成速度（最初と最後の token イベントの間隔）。
+        サーバはトークンを結合して送るので、トークン数はサーバの output_tokens を使い、
+        無ければ文字数/秒で表示する。
+        """
+        if ttfb is None or last_token is None or last_token <= ttfb:
+            return
+        span = last_token - ttfb
+        out_tok = perf.get("output_tokens")
+        if out_tok:
+            rate = f"client {out_tok / span:.1f} tok/s"
+        else:
+            rate = f"client {len(text) / span:.1f} chars/s"
+        stats_caption.caption(f"{rate} | {token_events} events in {span:.2f}s")
 
     with st.chat_message("assistant"):
         placeholder = st.empty()
@@ -134,12 +223,17 @@ if user_input:
 
         if mode == "Blocking":
             try:
-                api_url = "http://localhost:8000/api/bot/respond"
-                res = requests.post(api_url, json={"prompt": user_input}, timeout=300)  # 临时增加到300秒
-                res.raise_for_status()
-                data = res.json()
-                reply = data.get("reply", "")
-                references = data.get("references", [])
+                api_url = f"{API_BASE}/api/bot/respond"
+                # サーバ側の生成期限（LLM_DEADLINE_SEC=120s）＋余裕
+                res = http_session().post(api_url, json={"prompt": user_input, "allow_template": allow_template}, timeout=150)
+                busy = busy_message(res)
+                if busy:
+                    reply, references = busy, []
+                else:
+                    res.raise_for_status()
+                    data = res.json()
+                    reply = data.get("reply", "")
+                    references = data.get("references", [])
             except Exception as e:
                 reply = "APIリクエストでエラー: " + str(e)
                 references = []
@@ -148,16 +242,17 @@ if user_input:
             total_sec = t_end - t_start
             ttfb_area.metric("TTFB (s)", round(total_sec, 3))
             total_area.metric("Total (s)", round(total_sec, 3))
-            tokps_area.metric("Tokens/sec", "-")
-            outtok_area.metric("Output tokens", "-")
+            perf = next((r for r in references if r.get("type") == "performance"), {})
+            show_eval_metrics(perf)
 
             collected = reply
             placeholder.markdown(collected)
 
             # 📑 参考情報を表示
-            if references:
+            doc_refs = [r for r in references if "type" not in r]
+            if doc_refs:
                 st.markdown("### 📑 参考情報（上位チャンク）")
-                for ref in references:
+                for ref in doc_refs:
                     file = ref.get("file", "?")
                     page = ref.get("page", "?")
                     # chunk, chunk_id, id など候補キーを探す
@@ -171,48 +266,78 @@ if user_input:
 
         else:
             try:
-                api_url = "http://localhost:8000/api/bot/respond_stream"
-                with requests.post(api_url, json={"prompt": user_input}, stream=True, timeout=60) as res:
+                api_url = f"{API_BASE}/api/bot/respond_stream"
+                payload = {"prompt": user_input, "stream_format": "ndjson", "allow_template": allow_template}
+                with http_session().post(api_url, json=payload, stream=True, timeout=60) as res:
+                    busy = busy_message(res)
+                    if busy:
+                        raise RuntimeError(busy)
                     res.raise_for_status()
                     ttfb = None
-                    collected = ""
-                    for chunk in res.iter_content(chunk_size=None):
-                        if not chunk:
+                    last_token = None
+                    token_events = 0
+                    parts = []
+                    references = []
+                    server_metrics = {}
+                    rendered_at = 0.0
+                    dirty = False
+                    # 1行 = 1イベント（references / token / metrics / done / error）
+                    for line in res.iter_lines(decode_unicode=False):
+                        if not line:
                             continue
-                        if ttfb is None:
-                            ttfb = time.perf_counter()
-                            ttfb_area.metric("TTFB (s)", round(ttfb - t_start, 3))
-                        text = chunk.decode("utf-8")
-                        collected += text
-                        placeholder.markdown(collected)
+                        try:
+                            ev = json.loads(line.decode("utf-8"))
+                        except Exception:
+                            continue
+                        kind = ev.get("event")
+                        data = ev.get("data")
+
+                        if kind == "references":
+                            # 生成前・生成後のどちらでも届く可能性がある
+                            references.extend(data or [])
+                        elif kind == "token":
+                            last_token = time.perf_counter()
+                            if ttfb is None:
+                                ttfb = last_token
+                                ttfb_area.metric("TTFB (s)", round(ttfb - t_start, 3))
+                            token_events += 1
+                            parts.append(data.get("text", ""))
+                            dirty = True
+                        elif kind == "metrics":
+                            server_metrics = data or {}
+                        elif kind == "error":
+                            parts.append("\n\n⚠️ " + str((data or {}).get("message", "")))
+                            dirty = True
+                        elif kind == "done":
+                            break
+
+                        # 描画は RENDER_INTERVAL_SEC ごとにまとめる（最初のトークンは即時）
+                        now = time.perf_counter()
+                        if dirty and (now - rendered_at >= RENDER_INTERVAL_SEC or token_events == 1):
+                            placeholder.markdown("".join(parts) + "▌")
+                            rendered_at = now
+                            dirty = False
+
+                    collected = "".join(parts)
+                    placeholder.markdown(collected)
 
                     t_end = time.perf_counter()
                     total_sec = t_end - t_start
                     total_area.metric("Total (s)", round(total_sec, 3))
-                    tokps_area.metric("Tokens/sec", "-")
-                    outtok_area.metric("Output tokens", "-")
-
-                    # 📑 Streaming の場合はヘッダーから references を取得
-                    references = []
-                    if "X-References" in res.headers:
-                        try:
-                            references = json.loads(res.headers["X-References"])
-                        except Exception:
-                            references = []
+                    show_eval_metrics(server_metrics)
+                    show_client_rate(ttfb, last_token, token_events, collected, server_metrics)
 
-                    if references:
+                    # 📑 ナレッジ由来の参考情報のみ表示（performance 等は除外）
+                    doc_refs = [r for r in references if isinstance(r, dict) and "type" not in r]
+                    if doc_refs:
                         st.markdown("#### 📑 参考情報")
-                        for ref in references:
+                        for ref in doc_refs:
                             st.markdown(
                                 f"- **{ref.get('file','?')} p.{ref.get('page','?')} (chunk {ref.get('chunk','?')})**\n"
                                 f"  \n> {ref.get('text','')[:200]}..."
                             )
 
-                    s1 = get_gpu_stats()
-                    if s1:
-                        used_gb, total_gb, util_p, name = s1
-                        vram_box.metric("VRAM (GB)", f"{used_gb:.2f}/{total_gb:.2f}")
-                        util_box.caption(f"{name} | Util {util_p}%")
+                    render_resource_monitor(vram_box, util_box, host_box, chart_box)
             except Exception as e:
                 collected = "APIリクエストでエラー: " + str(e)
                 placeholder.markdown(collected)
@@ -1,8 +1,17 @@
 # front-streaminng/gpu_stats.py
 from __future__ import annotations
+import os
 import shutil
 import subprocess
-from typing import Optional, Tuple
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, List, Optional, Tuple
+
+# サンプリング間隔（秒）と保持する履歴数（既定: 2秒 × 150 = 5分）
+SAMPLE_INTERVAL_SEC = float(os.getenv("RESOURCE_SAMPLE_INTERVAL_SEC", "2.0"))
+HISTORY_SIZE = int(os.getenv("RESOURCE_HISTORY_SIZE", "150"))
 
 # ---- NVIDIA NVML を使えるなら最優先で使う（高速・正確） ----
 _NVML_AVAILABLE = False
@@ -16,6 +25,14 @@ try:
 except Exception:
     _NVML_AVAILABLE = False
 
+# ---- psutil があればホスト情報に使う（無ければ /proc を読む） ----
+_PSUTIL_AVAILABLE = False
+try:
+    import psutil
+    _PSUTIL_AVAILABLE = True
+except Exception:
+    _PSUTIL_AVAILABLE = False
+
 
 def init_nvml_once() -> bool:
     """NVMLが利用可能なら初期化して True を返す。非対応/失敗時は False。"""
@@ -41,71 +58,239 @@ def shutdown_nvml() -> None:
 
 
 # ---------- 実装詳細：各ベンダ/手段ごとの取得 ----------
-def _nvml_get() -> Optional[Tuple[float, float, int, str]]:
-    """NVMLで (used_GB, total_GB, util_percent, gpu_name) を返す。"""
+# いずれも全デバイス分の list[GpuSample] を返す（取得不可なら None）
+
+@dataclass
+class GpuSample:
+    index: int
+    name: str
+    used_gb: float
+    total_gb: float
+    util_percent: int
+
+    def as_tuple(self) -> Tuple[float, float, int, str]:
+        return self.used_gb, self.total_gb, self.util_percent, self.name
+
+
+def _nvml_get() -> Optional[List[GpuSample]]:
+    """NVMLで全GPUの使用量を返す。"""
     if not _NVML_AVAILABLE:
         return None
     try:
-        count = nvmlDeviceGetCount()
-        if count == 0:
-            return None
-        h = nvmlDeviceGetHandleByIndex(0)  # 複数GPUならループで集計も可
-        mem = nvmlDeviceGetMemoryInfo(h)
-        util = nvmlDeviceGetUtilizationRates(h)
-        name = nvmlDeviceGetName(h)
-        name = name.decode() if isinstance(name, bytes) else str(name)
-        used_gb = mem.used / (1024 ** 3)
-        total_gb = mem.total / (1024 ** 3)
-        gpu_util = int(util.gpu)
-        return used_gb, total_gb, gpu_util, name
+        samples = []
+        for i in range(nvmlDeviceGetCount()):
+            h = nvmlDeviceGetHandleByIndex(i)
+            mem = nvmlDeviceGetMemoryInfo(h)
+            util = nvmlDeviceGetUtilizationRates(h)
+            name = nvmlDeviceGetName(h)
+            name = name.decode() if isinstance(name, bytes) else str(name)
+            samples.append(GpuSample(i, name, mem.used / (1024 ** 3), mem.total / (1024 ** 3), int(util.gpu)))
+        return samples or None
     except Exception:
         return None
 
 
-def _nvsmi_get() -> Optional[Tuple[float, float, int, str]]:
-    """nvidia-smi（CLI）で (used_GB, total_GB, util_percent, gpu_name) を返す。"""
+def _nvsmi_get() -> Optional[List[GpuSample]]:
+    """nvidia-smi（CLI）で全GPUの使用量を返す。"""
     if not shutil.which("nvidia-smi"):
         return None
     try:
         out = subprocess.check_output(
             [
                 "nvidia-smi",
-                "--query-gpu=memory.used,memory.total,utilization.gpu,name",
+                "--query-gpu=index,memory.used,memory.total,utilization.gpu,name",
                 "--format=csv,noheader,nounits",
             ],
             text=True,
-        ).strip().splitlines()[0]
-        used_mb, total_mb, util_p, name = [x.strip() for x in out.split(",")]
-        return float(used_mb) / 1024.0, float(total_mb) / 1024.0, int(util_p), name
+            timeout=5,
+        ).strip().splitlines()
+        samples = []
+        for line in out:
+            idx, used_mb, total_mb, util_p, name = [x.strip() for x in line.split(",", 4)]
+            samples.append(GpuSample(int(idx), name, float(used_mb) / 1024.0, float(total_mb) / 1024.0, int(util_p)))
+        return samples or None
     except Exception:
         return None
 
 
-def _rocm_get() -> Optional[Tuple[float, float, int, str]]:
-    """rocm-smi（CLI）で (used_GB, total_GB, util_percent, gpu_name) を返す。AMD向け。"""
+def _rocm_get() -> Optional[List[GpuSample]]:
+    """rocm-smi（CLI）で全GPUの使用量を返す。AMD向け。メモリと使用率を1回の呼び出しで取る。"""
     if not shutil.which("rocm-smi"):
         return None
     try:
         import json
-        mem_out = subprocess.check_output(["rocm-smi", "--showmemuse", "--json"], text=True)
-        util_out = subprocess.check_output(["rocm-smi", "--showuse", "--json"], text=True)
-        mem = json.loads(mem_out)
-        util = json.loads(util_out)
-        gpu = next(iter(mem))  # 単一GPU想定（必要に応じて拡張）
-        used_mib = mem[gpu]["VRAM Used (MiB)"]
-        total_mib = mem[gpu]["VRAM Total (MiB)"]
-        util_p = util[gpu]["GPU use (%)"]
-        name = gpu
-        return float(used_mib) / 1024.0, float(total_mib) / 1024.0, int(util_p), name
+        out = subprocess.check_output(
+            ["rocm-smi", "--showmeminfo", "vram", "--showuse", "--json"], text=True, timeout=5
+        )
+        data = json.loads(out)
+        samples = []
+        for i, (gpu, info) in enumerate(sorted(data.items())):
+            if not gpu.startswith("card"):
+                continue
+            used_b = float(info["VRAM Total Used Memory (B)"])
+            total_b = float(info["VRAM Total Memory (B)"])
+            samples.append(GpuSample(i, gpu, used_b / (1024 ** 3), total_b / (1024 ** 3), int(float(info["GPU use (%)"]))))
+        return samples or None
     except Exception:
         return None
 
 
+def read_gpu_devices() -> Optional[List[GpuSample]]:
+    """利用可能な方法で全GPUを1回読む（CLIの場合はサブプロセスを起動するので sampler から呼ぶ）。"""
+    return _nvml_get() or _nvsmi_get() or _rocm_get()
+
+
+# ---------- ホスト（CPU / メモリ） ----------
+# GPU が無いマシンでも監視が役に立つよう、CPU使用率とこのプロセスの RSS も取る
+
+def _read_proc_cpu() -> Optional[Tuple[int, int]]:
+    """/proc/stat から (busy, total) の jiffies を返す（Linux）。"""
+    try:
+        with open("/proc/stat", encoding="ascii") as f:
+            fields = [int(x) for x in f.readline().split()[1:]]
+        idle = fields[3] + (fields[4] if len(fields) > 4 else 0)
+        total = sum(fields)
+        return total - idle, total
+    except Exception:
+        return None
+
+
+def _read_rss_mb() -> Optional[float]:
+    """このプロセスの常駐メモリ（MB）。"""
+    if _PSUTIL_AVAILABLE:
+        return psutil.Process().memory_info().rss / (1024 ** 2)
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except Exception:
+        pass
+    return None
+
+
+def _read_host_mem() -> Optional[Tuple[float, float]]:
+    """ホスト全体の (used_GB, total_GB)。"""
+    if _PSUTIL_AVAILABLE:
+        vm = psutil.virtual_memory()
+        return (vm.total - vm.available) / (1024 ** 3), vm.total / (1024 ** 3)
+    try:
+        info = {}
+        with open("/proc/meminfo", encoding="ascii") as f:
+            for line in f:
+                key, value = line.split(":", 1)
+                info[key] = int(value.split()[0])
+        total = info["MemTotal"]
+        return (total - info.get("MemAvailable", info.get("MemFree", 0))) / (1024 ** 2), total / (1024 ** 2)
+    except Exception:
+        return None
+
+
+# ---------- バックグラウンドサンプラ ----------
+
+class ResourceSampler:
+    """
+    一定間隔で GPU（全デバイス）とホストの CPU / メモリを読み、リングバッファに貯める。
+
+    UI やバックエンドは snapshot() / history() でキャッシュを読むだけなので、
+    ユーザ操作の最中に nvidia-smi / rocm-smi のサブプロセスが起動することはない。
+    """
+
+    def __init__(self, interval_sec: float = SAMPLE_INTERVAL_SEC, history_size: int = HISTORY_SIZE):
+        self.interval_sec = interval_sec
+        self._buffer: Deque[dict] = deque(maxlen=history_size)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._prev_cpu: Optional[Tuple[int, int]] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "ResourceSampler":
+        if self._thread is None or not self._thread.is_alive():
+            init_nvml_once()
+            if _PSUTIL_AVAILABLE:
+                psutil.cpu_percent(None)  # 初回呼び出しは基準点の設定
+            self._thread = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            started = time.monotonic()
+            sample = self.sample_once()
+            with self._lock:
+                self._buffer.append(sample)
+            self._stop.wait(max(0.0, self.interval_sec - (time.monotonic() - started)))
+
+    def _cpu_percent(self) -> Optional[float]:
+        if _PSUTIL_AVAILABLE:
+            return psutil.cpu_percent(None)
+        cur = _read_proc_cpu()
+        prev, self._prev_cpu = self._prev_cpu, cur
+        if not cur or not prev or cur[1] == prev[1]:
+            return None
+        return round(100.0 * (cur[0] - prev[0]) / (cur[1] - prev[1]), 1)
+
+    def sample_once(self) -> dict:
+        """1回分の計測（サンプラスレッドから呼ぶ）。"""
+        devices = read_gpu_devices() or []
+        host_mem = _read_host_mem()
+        rss = _read_rss_mb()
+        return {
+            "ts": time.time(),
+            "gpus": [
+                {
+                    "index": d.index,
+                    "name": d.name,
+                    "used_gb": round(d.used_gb, 3),
+                    "total_gb": round(d.total_gb, 3),
+                    "util_percent": d.util_percent,
+                }
+                for d in devices
+            ],
+            "cpu_percent": self._cpu_percent(),
+            "mem_used_gb": round(host_mem[0], 3) if host_mem else None,
+            "mem_total_gb": round(host_mem[1], 3) if host_mem else None,
+            "rss_mb": round(rss, 1) if rss is not None else None,
+        }
+
+    def snapshot(self) -> Optional[dict]:
+        """最新の計測（まだ無ければ None）。"""
+        with self._lock:
+            return dict(self._buffer[-1]) if self._buffer else None
+
+    def history(self, limit: Optional[int] = None) -> List[dict]:
+        """古い順の計測列（limit 件まで）。"""
+        with self._lock:
+            items = list(self._buffer)
+        return items[-limit:] if limit else items
+
+
+_sampler: Optional[ResourceSampler] = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler() -> ResourceSampler:
+    """プロセス共通のサンプラ（初回呼び出しでスレッドを起動）。"""
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = ResourceSampler().start()
+    return _sampler
+
+
 # ---------- 公開関数 ----------
 def get_gpu_stats() -> Optional[Tuple[float, float, int, str]]:
     """
-    利用可能な方法で VRAM を取得して返す。
+    サンプラの最新値から GPU 0 の VRAM を返す（サブプロセスは起動しない）。
     返り値: (used_GB, total_GB, util_percent, gpu_name)
-    取得不可なら None。
+    取得不可、またはまだ計測前なら None。
+    全デバイス・ホスト情報は get_sampler().snapshot() を使う。
     """
-    return _nvml_get() or _nvsmi_get() or _rocm_get()
\ No newline at end of file
+    snap = get_sampler().snapshot()
+    if not snap or not snap["gpus"]:
+        return None
+    g = snap["gpus"][0]
+    return g["used_gb"], g["total_gb"], g["util_percent"], g["name"]
@@ -0,0 +1,140 @@
+# front-streaming/import_report.py
+"""
+フロントエンド起動時の import 時間レポート（python -X importtime の集計）
+
+- cold start: 新しいインタプリタで各シナリオの import を実行したときの壁時計時間と内訳
+- rerun: 同じインタプリタで import 文を再実行したときのコスト（Streamlit の再実行に相当）
+
+シナリオ:
+    before  … 旧 app.py のトップレベル import（rag.user_knowledge を含む）
+    after   … 現在の app.py のトップレベル import
+    upload  … 初回アップロード時に knowledge_loader() が読み込む分
+
+使い方:
+    python import_report.py                 # 3シナリオを比較
+    python import_report.py --repeat 5 --top 15 --out import_report.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+HERE = Path(__file__).resolve().parent
+
+# 現在の app.py がトップレベルで import するもの
+AFTER_IMPORTS = [
+    "streamlit",
+    "requests",
+    "requests.adapters",
+    "gpu_stats",
+]
+SCENARIOS = {
+    "before": AFTER_IMPORTS + ["rag.user_knowledge_eager"],
+    "after": AFTER_IMPORTS,
+    "upload": ["rag.user_knowledge_eager"],
+}
+# 旧 user_knowledge はモジュール読み込み時に以下を import していた
+EAGER_KNOWLEDGE = ["pandas", "chromadb", "PyPDF2", "langchain.text_splitter", "rag.embedding"]
+
+# -X importtime の行: "import time: self [us] | cumulative | imported package"
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def _statements(modules: list[str]) -> str:
+    lines = [f"import sys; sys.path[:0] = [{str(HERE)!r}, {str(ROOT_DIR)!r}, {str(ROOT_DIR / 'rag')!r}]"]
+    for mod in modules:
+        targets = EAGER_KNOWLEDGE if mod == "rag.user_knowledge_eager" else [mod]
+        lines += [f"import {t}" for t in targets]
+    return "\n".join(lines)
+
+
+def measure_cold(modules: list[str]) -> dict:
+    """新しいインタプリタで import し、壁時計時間と -X importtime の内訳を返す"""
+    code = _statements(modules)
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, cwd=HERE
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    if proc.returncode != 0:
+        err = proc.stderr.strip().splitlines()
+        return {"error": err[-1] if err else f"exit {proc.returncode}"}
+
+    # トップレベルパッケージ別の累積時間（インデントが最も浅い行 = 直接 import されたもの）
+    packages = defaultdict(float)
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if not m:
+            continue
+        self_us, cum_us, indent, name = int(m.group(1)), int(m.group(2)), len(m.group(3)), m.group(4)
+        if indent <= 1:
+            packages[name.split(".")[0]] += cum_us / 1000
+            total_us += cum_us
+    return {
+        "wall_ms": round(wall_ms, 1),
+        "import_ms": round(total_us / 1000, 1),
+        "packages": {k: round(v, 1) for k, v in sorted(packages.items(), key=lambda x: -x[1])},
+    }
+
+
+def measure_rerun(modules: list[str], runs: int = 200) -> dict:
+    """import 済みのインタプリタで import 文を再実行したときのコスト（µs）"""
+    code = _statements(modules)
+    script = (
+        f"import time\ncode = compile({code!r}, '<rerun>', 'exec')\nexec(code, {{}})\n"
+        f"t = time.perf_counter()\nfor _ in range({runs}): exec(code, {{}})\n"
+        f"print((time.perf_counter() - t) / {runs} * 1e6)"
+    )
+    proc = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, cwd=HERE)
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1]}
+    return {"rerun_us": round(float(proc.stdout.strip()), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="フロントエンドの import 時間レポート")
+    parser.add_argument("--repeat", type=int, default=3, help="cold start の計測回数（中央値を採用）")
+    parser.add_argument("--top", type=int, default=10, help="表示するパッケージ数")
+    parser.add_argument("--out", default="import_report.json", help="結果の保存先")
+    args = parser.parse_args()
+
+    report = {}
+    for name, modules in SCENARIOS.items():
+        runs = [measure_cold(modules) for _ in range(args.repeat)]
+        ok = [r for r in runs if "error" not in r]
+        if not ok:
+            report[name] = runs[0]
+            print(f"\n== {name}: ⚠️ {runs[0]['error']}")
+            continue
+        best = min(ok, key=lambda r: r["wall_ms"])
+        report[name] = {
+            "wall_ms_median": round(statistics.median(r["wall_ms"] for r in ok), 1),
+            "import_ms_median": round(statistics.median(r["import_ms"] for r in ok), 1),
+            "packages": best["packages"],
+            **measure_rerun(modules),
+        }
+        r = report[name]
+        print(f"\n== {name}: cold start {r['wall_ms_median']}ms (import {r['import_ms_median']}ms), "
+              f"rerun {r.get('rerun_us', '-')}µs")
+        for pkg, ms in list(r["packages"].items())[:args.top]:
+            print(f"   {pkg:<28} {ms:>9.1f} ms")
+
+    if "wall_ms_median" in report.get("before", {}) and "wall_ms_median" in report.get("after", {}):
+        saved = report["before"]["wall_ms_median"] - report["after"]["wall_ms_median"]
+        print(f"\n📊 起動時の短縮: {saved:.1f}ms（アップロード時に初回のみ upload 分を支払う）")
+
+    Path(args.out).write_text(json.dumps(report, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    print(f"✅ 保存: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
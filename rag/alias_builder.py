@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+别名表离线构建工具
+从 backend/logs.jsonl 的用户输入和基准测试用例中挖掘口语表达（ノートPC、スマホ、レンジ等），
+离线批量执行一次LLM短语提取，并用路径A映射到品名，生成 alias → 品名 的候选表。
+
+另外，种子文件（alias_seeds.txt，每行一个口语说法）中的短语不经过LLM提取，
+直接用路径A映射到品名，同样作为 pending 候选合并（出现次数为包含该短语的输入数）。
+
+新候选的状态为 pending，人工确认（--review）后变为 reviewed，
+hybrid_grounding 只加载 reviewed 的条目。已有的 reviewed / rejected 条目不会被覆盖。
+
+使用方法:
+    python alias_builder.py                    # 挖掘并合并到 aliases.json
+    python alias_builder.py --min-count 2      # 只保留出现2次以上的短语（种子短语不受限制）
+    python alias_builder.py --review           # 交互式确认 pending 条目
+"""
+
+import argparse
+import json
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List
+
+from gomi_rag.hybrid_grounding import (
+    HybridConfig,
+    _extract_phrases_with_llm,
+    get_item_index,
+    normalize_alias,
+    path_a_global_embedding,
+)
+
+ALIAS_VERSION = 1
+DEFAULT_LOG_FILE = Path(__file__).resolve().parent.parent / "backend" / "logs.jsonl"
+DEFAULT_TEST_FILE = Path("test_inputs.json")
+DEFAULT_SEED_FILE = Path(__file__).resolve().parent / "alias_seeds.txt"
+
+# 别名候选的最低相似度（低于此值的映射不进入候选表）
+MIN_SIMILARITY = 0.60
+# 过长的用户输入不是物品的说法，不作为挖掘对象
+MAX_INPUT_CHARS = 200
+
+
+# ========== 数据收集 ==========
+
+def collect_inputs(log_file: Path = DEFAULT_LOG_FILE, test_file: Path = DEFAULT_TEST_FILE) -> Counter:
+    """收集用户输入（日志 + 基准测试用例），返回 输入 → 出现次数"""
+    inputs = Counter()
+
+    if log_file.exists():
+        with open(log_file, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    text = json.loads(line).get("user", "")
+                except json.JSONDecodeError:
+                    continue
+                text = (text or "").strip()
+                if text and len(text) <= MAX_INPUT_CHARS:
+                    inputs[text] += 1
+
+    if test_file.exists():
+        data = json.loads(test_file.read_text(encoding="utf-8"))
+        for case in data.get("test_cases", []):
+            text = case.get("input", "").strip()
+            if text:
+                inputs[text] += 1
+
+    return inputs
+
+
+def load_seeds(seed_file: Path = DEFAULT_SEED_FILE) -> List[str]:
+    """种子短语（每行一个，# 开头为注释）"""
+    if not seed_file.exists():
+        return []
+    lines = (line.strip() for line in seed_file.read_text(encoding="utf-8").splitlines())
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+# ========== 批量提取 ==========
+
+def _map_phrase(phrase: str, gomi_collection, item_index: Dict, phrase_cache: Dict[str, List]):
+    """用路径A把短语映射到品名，返回 (规范化短语, 最佳候选)；不作为别名时候选为 None"""
+    key = normalize_alias(phrase)
+    # 与品名完全一致的短语不需要别名
+    if not key or phrase in item_index:
+        return key, None
+    if key not in phrase_cache:
+        phrase_cache[key] = path_a_global_embedding(phrase, gomi_collection, top_k=1)
+    candidates = phrase_cache[key]
+    if not candidates or candidates[0].similarity < MIN_SIMILARITY:
+        return key, None
+    return key, candidates[0]
+
+
+def mine_aliases(inputs: Counter, gomi_collection) -> Dict[str, Dict]:
+    """
+    对所有去重后的输入执行一次LLM短语提取，再用路径A把短语映射到品名。
+
+    Returns:
+        规范化短语 → {"品名", "score", "count", "example"}
+    """
+    item_index = get_item_index(gomi_collection)
+    phrase_cache: Dict[str, List] = {}
+    mined: Dict[str, Dict] = {}
+
+    total = len(inputs)
+    start = time.perf_counter()
+    for i, (text, count) in enumerate(inputs.most_common(), 1):
+        phrases = _extract_phrases_with_llm(text, HybridConfig.PATH_B_MAX_CANDIDATES)
+        print(f"  [{i}/{total}] {text[:30]!r} -> {phrases}")
+
+        for phrase in phrases:
+            key, best = _map_phrase(phrase, gomi_collection, item_index, phrase_cache)
+            if best is None:
+                continue
+
+            entry = mined.setdefault(key, {
+                "品名": best.item_name,
+                "score": round(best.similarity, 4),
+                "count": 0,
+                "example": text,
+            })
+            entry["count"] += count
+
+    elapsed = time.perf_counter() - start
+    print(f"\n提取完成: {total}条输入, {len(mined)}个别名候选, 耗时{elapsed:.1f}s")
+    return mined
+
+
+def mine_seed_aliases(seeds: List[str], inputs: Counter, gomi_collection) -> Dict[str, Dict]:
+    """
+    种子短语不经过LLM提取，直接用路径A映射到品名。
+    出现次数为包含该短语的用户输入数（规范化后比较）。
+
+    Returns:
+        规范化短语 → {"品名", "score", "count", "example"}
+    """
+    item_index = get_item_index(gomi_collection)
+    phrase_cache: Dict[str, List] = {}
+    normalized_inputs = [(normalize_alias(text), text, count) for text, count in inputs.most_common()]
+    mined: Dict[str, Dict] = {}
+
+    for seed in seeds:
+        key, best = _map_phrase(seed, gomi_collection, item_index, phrase_cache)
+        if best is None:
+            print(f"  种子 {seed!r}: 无对应品名（相似度低于{MIN_SIMILARITY}或与品名相同）")
+            continue
+        hits = [(text, count) for norm, text, count in normalized_inputs if key in norm]
+        mined[key] = {
+            "品名": best.item_name,
+            "score": round(best.similarity, 4),
+            "count": sum(count for _, count in hits),
+            "example": hits[0][0] if hits else seed,
+        }
+        print(f"  种子 {seed!r} -> {best.item_name} (score={best.similarity:.3f}, count={mined[key]['count']})")
+
+    return mined
+
+
+# ========== 合并与确认 ==========
+
+def load_alias_file(path: Path) -> Dict:
+    if path.exists():
+        return json.loads(path.read_text(encoding="utf-8"))
+    return {"version": ALIAS_VERSION, "aliases": {}}
+
+
+def save_alias_file(data: Dict, path: Path):
+    data["version"] = ALIAS_VERSION
+    data["updated_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    path.write_text(json.dumps(data, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+
+
+def merge_aliases(data: Dict, mined: Dict[str, Dict], min_count: int = 1) -> Dict[str, int]:
+    """
+    把挖掘结果合并进别名表。
+    reviewed / rejected 的条目只更新出现次数，不改变映射和状态。
+    """
+    aliases = data.setdefault("aliases", {})
+    existing = {normalize_alias(a): a for a in aliases}
+    stats = {"added": 0, "updated": 0, "skipped": 0}
+
+    for key, entry in mined.items():
+        if entry["count"] < min_count:
+            stats["skipped"] += 1
+            continue
+        alias = existing.get(key)
+        if alias is None:
+            aliases[key] = {**entry, "status": "pending"}
+            stats["added"] += 1
+            continue
+        current = aliases[alias]
+        current["count"] = max(current.get("count", 0), entry["count"])
+        if current.get("status") == "pending":
+            current.update({"品名": entry["品名"], "score": entry["score"]})
+        stats["updated"] += 1
+
+    return stats
+
+
+def review(data: Dict, path: Path):
+    """交互式确认 pending 条目（y: reviewed / n: rejected / s: 跳过 / q: 保存并退出）"""
+    pending = [(a, e) for a, e in data.get("aliases", {}).items() if e.get("status") == "pending"]
+    pending.sort(key=lambda x: -x[1].get("count", 0))
+    print(f"待确认: {len(pending)}条")
+
+    for alias, entry in pending:
+        print(f"\n  {alias} → {entry['品名']}  (score={entry.get('score')}, count={entry.get('count')})")
+        if entry.get("example"):
+            print(f"    例: {entry['example'][:60]}")
+        answer = input("  [y/n/s/q] > ").strip().lower()
+        if answer == "q":
+            break
+        if answer == "y":
+            entry["status"] = "reviewed"
+        elif answer == "n":
+            entry["status"] = "rejected"
+
+    save_alias_file(data, path)
+    print(f"\n✅ 已保存: {path}")
+
+
+# ========== 主程序 ==========
+
+def main():
+    parser = argparse.ArgumentParser(description="从日志和测试用例离线构建别名表")
+    parser.add_argument("--out", default=str(HybridConfig.ALIAS_FILE), help="别名表文件")
+    parser.add_argument("--logs", default=str(DEFAULT_LOG_FILE), help="backend日志 (jsonl)")
+    parser.add_argument("--tests", default=str(DEFAULT_TEST_FILE), help="基准测试用例 (json)")
+    parser.add_argument("--seeds", default=str(DEFAULT_SEED_FILE), help="种子短语（每行一个）")
+    parser.add_argument("--min-count", type=int, default=1, help="最少出现次数")
+    parser.add_argument("--review", action="store_true", help="只执行交互式确认")
+    args = parser.parse_args()
+
+    out = Path(args.out)
+    data = load_alias_file(out)
+
+    if args.review:
+        review(data, out)
+        return
+
+    from gomi_rag import load_jsonl, build_chroma
+
+    print("📦 加载数据...")
+    gomi_docs, gomi_meta = load_jsonl("rag_docs_merged.jsonl", key="品名")
+    gomi_collection = build_chroma(gomi_docs, gomi_meta, name="gomi")
+
+    inputs = collect_inputs(Path(args.logs), Path(args.tests))
+    print(f"✅ 输入: {len(inputs)}条（去重后）\n")
+
+    mined = mine_aliases(inputs, gomi_collection)
+    stats = merge_aliases(data, mined, min_count=args.min_count)
+
+    seeds = load_seeds(Path(args.seeds))
+    if seeds:
+        print(f"\n🌱 种子短语: {len(seeds)}条")
+        seed_stats = merge_aliases(data, mine_seed_aliases(seeds, inputs, gomi_collection), min_count=0)
+        for k, v in seed_stats.items():
+            stats[k] += v
+    save_alias_file(data, out)
+
+    statuses = Counter(e.get("status") for e in data["aliases"].values())
+    print(f"\n新增 {stats['added']} / 更新 {stats['updated']} / 跳过 {stats['skipped']}")
+    print(f"别名表: reviewed {statuses['reviewed']} / pending {statuses['pending']} / rejected {statuses['rejected']}")
+    print(f"✅ 已保存: {out}（pending 条目请用 --review 确认）")
+
+
+if __name__ == "__main__":
+    main()
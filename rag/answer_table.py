@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+品目ごとの回答を事前生成しておく「回答テーブル」
+
+ごみ品目は有限（rag_docs_merged.jsonl の約865行）なので、本番と同じ生成プロンプトで
+1品目ずつ（必要なら 品目 × 収集日 の組み合わせごとに）一度だけ回答を生成し、
+検証を通ったものをディスク上のテーブルに保存しておく。
+
+ファイル構成:
+    answer_table.dat       回答本文（UTF-8）を連結したデータファイル
+    answer_table.idx.json  キー → [offset, length, 入力ハッシュ] の索引
+
+起動時に索引だけ読み込み、本文は mmap から必要な分だけ読む。
+入力（品目の行・固定プレフィックス・モデル名・生成オプション）のハッシュが変わったキーだけを
+再生成するため、再ビルドは差分のみで済む。検索時も同じハッシュを比べ、
+元データやプロンプトが変わった（テーブルが古い）エントリは使わない。
+
+使い方:
+    python answer_table.py                  # 品目ごと
+    python answer_table.py --with-days      # 品目 × 収集日 のバリアントも生成
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+from answer_template import TemplateConfig, schedule_for
+from gomi_rag.ollama_client import ModelConfig, generation_options
+from gomi_rag.prompt_builder import STATIC_PREFIX, build_user_message
+
+
+TABLE_VERSION = 1
+DEFAULT_BASENAME = Path(__file__).resolve().parent / "answer_table"
+
+# 収集日バリアントのコンテキストに使う町名。回答中のこの文字列を検索時にユーザの町名へ置き換える
+PLACEHOLDER_AREA = "お住まいの町名"
+
+
+def variant_key(item_name: str, day: Optional[str] = None) -> str:
+    """テーブルのキー（品名 / 品名 + TAB + 収集日）"""
+    return item_name if not day else f"{item_name}\t{day}"
+
+
+def _paths(basename) -> tuple:
+    basename = Path(basename)
+    return basename.with_suffix(".dat"), basename.with_suffix(".idx.json")
+
+
+# ========== 読み込み（バックエンド用） ==========
+
+class AnswerTable:
+    """索引はメモリ、本文は mmap の読み取り専用テーブル"""
+
+    def __init__(self, entries: dict, data: mmap.mmap, meta: dict):
+        self._entries = entries
+        self._data = data
+        self.meta = meta
+        self._stale_keys = set()
+
+    @classmethod
+    def load(cls, basename=DEFAULT_BASENAME) -> Optional["AnswerTable"]:
+        """テーブルを開く。存在しなければ None"""
+        data_path, index_path = _paths(basename)
+        if not data_path.exists() or not index_path.exists():
+            return None
+        index = json.loads(index_path.read_text(encoding="utf-8"))
+        if index.get("version") != TABLE_VERSION:
+            print(f"⚠️ 回答テーブルのバージョン不一致: {index.get('version')}")
+            return None
+        with open(data_path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if data_path.stat().st_size else b""
+        meta = {k: v for k, v in index.items() if k != "entries"}
+        return cls(index["entries"], data, meta)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        offset, length = entry[0], entry[1]
+        return bytes(self._data[offset:offset + length]).decode("utf-8")
+
+    def lookup(self, item_meta: dict, area_row: Optional[dict] = None) -> Optional[str]:
+        """
+        品目（と町名）に対応する事前生成済み回答を返す。
+
+        町名があり収集区分が分かる場合は 品目 × 収集日 のバリアントのみ使い、
+        生成時の PLACEHOLDER_AREA をその町名に置き換えて返す
+        （無ければ None を返し、呼び出し側でテンプレート / LLM に回す）。
+        """
+        name = item_meta.get("品名", "")
+        if area_row:
+            schedule = schedule_for(item_meta, area_row)
+            if schedule is not None:
+                answer = self._get_fresh(item_meta, schedule[1])
+                if answer is None:
+                    return None
+                return answer.replace(PLACEHOLDER_AREA, area_row.get("町名") or PLACEHOLDER_AREA)
+        return self._get_fresh(item_meta, None)
+
+    def _get_fresh(self, item_meta: dict, day: Optional[str]) -> Optional[str]:
+        """生成時と入力ハッシュが一致するエントリだけ返す（古ければ None でテンプレート / LLM に回す）"""
+        key = variant_key(item_meta.get("品名", ""), day)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[2] != _input_hash(item_meta, day, self.meta.get("model", ModelConfig.ANSWER)):
+            if key not in self._stale_keys:
+                self._stale_keys.add(key)
+                print(f"⚠️ 回答テーブルが古いため使いません: {key!r}（python answer_table.py で再ビルド）")
+            return None
+        return self.get(key)
+
+
+# ========== ビルド ==========
+
+def _input_hash(row: dict, day: Optional[str], model: str) -> str:
+    h = hashlib.sha1()
+    h.update(json.dumps(row, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    h.update((day or "").encode("utf-8"))
+    h.update(STATIC_PREFIX.encode("utf-8"))
+    h.update(model.encode("utf-8"))
+    h.update(json.dumps(generation_options("answer_table"), ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def _build_prompt(row: dict, day: Optional[str]) -> str:
+    """本番の rag_retrieve_extended と同じ形のユーザメッセージを作る"""
+    from gomi_rag import format_gomi_context, format_area_context
+
+    parts = ["【ごみ分別情報】\n" + format_gomi_context(row)]
+    question = f"{row.get('品名', '')}の捨て方を教えてください"
+    if day:
+        area_row = {"町名": PLACEHOLDER_AREA}
+        for _, (_, column) in TemplateConfig.SCHEDULE_COLUMNS.items():
+            area_row[column] = "不明"
+        column = _schedule_column(row)
+        area_row[column] = day
+        parts.append("【町名情報】\n" + format_area_context(area_row))
+        question = f"{PLACEHOLDER_AREA}で{question}"
+    return build_user_message("\n\n".join(parts), question)
+
+
+def _schedule_column(row: dict) -> Optional[str]:
+    method = row.get("出し方", "")
+    for key, (_, column) in TemplateConfig.SCHEDULE_COLUMNS.items():
+        if key in method:
+            return column
+    return None
+
+
+def _vet(answer: str, row: dict, day: Optional[str]) -> bool:
+    """
+    事前生成した回答の自動検証（品名・出し方・収集日が含まれているか）。
+    収集日バリアントは町名の差し込み先（PLACEHOLDER_AREA）が残っていることも確認する。
+    """
+    if not answer or row.get("品名", "") not in answer:
+        return False
+    if row.get("出し方", "")[:4] not in answer:
+        return False
+    if day and (day not in answer or PLACEHOLDER_AREA not in answer):
+        return False
+    return True
+
+
+def plan_entries(gomi_meta: list, area_meta: list, with_days: bool) -> list:
+    """
+    生成対象の (キー, 行, 収集日) を列挙する。
+    同じ品名の行が複数あれば最初の行だけ使う（キーが重複すると .dat に使われない本文が残る）。
+    """
+    days_by_column = {}
+    if with_days:
+        for _, (_, column) in TemplateConfig.SCHEDULE_COLUMNS.items():
+            days_by_column[column] = sorted({a[column] for a in area_meta if a.get(column)})
+
+    plan = []
+    seen = set()
+    for row in gomi_meta:
+        name = row.get("品名", "")
+        if not name or name in seen:
+            continue
+        seen.add(name)
+        plan.append((variant_key(name), row, None))
+        column = _schedule_column(row)
+        for day in days_by_column.get(column, []):
+            plan.append((variant_key(name, day), row, day))
+    return plan
+
+
+def build_table(
+    gomi_meta: list,
+    area_meta: list,
+    basename=DEFAULT_BASENAME,
+    model: str = ModelConfig.ANSWER,
+    with_days: bool = False,
+    limit: Optional[int] = None,
+) -> dict:
+    """
+    回答テーブルを（差分で）ビルドする。
+
+    Returns:
+        ビルド結果のサマリ（件数・スループット・サイズ）
+    """
+    from gomi_rag import ask_ollama
+
+    data_path, index_path = _paths(basename)
+    old = AnswerTable.load(basename)
+    old_entries = old._entries if old else {}
+
+    plan = plan_entries(gomi_meta, area_meta, with_days)
+    if limit:
+        plan = plan[:limit]
+
+    tmp_data = data_path.with_suffix(".dat.tmp")
+    entries = {}
+    stats = {"generated": 0, "reused": 0, "rejected": 0, "output_tokens": 0}
+    offset = 0
+    start = time.perf_counter()
+    gen_time = 0.0
+
+    with open(tmp_data, "wb") as out:
+        for i, (key, row, day) in enumerate(plan, 1):
+            h = _input_hash(row, day, model)
+            prev = old_entries.get(key)
+
+            if prev is not None and prev[2] == h:
+                answer_bytes = old.get(key).encode("utf-8")
+                stats["reused"] += 1
+            else:
+                t0 = time.perf_counter()
+                answer, eval_stats = ask_ollama(
+                    _build_prompt(row, day), model=model, return_stats=True, endpoint="answer_table"
+                )
+                gen_time += time.perf_counter() - t0
+                stats["output_tokens"] += eval_stats.get("output_tokens") or 0
+                if not _vet(answer, row, day):
+                    stats["rejected"] += 1
+                    print(f"  [{i}/{len(plan)}] ❌ 検証NG: {key!r}")
+                    continue
+                answer_bytes = answer.strip().encode("utf-8")
+                stats["generated"] += 1
+                print(f"  [{i}/{len(plan)}] ✅ {key!r} ({len(answer_bytes)} bytes)")
+
+            out.write(answer_bytes)
+            entries[key] = [offset, len(answer_bytes), h]
+            offset += len(answer_bytes)
+
+    index = {
+        "version": TABLE_VERSION,
+        "model": model,
+        "with_days": with_days,
+        "built_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "entries": entries,
+    }
+    tmp_index = index_path.with_suffix(".json.tmp")
+    tmp_index.write_text(json.dumps(index, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp_data, data_path)
+    os.replace(tmp_index, index_path)
+
+    elapsed = time.perf_counter() - start
+    summary = {
+        **stats,
+        "entries": len(entries),
+        "removed": len(set(old_entries) - set(entries)),
+        "elapsed_s": round(elapsed, 2),
+        "items_per_sec": round(stats["generated"] / gen_time, 3) if gen_time else None,
+        "output_tokens_per_sec": round(stats["output_tokens"] / gen_time, 1) if gen_time else None,
+        "data_bytes": data_path.stat().st_size,
+        "index_bytes": index_path.stat().st_size,
+    }
+    return summary
+
+
+if __name__ == "__main__":
+    import argparse
+    from gomi_rag import load_jsonl
+
+    parser = argparse.ArgumentParser(description="品目ごとの回答テーブルを事前生成する")
+    parser.add_argument("--gomi", default="rag_docs_merged.jsonl")
+    parser.add_argument("--area", default="area.jsonl")
+    parser.add_argument("--out", default=str(DEFAULT_BASENAME), help="出力先（拡張子なし）")
+    parser.add_argument("--model", default=ModelConfig.ANSWER)
+    parser.add_argument("--with-days", action="store_true", help="品目 × 収集日 のバリアントも生成")
+    parser.add_argument("--limit", type=int, help="先頭 N 件のみ（動作確認用）")
+    args = parser.parse_args()
+
+    _, gomi_meta = load_jsonl(args.gomi, key="品名")
+    _, area_meta = load_jsonl(args.area, key="町名")
+
+    summary = build_table(
+        gomi_meta, area_meta,
+        basename=args.out, model=args.model, with_days=args.with_days, limit=args.limit,
+    )
+
+    print("\n" + "=" * 60)
+    print("📊 回答テーブル ビルド結果")
+    print("=" * 60)
+    print(f"エントリ数: {summary['entries']}（生成 {summary['generated']} / 再利用 {summary['reused']} / "
+          f"検証NG {summary['rejected']} / 削除 {summary['removed']}）")
+    print(f"所要時間: {summary['elapsed_s']}s | 生成スループット: {summary['items_per_sec']} 件/s, "
+          f"{summary['output_tokens_per_sec']} tok/s")
+    print(f"サイズ: data={summary['data_bytes']:,} bytes | index={summary['index_bytes']:,} bytes")
+    print("=" * 60)
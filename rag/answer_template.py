@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+LLM を使わない回答生成（テンプレートレンダリング）
+
+ほとんどの質問の答えは rag_docs_merged.jsonl の「品名 / 出し方 / 備考」1行と
+area.jsonl の町名ごとの収集日だけで決まる。Hybrid Grounding の結果が
+高置信度かつ曖昧でない場合は、プロンプトの【出力形式】と同じ形で直接組み立てる。
+
+LLM が必要なのは「曖昧」「複数品目」「ナレッジベース由来」の質問のみ。
+"""
+
+import os
+from typing import Optional, Tuple
+
+
+# ========== 設定 ==========
+
+class TemplateConfig:
+    """テンプレート回答の設定"""
+
+    # 既定でテンプレート回答を許可するか（リクエスト側でも無効化できる）
+    ENABLED = os.getenv("ANSWER_TEMPLATE_ENABLED", "1") == "1"
+
+    # ナレッジ検索のヒットがこの類似度以上なら、ナレッジ質問とみなして LLM に回す
+    # （尺度は store.distance_to_similarity。既存の l2 コレクションの 1 - distance と同じ）
+    KNOWLEDGE_SIMILARITY_MIN = 0.60
+
+    # 出し方 → area.jsonl の収集日カラム
+    SCHEDULE_COLUMNS = {
+        "家庭ごみ": ("家庭ごみ", "家庭ごみの収集日"),
+        "プラスチック": ("プラスチック", "プラスチックの収集日"),
+        "粗大ごみ": ("粗大ごみ", "粗大ごみの収集日（事前申込制）"),
+    }
+
+
+# ========== 判定 ==========
+
+def _path_b_phrases(grounding_result) -> set:
+    """路径B（別名ヒットを含む）で品名に結びついた入力中の語句（複数あれば複数品目の質問）"""
+    phrases = set()
+    for c in grounding_result.candidates:
+        if c.source.startswith(("path_b", "alias")) and ":" in c.source:
+            phrases.add(c.source.split(":", 1)[1])
+    return phrases
+
+
+def can_render(details: dict) -> Tuple[bool, str]:
+    """
+    テンプレートで回答してよいかを判定する。
+
+    Args:
+        details: rag_retrieve_extended(..., return_details=True) の details
+
+    Returns:
+        (可否, 理由)
+    """
+    result = details.get("grounding_result")
+    if result is None or result.primary_candidate is None:
+        return False, "no_grounding"
+    if result.confidence_level != "high":
+        return False, f"confidence_{result.confidence_level}"
+    if result.is_ambiguous:
+        return False, "ambiguous"
+    if len(_path_b_phrases(result)) > 1:
+        return False, "multi_item"
+
+    for hit in details.get("knowledge_hits") or []:
+        # 類似度は store.query_chroma がコレクションの距離空間に応じて換算済み
+        similarity = hit.get("similarity")
+        if similarity is None or similarity >= TemplateConfig.KNOWLEDGE_SIMILARITY_MIN:
+            return False, "knowledge"
+
+    return True, "ok"
+
+
+# ========== レンダリング ==========
+
+def schedule_for(item_meta: dict, area_row: Optional[dict]) -> Optional[Tuple[str, str]]:
+    """
+    品目の出し方に対応する収集日を返す。
+
+    Returns:
+        (ラベル, 収集日)。町名が無い・対応する収集区分が無い場合は None
+    """
+    if not area_row:
+        return None
+    method = item_meta.get("出し方", "")
+    for key, (label, column) in TemplateConfig.SCHEDULE_COLUMNS.items():
+        if key in method:
+            day = area_row.get(column)
+            return (label, day) if day else None
+    return None
+
+
+def _schedule_line(item_meta: dict, area_row: Optional[dict]) -> str:
+    """該当町名の収集日の行"""
+    if not area_row:
+        return "不明（町名を入力すると収集日をご案内できます）"
+    schedule = schedule_for(item_meta, area_row)
+    if schedule is None:
+        return "不明"
+    label, day = schedule
+    return f"{area_row.get('町名', '')}の{label}は{day}です。"
+
+
+def render_answer(item_meta: dict, area_row: Optional[dict] = None) -> str:
+    """
+    【出力形式】と同じ4項目の回答を組み立てる。
+
+    Args:
+        item_meta: GroundingResult.primary_candidate.metadata（rag_docs_merged.jsonl の1行）
+        area_row: area.jsonl の1行（町名が無ければ None）
+    """
+    note = (item_meta.get("備考") or "").strip() or "特になし"
+    return "\n".join([
+        f"- 品名: {item_meta.get('品名', '')}",
+        f"- 品名の出し方: {item_meta.get('出し方', '')}",
+        f"- 備考: {note}",
+        f"- 該当町名の収集日: {_schedule_line(item_meta, area_row)}",
+    ])
+
+
+def try_render(details: dict) -> Tuple[Optional[str], str]:
+    """
+    can_render() を満たせば回答文を返す。満たさなければ (None, 理由)。
+    """
+    ok, reason = can_render(details)
+    if not ok:
+        return None, reason
+    area_rows = details.get("area_rows") or []
+    meta = details["grounding_result"].primary_candidate.metadata
+    return render_answer(meta, area_rows[0] if area_rows else None), reason
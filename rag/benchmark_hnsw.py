@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+HNSW 設定のスイープ（recall@k と検索レイテンシ）
+
+実コレクションの埋め込みを読み出し、space × M × construction_ef × search_ef の組み合わせごとに
+一時的な（インメモリの）コレクションを構築して、
+    - recall@k   全件の厳密検索（numpy）の上位 k 件のうち HNSW が返した割合
+    - p50 / p99  1 クエリあたりの検索時間
+を測る。再 Embedding はしない（コーパスは保存済みの埋め込みを使う）。
+
+クエリ:
+    logs   backend/logs.jsonl に記録されたユーザ入力（Embedding に Ollama が必要）
+    items  コーパスの埋め込みから抽出（Ollama 不要）
+
+結果から recall が --min-recall 以上で p99 が最小の設定を選び、
+gomi_rag.store.IndexConfig に渡す環境変数（HNSW_<コレクション名>_*）として表示する。
+選んだ設定は構築時にコレクションのメタデータ（hnsw:*）に記録される。
+
+使い方:
+    python benchmark_hnsw.py --collection gomi
+    python benchmark_hnsw.py --collection knowledge --queries items --M 16 32 48 --search-ef 32 64 128
+"""
+
+import argparse
+import itertools
+import json
+import random
+import time
+from pathlib import Path
+
+import numpy as np
+
+from gomi_rag import store
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_PERSIST_DIR = ROOT_DIR / "backend" / "chroma_db"
+DEFAULT_LOGS = ROOT_DIR / "backend" / "logs.jsonl"
+ADD_BATCH = 4000
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# ========== コーパス・クエリ ==========
+
+def load_corpus(name: str, persist_dir: str) -> tuple:
+    collection = store.get_collection(name, persist_dir)
+    res = collection.get(include=["embeddings"])
+    return list(res["ids"]), np.asarray(res["embeddings"], dtype=np.float32), store.collection_space(collection)
+
+
+def logged_queries(path: Path, limit: int) -> list:
+    """ログのユーザ入力（重複は除く）"""
+    texts = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                text = (json.loads(line).get("user") or "").strip()
+            except json.JSONDecodeError:
+                continue
+            if text:
+                texts.append(text)
+    return list(dict.fromkeys(texts))[:limit]
+
+
+def load_queries(source: str, corpus, logs: Path, limit: int, seed: int):
+    if source == "logs":
+        from gomi_rag.embedding import get_embedding_function
+
+        texts = logged_queries(logs, limit)
+        if not texts:
+            raise SystemExit(f"⚠️ ログにクエリがありません: {logs}")
+        return np.asarray(get_embedding_function()(texts), dtype=np.float32)
+    rng = random.Random(seed)
+    picks = rng.sample(range(len(corpus)), min(limit, len(corpus)))
+    return corpus[picks]
+
+
+# ========== 厳密検索（正解） ==========
+
+def exact_topk(corpus, queries, k: int, space: str) -> list:
+    """Chroma と同じ距離定義での全件検索の上位 k 件（行番号）"""
+    dots = queries @ corpus.T
+    if space == "cosine":
+        norms = np.linalg.norm(queries, axis=1)[:, None] * np.linalg.norm(corpus, axis=1)[None, :]
+        dist = 1.0 - dots / np.maximum(norms, 1e-12)
+    elif space == "ip":
+        dist = 1.0 - dots
+    else:
+        dist = (queries ** 2).sum(1)[:, None] + (corpus ** 2).sum(1)[None, :] - 2.0 * dots
+    return [set(np.argsort(row, kind="stable")[:k].tolist()) for row in dist]
+
+
+# ========== スイープ ==========
+
+def build_index(client, name: str, ids: list, corpus, settings: dict):
+    metadata = {f"hnsw:{field}": settings[field] for field in store.IndexConfig.FIELDS}
+    collection = client.create_collection(name, metadata=metadata, embedding_function=None)
+    # 行番号を ID にして正解と突き合わせる
+    row_ids = [str(i) for i in range(len(ids))]
+    for start in range(0, len(row_ids), ADD_BATCH):
+        collection.add(ids=row_ids[start:start + ADD_BATCH], embeddings=corpus[start:start + ADD_BATCH].tolist())
+    return collection
+
+
+def evaluate(collection, queries, truth: list, k: int) -> dict:
+    latencies, recalls = [], []
+    for query, expected in zip(queries, truth):
+        t = time.perf_counter()
+        res = collection.query(query_embeddings=[query.tolist()], n_results=k)
+        latencies.append((time.perf_counter() - t) * 1000)
+        found = {int(i) for i in res["ids"][0]}
+        recalls.append(len(found & expected) / len(expected))
+    return {
+        "recall": round(sum(recalls) / len(recalls), 4),
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+    }
+
+
+def main():
+    defaults = store.IndexConfig.DEFAULTS
+    parser = argparse.ArgumentParser(description="HNSW 設定ごとの recall@k と p50 / p99 を測る")
+    parser.add_argument("--collection", default="gomi")
+    parser.add_argument("--persist-dir", default=str(DEFAULT_PERSIST_DIR))
+    parser.add_argument("--queries", choices=["logs", "items"], default="logs", help="クエリの出どころ")
+    parser.add_argument("--logs", default=str(DEFAULT_LOGS))
+    parser.add_argument("--limit", type=int, default=200, help="クエリ数の上限")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--spaces", nargs="+", default=[defaults["space"]], choices=store.IndexConfig.SPACES)
+    parser.add_argument("--M", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--construction-ef", type=int, nargs="+", default=[100, 200])
+    parser.add_argument("--search-ef", type=int, nargs="+", default=[10, 32, 64, 128])
+    parser.add_argument("--min-recall", type=float, default=0.99, help="採用する設定の recall 下限")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="benchmark_hnsw.json", help="結果の保存先")
+    args = parser.parse_args()
+
+    import chromadb
+
+    ids, corpus, current_space = load_corpus(args.collection, args.persist_dir)
+    queries = load_queries(args.queries, corpus, Path(args.logs), args.limit, args.seed)
+    print(f"📥 {args.collection}: {len(ids)} 件 × {corpus.shape[1]} 次元（現在の space={current_space}）| "
+          f"クエリ {len(queries)} 件（{args.queries}）| k={args.k}")
+
+    client = chromadb.EphemeralClient()
+    truth_by_space = {space: exact_topk(corpus, queries, args.k, space) for space in args.spaces}
+    results = []
+    print(f"{'space':<7} {'M':>3} {'c_ef':>5} {'s_ef':>5} | {'recall':>7} {'p50':>8} {'p99':>8} | {'build':>7}")
+    grid = itertools.product(args.spaces, args.M, args.construction_ef, args.search_ef)
+    for i, (space, m, c_ef, s_ef) in enumerate(grid):
+        settings = {"space": space, "M": m, "construction_ef": c_ef, "search_ef": s_ef}
+        t = time.perf_counter()
+        collection = build_index(client, f"hnsw_sweep_{i}", ids, corpus, settings)
+        build_s = time.perf_counter() - t
+        r = {**settings, **evaluate(collection, queries, truth_by_space[space], args.k), "build_s": round(build_s, 2)}
+        client.delete_collection(collection.name)
+        results.append(r)
+        print(f"{space:<7} {m:>3} {c_ef:>5} {s_ef:>5} | {r['recall']:>7.4f} {r['p50_ms']:>6.3f}ms "
+              f"{r['p99_ms']:>6.3f}ms | {build_s:>6.2f}s")
+
+    passing = [r for r in results if r["recall"] >= args.min_recall]
+    chosen = min(passing, key=lambda r: (r["p99_ms"], r["M"], r["search_ef"])) if passing else None
+    if chosen:
+        print(f"\n✅ recall ≥ {args.min_recall} で p99 最小: {chosen}")
+        for field in store.IndexConfig.FIELDS:
+            print(f"   HNSW_{args.collection.upper()}_{field.upper()}={chosen[field]}")
+    else:
+        print(f"\n⚠️ recall ≥ {args.min_recall} を満たす設定がありません（--search-ef / --M を増やしてください）")
+
+    report = {
+        "collection": args.collection,
+        "count": len(ids),
+        "dim": int(corpus.shape[1]),
+        "queries": args.queries,
+        "num_queries": len(queries),
+        "k": args.k,
+        "min_recall": args.min_recall,
+        "results": results,
+        "chosen": chosen,
+    }
+    Path(args.out).write_text(json.dumps(report, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    print(f"✅ 保存: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
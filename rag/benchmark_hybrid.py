@@ -7,8 +7,8 @@ Hybrid品名指称系统 - 端到端基准测试
 import json
 import time
 from pathlib import Path
-from hybrid_grounding import hybrid_grounding, format_grounding_result
-from rag_demo3 import load_jsonl, build_chroma
+from gomi_rag.hybrid_grounding import hybrid_grounding, format_grounding_result, _extract_phrases_with_llm, HybridConfig
+from gomi_rag import load_jsonl, build_chroma
 import chromadb
 
 
@@ -317,6 +317,128 @@ def run_benchmark():
         return False
 
 
+def run_extractor_comparison(extractors=("llm", "mecab")):
+    """路径B短语提取方式对比（按输入类型的准确率・平均耗时）"""
+    print("=" * 80)
+    print("路径B短语提取方式对比: " + " vs ".join(extractors))
+    print("=" * 80)
+    
+    gomi_docs, gomi_meta = load_jsonl("rag_docs_merged.jsonl", key="品名")
+    gomi_collection = build_chroma(gomi_docs, gomi_meta, name="gomi")
+    test_cases = load_or_create_test_cases()
+    
+    # extractor → 类型 → {"total", "correct", "time"}
+    stats = {}
+    for extractor in extractors:
+        print(f"\n▶ extractor={extractor}")
+        type_stats = stats.setdefault(extractor, {})
+        for case in test_cases:
+            user_input = case["input"]
+            result = hybrid_grounding(
+                user_input, gomi_collection,
+                force_full_path=len(user_input) >= 20,
+                extractor=extractor
+            )
+            is_correct, _, _ = evaluate_result(result, case["expected_keywords"])
+            for t in (case.get("type", "unknown"), "ALL"):
+                s = type_stats.setdefault(t, {"total": 0, "correct": 0, "time": []})
+                s["total"] += 1
+                s["correct"] += int(is_correct)
+                s["time"].append(result.execution_time_ms)
+    
+    print("\n" + "=" * 80)
+    header = f"{'类型':<12}"
+    for extractor in extractors:
+        header += f" | {extractor + ' 准确率':>16} | {extractor + ' 耗时':>14}"
+    print(header)
+    print("-" * 80)
+    
+    types = sorted({t for ts in stats.values() for t in ts if t != "ALL"}) + ["ALL"]
+    summary = {}
+    for t in types:
+        line = f"{t:<12}"
+        for extractor in extractors:
+            s = stats[extractor].get(t)
+            if not s:
+                line += f" | {'-':>16} | {'-':>14}"
+                continue
+            accuracy = s["correct"] / s["total"] * 100
+            avg_time = sum(s["time"]) / len(s["time"])
+            summary.setdefault(extractor, {})[t] = {
+                "accuracy": accuracy, "avg_time_ms": avg_time, "samples": s["total"]
+            }
+            line += f" | {accuracy:9.1f}% ({s['correct']}/{s['total']}) | {avg_time:12.1f}ms"
+        print(line)
+    print("=" * 80)
+    
+    output_file = Path("benchmark_extractors.json")
+    output_file.write_text(json.dumps({
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "summary": summary
+    }, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\n📄 详细结果已保存到: {output_file}")
+    return summary
+
+
+def run_extraction_model_comparison(models):
+    """
+    路径B短语提取模型对比：对每个候选模型调用 _extract_phrases_with_llm，
+    统计提取准确率（预期关键词出现在任一提取短语中）与提取耗时
+    """
+    print("=" * 80)
+    print("短语提取模型对比: " + " vs ".join(models))
+    print("=" * 80)
+    
+    test_cases = load_or_create_test_cases()
+    summary = {}
+    
+    for model in models:
+        print(f"\n▶ model={model}")
+        # 首次调用包含模型加载时间，先预热一次
+        _extract_phrases_with_llm("ノートパソコン", HybridConfig.PATH_B_MAX_CANDIDATES, model=model)
+        
+        type_stats = {}
+        for case in test_cases:
+            start = time.perf_counter()
+            phrases = _extract_phrases_with_llm(case["input"], HybridConfig.PATH_B_MAX_CANDIDATES, model=model)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            hit = any(k in p for k in case["expected_keywords"] for p in phrases)
+            print(f"  {'✅' if hit else '❌'} {case['input'][:30]!r} -> {phrases} ({elapsed_ms:.0f}ms)")
+            for t in (case.get("type", "unknown"), "ALL"):
+                s = type_stats.setdefault(t, {"total": 0, "correct": 0, "empty": 0, "time": []})
+                s["total"] += 1
+                s["correct"] += int(hit)
+                s["empty"] += int(not phrases)
+                s["time"].append(elapsed_ms)
+        summary[model] = {
+            t: {
+                "accuracy": s["correct"] / s["total"] * 100,
+                "empty_rate": s["empty"] / s["total"] * 100,
+                "avg_time_ms": sum(s["time"]) / len(s["time"]),
+                "p90_time_ms": sorted(s["time"])[min(len(s["time"]) - 1, int(len(s["time"]) * 0.9))],
+                "samples": s["total"],
+            }
+            for t, s in type_stats.items()
+        }
+    
+    print("\n" + "=" * 80)
+    print(f"{'模型':<28} | {'准确率':>8} | {'空输出率':>8} | {'平均耗时':>10} | {'P90耗时':>10}")
+    print("-" * 80)
+    for model, stats in summary.items():
+        s = stats["ALL"]
+        print(f"{model:<28} | {s['accuracy']:7.1f}% | {s['empty_rate']:7.1f}% | "
+              f"{s['avg_time_ms']:8.1f}ms | {s['p90_time_ms']:8.1f}ms")
+    print("=" * 80)
+    
+    output_file = Path("benchmark_extraction_models.json")
+    output_file.write_text(json.dumps({
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "summary": summary
+    }, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\n📄 详细结果已保存到: {output_file}")
+    return summary
+
+
 def run_single_test(user_input: str):
     """运行单个测试用例（用于调试）"""
     print("=" * 80)
@@ -342,7 +464,13 @@ def run_single_test(user_input: str):
 if __name__ == "__main__":
     import sys
     
-    if len(sys.argv) > 1:
+    if len(sys.argv) > 1 and sys.argv[1] == "--compare-extraction-models":
+        # 短语提取模型对比（例: --compare-extraction-models swallow:latest qwen2.5:1.5b）
+        run_extraction_model_comparison(sys.argv[2:] or [HybridConfig.LLM_MODEL])
+    elif len(sys.argv) > 1 and sys.argv[1] == "--compare-extractors":
+        # 路径B提取方式对比（LLM vs MeCab）
+        run_extractor_comparison()
+    elif len(sys.argv) > 1:
         # 单测试模式
         user_input = " ".join(sys.argv[1:])
         run_single_test(user_input)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+import 時間・メモリのベンチマーク（uvicorn ワーカー起動の目安）
+
+各シナリオを新しいインタプリタで import し、壁時計時間と RSS（VmRSS / ru_maxrss）を測る。
+
+シナリオ:
+    gomi_rag_light   from gomi_rag import load_jsonl（標準ライブラリのみ）
+    gomi_rag_backend backend/app.py と同じ名前を gomi_rag から import
+    rag_demo3        互換用の再エクスポート（全モジュールを import）
+    baseline         --baseline-rev で指定したリビジョンの rag_demo3.py（分割前との比較用）
+
+使い方:
+    python benchmark_import.py
+    python benchmark_import.py --baseline-rev <分割前のコミット> --repeat 5
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+RAG_DIR = Path(__file__).resolve().parent
+
+SCENARIOS = {
+    "gomi_rag_light": "from gomi_rag import load_jsonl",
+    "gomi_rag_backend": (
+        "from gomi_rag import load_jsonl, build_chroma, rag_retrieve_extended, "
+        "ask_ollama, extract_eval_stats, GenerationTimeout"
+    ),
+    "rag_demo3": "import rag_demo3",
+}
+
+# 子プロセスで実行するコード。import の前後で時間と RSS を測って JSON で返す
+_PROBE = """
+import json, resource, sys, time
+sys.path[:0] = {paths!r}
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return None
+
+before = rss_mb()
+t = time.perf_counter()
+{stmt}
+elapsed = (time.perf_counter() - t) * 1000
+print(json.dumps({{
+    "import_ms": elapsed,
+    "rss_mb": rss_mb(),
+    "rss_delta_mb": (rss_mb() or 0) - (before or 0),
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "modules": len(sys.modules),
+}}))
+"""
+
+
+def run_probe(stmt: str, paths: list) -> dict:
+    code = _PROBE.format(paths=[str(p) for p in paths], stmt=stmt)
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=RAG_DIR)
+    if proc.returncode != 0:
+        err = proc.stderr.strip().splitlines()
+        return {"error": err[-1] if err else f"exit {proc.returncode}"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+# gomi_rag に移したモジュール。分割前の rag_demo3.py はトップレベル名で import する
+BASELINE_MODULES = ("prompt_builder", "embedding", "context_packer", "ollama_client", "hybrid_grounding")
+
+
+def export_baseline(rev: str, workdir: Path) -> str:
+    """
+    指定リビジョンの rag_demo3.py を別名で書き出す。そのリビジョンにトップレベルで
+    あったモジュール（BASELINE_MODULES）も一緒に書き出す（他は現在の rag/ を使う）。
+    """
+    source = subprocess.check_output(["git", "show", f"{rev}:rag/rag_demo3.py"], cwd=RAG_DIR, text=True)
+    (workdir / "rag_demo3_baseline.py").write_text(source, encoding="utf-8")
+    for name in BASELINE_MODULES:
+        try:
+            module = subprocess.check_output(
+                ["git", "show", f"{rev}:rag/{name}.py"], cwd=RAG_DIR, text=True, stderr=subprocess.DEVNULL
+            )
+        except subprocess.CalledProcessError:
+            continue
+        (workdir / f"{name}.py").write_text(module, encoding="utf-8")
+    return "import rag_demo3_baseline"
+
+
+def summarize(runs: list) -> dict:
+    ok = [r for r in runs if "error" not in r]
+    if not ok:
+        return runs[0]
+    return {
+        "import_ms_median": round(statistics.median(r["import_ms"] for r in ok), 1),
+        "rss_mb_median": round(statistics.median(r["rss_mb"] for r in ok), 1),
+        "rss_delta_mb_median": round(statistics.median(r["rss_delta_mb"] for r in ok), 1),
+        "max_rss_mb": round(max(r["max_rss_mb"] for r in ok), 1),
+        "modules": ok[0]["modules"],
+        "runs": len(ok),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="gomi_rag / rag_demo3 の import 時間・RSS ベンチマーク")
+    parser.add_argument("--repeat", type=int, default=3, help="各シナリオの計測回数")
+    parser.add_argument("--baseline-rev", help="比較用に rag_demo3.py を取り出す git リビジョン")
+    parser.add_argument("--out", default="benchmark_import.json", help="結果の保存先")
+    args = parser.parse_args()
+
+    scenarios = dict(SCENARIOS)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [RAG_DIR]
+        if args.baseline_rev:
+            scenarios["baseline"] = export_baseline(args.baseline_rev, Path(tmp))
+            paths = [Path(tmp), RAG_DIR]
+
+        results = {}
+        for name, stmt in scenarios.items():
+            results[name] = summarize([run_probe(stmt, paths) for _ in range(args.repeat)])
+            r = results[name]
+            if "error" in r:
+                print(f"{name:<18} ⚠️ {r['error']}")
+                continue
+            print(f"{name:<18} import {r['import_ms_median']:>8.1f}ms | RSS {r['rss_mb_median']:>7.1f}MB "
+                  f"(+{r['rss_delta_mb_median']:.1f}MB) | modules {r['modules']}")
+
+    if "import_ms_median" in results.get("baseline", {}) and "import_ms_median" in results["gomi_rag_backend"]:
+        b, a = results["baseline"], results["gomi_rag_backend"]
+        print(f"\n📊 分割前 → gomi_rag: import {b['import_ms_median']}ms → {a['import_ms_median']}ms, "
+              f"RSS {b['rss_mb_median']}MB → {a['rss_mb_median']}MB")
+
+    Path(args.out).write_text(json.dumps(results, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    print(f"✅ 保存: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+固定プレフィックスによる KV キャッシュ再利用の効果測定
+
+同じ品名データからリクエストを作り、2種類のレイアウトで
+Ollama の prompt_eval_duration / prompt_eval_count を比較する。
+
+- prefix: prompt_builder.build_messages()（固定 system ＋ 可変 user）
+- mixed : 可変コンテキストを先頭に置いた 1 メッセージ（キャッシュが効かない並び）
+
+num_predict=1 で生成をほぼ止め、プロンプト評価時間だけを測る。
+"""
+
+import argparse
+import json
+import random
+import statistics
+import time
+
+from gomi_rag import ollama_client
+from gomi_rag.ollama_client import ModelConfig
+
+from gomi_rag.prompt_builder import STATIC_PREFIX, build_messages, build_user_message
+from gomi_rag import load_jsonl, extract_eval_stats
+
+
+def _context_for(row: dict) -> str:
+    return f"品名: {row.get('品名','')}\n出し方: {row.get('出し方','')}\n備考: {row.get('備考','')}"
+
+
+def _mixed_messages(context: str, question: str) -> list:
+    """可変部分を先頭に置いた、従来型に近い並び"""
+    return [{
+        "role": "user",
+        "content": f"【ごみ分別情報】\n{context}\n\n{STATIC_PREFIX}\n【質問】\n{question}\n",
+    }]
+
+
+def run(model: str, n: int, seed: int):
+    _, gomi_meta = load_jsonl("rag_docs_merged.jsonl", key="品名")
+    random.seed(seed)
+    rows = random.sample(gomi_meta, n)
+
+    results = {"prefix": [], "mixed": []}
+    for layout in ("mixed", "prefix"):
+        print(f"\n▶ layout={layout}")
+        for i, row in enumerate(rows, 1):
+            context = _context_for(row)
+            question = f"{row.get('品名','')}の捨て方を教えてください"
+            if layout == "prefix":
+                messages = build_messages(build_user_message(context, question))
+            else:
+                messages = _mixed_messages(context, question)
+
+            start = time.perf_counter()
+            res = ollama_client.chat(model=model, messages=messages, options={"num_predict": 1})
+            wall_ms = (time.perf_counter() - start) * 1000
+            stats = extract_eval_stats(res, model=model)
+            results[layout].append(stats)
+            print(f"  [{i:2d}] prompt_tokens={stats['prompt_tokens']} "
+                  f"prompt_eval={stats['prompt_eval_ms']}ms wall={wall_ms:.0f}ms")
+
+    print("\n" + "=" * 60)
+    print(f"{'layout':<8} | {'prompt_eval p50(ms)':>20} | {'mean(ms)':>10} | {'prompt_tokens':>14}")
+    print("-" * 60)
+    summary = {}
+    for layout, stats in results.items():
+        # 1件目はキャッシュが温まっていないので除外
+        evals = [s["prompt_eval_ms"] or 0 for s in stats[1:]]
+        tokens = [s["prompt_tokens"] or 0 for s in stats[1:]]
+        summary[layout] = {
+            "prompt_eval_p50_ms": statistics.median(evals) if evals else None,
+            "prompt_eval_mean_ms": statistics.mean(evals) if evals else None,
+            "prompt_tokens_mean": statistics.mean(tokens) if tokens else None,
+        }
+        s = summary[layout]
+        print(f"{layout:<8} | {s['prompt_eval_p50_ms'] or 0:>20.1f} | "
+              f"{s['prompt_eval_mean_ms'] or 0:>10.1f} | {s['prompt_tokens_mean'] or 0:>14.1f}")
+    print("=" * 60)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="プロンプトプレフィックスの KV キャッシュ効果測定")
+    parser.add_argument("--model", default=ModelConfig.ANSWER)
+    parser.add_argument("-n", type=int, default=10, help="レイアウトごとのリクエスト数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="サマリを JSON で出力")
+    args = parser.parse_args()
+
+    summary = run(args.model, args.n, args.seed)
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
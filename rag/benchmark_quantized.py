@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+量子化ベクトル層のベンチマーク（gomi_rag.quantized）
+
+float32 の全件検索を基準に、int8 / binary の走査 ＋ float 再ランクについて
+    - recall@k        基準の上位 k 件のうち返せた割合
+    - p50 / p99       1 クエリあたりの検索時間
+    - 100k チャンクあたりのメモリ  走査で常駐する配列（float は全件走査、量子化はコードのみ）
+を再ランク倍率ごとに測る。
+
+コーパス:
+    --collection knowledge   Chroma のコレクションから埋め込みを読み出す
+    --synthetic 100000       ランダムな単位ベクトル（クラスタ構造あり。ruri-large と同じ 1024 次元）
+
+クエリはコーパスから抽出した行にノイズを加えて正規化したもの（自分自身が自明に一致しないように）。
+
+使い方:
+    python benchmark_quantized.py --synthetic 100000
+    python benchmark_quantized.py --collection knowledge --rerank 1 4 8 16
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from gomi_rag.quantized import CODES, build_scanner, search
+from gomi_rag.shared import vector_distances
+
+PER = 100_000
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def normalize(x):
+    return x / np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), 1e-12)
+
+
+def synthetic_corpus(n: int, dim: int, clusters: int, spread: float, rng) -> np.ndarray:
+    """クラスタ中心の周りに散らした単位ベクトル（実際の文書埋め込みに近い偏りを持たせる）"""
+    centers = normalize(rng.standard_normal((clusters, dim)).astype(np.float32))
+    labels = rng.integers(0, clusters, n)
+    noise = rng.standard_normal((n, dim)).astype(np.float32) / np.sqrt(dim)
+    return normalize(centers[labels] + spread * noise)
+
+
+def load_collection(name: str, persist_dir: str):
+    from gomi_rag import store
+
+    collection = store.get_collection(name, persist_dir)
+    res = collection.get(include=["embeddings"])
+    return np.asarray(res["embeddings"], dtype=np.float32), store.collection_space(collection)
+
+
+def exact(matrix, queries, k: int, space: str):
+    sq_norms = np.einsum("ij,ij->i", matrix, matrix)
+    latencies, truth = [], []
+    for q in queries:
+        t = time.perf_counter()
+        dist = vector_distances(q[None, :], matrix, space, sq_norms)[0]
+        top = np.argpartition(dist, k - 1)[:k]
+        latencies.append((time.perf_counter() - t) * 1000)
+        truth.append(set(top.tolist()))
+    return truth, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="int8 / binary 量子化 ＋ float 再ランクの recall・速度・メモリ")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--collection", help="Chroma のコレクション名")
+    source.add_argument("--synthetic", type=int, default=100_000, help="合成コーパスの件数")
+    parser.add_argument("--persist-dir", help="embedded モードの保存先")
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--spread", type=float, default=1.0, help="クラスタ内のばらつき（1.0 で中心との cos ≈ 0.7）")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.3, help="クエリに加えるノイズ（コーパス行に対する比）")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--rerank", type=int, nargs="+", default=[1, 4, 8, 16], help="再ランク倍率（候補 = k × 倍率）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="benchmark_quantized.json", help="結果の保存先")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.collection:
+        matrix, space = load_collection(args.collection, args.persist_dir)
+        label = args.collection
+    else:
+        matrix, space = synthetic_corpus(args.synthetic, args.dim, args.clusters, args.spread, rng), "cosine"
+        label = f"synthetic({args.synthetic})"
+    n, dim = matrix.shape
+    picks = rng.choice(n, size=min(args.queries, n), replace=False)
+    noise = rng.standard_normal((len(picks), dim)).astype(np.float32) / np.sqrt(dim)
+    queries = normalize(matrix[picks] + args.noise * noise)
+    print(f"📥 {label}: {n} 件 × {dim} 次元 | space={space} | クエリ {len(queries)} 件 | k={args.k}")
+
+    truth, latencies = exact(matrix, queries, args.k, space)
+    float_bytes = dim * 4
+    results = [{
+        "tier": "float32",
+        "rerank": None,
+        "recall": 1.0,
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "scan_mb_per_100k": round(float_bytes * PER / 1e6, 1),
+    }]
+    print(f"{'tier':<8} {'rerank':>6} | {'recall':>7} {'p50':>9} {'p99':>9} | {'走査MB/100k':>11}")
+    print(f"{'float32':<8} {'-':>6} | {1.0:>7.4f} {results[0]['p50_ms']:>7.3f}ms {results[0]['p99_ms']:>7.3f}ms | "
+          f"{results[0]['scan_mb_per_100k']:>10.1f}")
+
+    for kind in CODES:
+        t = time.perf_counter()
+        scanner = build_scanner(kind, matrix)
+        build_s = time.perf_counter() - t
+        mb_per_100k = round(scanner.nbytes / n * PER / 1e6, 1)
+        for factor in args.rerank:
+            latencies, recalls = [], []
+            for q, expected in zip(queries, truth):
+                t = time.perf_counter()
+                top, _ = search(scanner, matrix, space, q, args.k, factor)
+                latencies.append((time.perf_counter() - t) * 1000)
+                recalls.append(len(set(top.tolist()) & expected) / len(expected))
+            r = {
+                "tier": kind,
+                "rerank": factor,
+                "recall": round(sum(recalls) / len(recalls), 4),
+                "p50_ms": round(percentile(latencies, 0.50), 3),
+                "p99_ms": round(percentile(latencies, 0.99), 3),
+                "scan_mb_per_100k": mb_per_100k,
+                "build_s": round(build_s, 2),
+            }
+            results.append(r)
+            print(f"{kind:<8} {factor:>6} | {r['recall']:>7.4f} {r['p50_ms']:>7.3f}ms {r['p99_ms']:>7.3f}ms | "
+                  f"{mb_per_100k:>10.1f}")
+
+    print(f"\n📊 float32 の埋め込み（再ランク用、mmap）: {float_bytes * PER / 1e6:.1f}MB/100k（ディスク上。候補の行だけ読む）")
+    report = {
+        "corpus": label,
+        "count": n,
+        "dim": dim,
+        "space": space,
+        "k": args.k,
+        "num_queries": len(queries),
+        "float_file_mb_per_100k": round(float_bytes * PER / 1e6, 1),
+        "results": results,
+    }
+    Path(args.out).write_text(json.dumps(report, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    print(f"✅ 保存: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+ベクトル DB 接続モードのベンチマーク（CHROMA_MODE=embedded / http）
+
+同じコレクションに対して、各モードで
+    - 逐次クエリのレイテンシ（p50 / p99 / 平均）
+    - 同時実行数ごとのスループット（スレッドでクエリを並列に投げる）
+を測る。クエリにはコレクションに保存済みの埋め込みを使う（Embedding の時間は含めない）。
+
+http モードは事前に同じデータで Chroma サーバを起動しておく:
+    chroma run --path ../backend/chroma_db --port 8001
+
+使い方:
+    python benchmark_vectorstore.py
+    python benchmark_vectorstore.py --modes embedded http --collection gomi --concurrency 1 4 16
+"""
+
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from gomi_rag import store
+
+DEFAULT_PERSIST_DIR = Path(__file__).resolve().parent.parent / "backend" / "chroma_db"
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def sample_queries(collection_name: str, persist_dir: str, limit: int) -> list:
+    """embedded モードでコレクションから埋め込みを取り出してクエリに使う"""
+    store.StoreConfig.MODE = "embedded"
+    collection = store.get_collection(collection_name, persist_dir)
+    res = collection.get(limit=limit, include=["embeddings"])
+    return [list(map(float, e)) for e in res["embeddings"]]
+
+
+def run_mode(mode: str, collection_name: str, persist_dir: str, queries: list,
+             n_results: int, concurrency: list) -> dict:
+    store.StoreConfig.MODE = mode
+    collection = store.get_collection(collection_name, persist_dir)
+
+    def one(embedding):
+        t = time.perf_counter()
+        collection.query(query_embeddings=[embedding], n_results=n_results)
+        return (time.perf_counter() - t) * 1000
+
+    one(queries[0])  # 接続・インデックス読み込みを計測から外す
+    latencies = [one(q) for q in queries]
+    result = {
+        "mode": mode,
+        "count": collection.count(),
+        "queries": len(queries),
+        "p50_ms": round(percentile(latencies, 0.50), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "mean_ms": round(sum(latencies) / len(latencies), 2),
+        "throughput": {},
+    }
+    for workers in concurrency:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            t = time.perf_counter()
+            lat = list(pool.map(one, queries))
+            elapsed = time.perf_counter() - t
+        result["throughput"][workers] = {
+            "qps": round(len(queries) / elapsed, 1),
+            "p99_ms": round(percentile(lat, 0.99), 2),
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chroma の embedded / http モードのレイテンシ・スループット比較")
+    parser.add_argument("--modes", nargs="+", default=["embedded", "http"], choices=["embedded", "http"])
+    parser.add_argument("--collection", default="gomi")
+    parser.add_argument("--persist-dir", default=str(DEFAULT_PERSIST_DIR), help="embedded モードの保存先")
+    parser.add_argument("--queries", type=int, default=200, help="クエリ数")
+    parser.add_argument("--n-results", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--out", default="benchmark_vectorstore.json", help="結果の保存先")
+    args = parser.parse_args()
+
+    queries = sample_queries(args.collection, args.persist_dir, args.queries)
+    print(f"📥 {args.collection}: クエリ {len(queries)} 件（保存済みの埋め込み）")
+
+    results = []
+    for mode in args.modes:
+        try:
+            r = run_mode(mode, args.collection, args.persist_dir, queries, args.n_results, args.concurrency)
+        except Exception as e:
+            print(f"{mode:<9} ⚠️ {type(e).__name__}: {e}")
+            continue
+        results.append(r)
+        print(f"{mode:<9} p50 {r['p50_ms']:>7.2f}ms | p99 {r['p99_ms']:>7.2f}ms | 平均 {r['mean_ms']:>7.2f}ms")
+        for workers, t in r["throughput"].items():
+            print(f"{'':<9} 同時 {workers:>3}: {t['qps']:>8.1f} qps | p99 {t['p99_ms']:>7.2f}ms")
+
+    Path(args.out).write_text(json.dumps(results, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    print(f"✅ 保存: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,14 +6,14 @@ Hybrid系统调试工具
 
 import sys
 from pathlib import Path
-from hybrid_grounding import (
+from gomi_rag.hybrid_grounding import (
     hybrid_grounding,
     path_a_global_embedding,
     path_b_llm_filter,
     format_grounding_result,
     HybridConfig
 )
-from rag_demo3 import load_jsonl, build_chroma
+from gomi_rag import load_jsonl, build_chroma
 
 
 def debug_input(user_input: str, verbose: bool = True):
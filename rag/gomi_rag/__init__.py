@@ -0,0 +1,59 @@
+"""
+gomi_rag — ごみ分別 RAG パイプラインのライブラリ
+
+    loaders     JSONL 読み込み（標準ライブラリのみ）
+    snapshot    JSONL のバイナリスナップショット（mmap）
+    shared      ワーカー間で共有する読み取り専用テーブル・埋め込み行列
+    quantized   ナレッジ用の量子化ベクトル層（int8 / binary ＋ float 再ランク）
+    store       ChromaDB の接続（embedded / http）・構築・検索
+    grounding   品名（Hybrid Grounding）・町名の抽出
+    prompt      コンテキスト整形
+    retrieval   rag_retrieve_extended（検索 → ユーザメッセージ）
+    generation  Ollama による回答生成・評価カウンタ
+
+    hybrid_grounding  Hybrid 品名指称（路径A / 路径B・別名表）
+    context_packer    コンテキストのトークン予算内への詰め込み
+    embedding         Embedding のマイクロバッチ化（Chroma の embedding function）
+    ollama_client     プロセス共通の Ollama クライアント・モデル設定
+    prompt_builder    固定プレフィックス（KV キャッシュ再利用）とユーザメッセージの組み立て
+
+import 時の副作用はない（DB 接続・MeCab・スレッドプールは初回使用時に作る）。
+パッケージ直下の名前は初回アクセス時に該当モジュールを import する。
+パッケージ内は相対 import のみ（rag/ を sys.path に入れるのは gomi_rag 自体を import するため）。
+"""
+
+import importlib
+
+_EXPORTS = {
+    "load_jsonl": "loaders",
+    "area_names": "loaders",
+    "get_client": "store",
+    "get_collection": "store",
+    "build_chroma": "store",
+    "query_chroma": "store",
+    "extract_nouns": "grounding",
+    "extract_keywords_hybrid": "grounding",
+    "format_gomi_context": "prompt",
+    "format_area_context": "prompt",
+    "format_knowledge_context": "prompt",
+    "rag_retrieve_extended": "retrieval",
+    "GenerationTimeout": "generation",
+    "StreamCounter": "generation",
+    "ask_ollama": "generation",
+    "extract_eval_stats": "generation",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
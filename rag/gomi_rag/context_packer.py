@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+トークン予算つきコンテキストパッカー
+
+rag_retrieve_extended は検索ヒットをすべてプロンプトに連結していたため、
+ナレッジコレクションが返すもの（chunk_csv の 50 行 to_string、chunk_pdf の 500 文字片など）
+次第でプロンプト評価時間が大きくぶれていた。
+
+ここではヒットごとにトークン数を見積もり、重なったチャンクを除去し、
+関連度の高い順に予算（CONTEXT_TOKEN_BUDGET）まで詰める。
+"""
+
+import math
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+
+# ========== 設定 ==========
+
+class PackerConfig:
+    """コンテキストパッカーの設定（環境変数で上書き可）"""
+
+    # コンテキスト全体のトークン予算（固定プレフィックス・質問文は含まない）
+    BUDGET_TOKENS = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+
+    # 見積もり係数: 日本語（非 ASCII）は何文字で 1 トークンか / ASCII は 4 文字で 1 トークン
+    CHARS_PER_TOKEN_JA = float(os.getenv("CONTEXT_CHARS_PER_TOKEN_JA", "1.3"))
+    CHARS_PER_TOKEN_ASCII = 4.0
+
+    # 文字 n-gram の Jaccard 係数がこれ以上なら重複チャンクとみなす
+    DUPLICATE_JACCARD = 0.6
+    SHINGLE_SIZE = 3
+
+    # 予算が足りないとき、残りがこのトークン数以上ならナレッジを切り詰めて入れる
+    MIN_TRUNCATED_TOKENS = 64
+
+    # セクションの出力順と見出し
+    SECTIONS = {
+        "gomi": "【ごみ分別情報】",
+        "knowledge": "【ユーザナレッジ情報】",
+        "area": "【町名情報】",
+    }
+
+
+# ========== 見積もり ==========
+
+def estimate_tokens(text: str) -> int:
+    """
+    トークン数の近似（トークナイザを読み込まずに済むよう文字種で見積もる）。
+    実測値（Ollama の prompt_eval_count）と比べて係数を調整できる。
+    """
+    if not text:
+        return 0
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    other = len(text) - ascii_chars
+    return math.ceil(other / PackerConfig.CHARS_PER_TOKEN_JA + ascii_chars / PackerConfig.CHARS_PER_TOKEN_ASCII)
+
+
+def _truncate_to_tokens(text: str, tokens: int) -> str:
+    """見積もりが tokens 以下になるよう末尾を切る"""
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo].rstrip() + "…"
+
+
+def _shingles(text: str) -> set:
+    text = "".join(text.split())
+    n = PackerConfig.SHINGLE_SIZE
+    return {text[i:i + n] for i in range(max(1, len(text) - n + 1))}
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+# ========== パッキング ==========
+
+@dataclass
+class ContextItem:
+    """コンテキスト候補 1 件"""
+    section: str            # "gomi" | "knowledge" | "area"
+    text: str               # プロンプトに入れる整形済みテキスト
+    score: float = 0.0      # 関連度（類似度）。高いほど先に入れる
+    required: bool = False  # 予算に関係なく入れる（Grounding 済みの品名・町名）
+    tokens: int = field(init=False)
+
+    def __post_init__(self):
+        self.tokens = estimate_tokens(self.text)
+
+
+@dataclass
+class PackResult:
+    """パッキング結果"""
+    sections: Dict[str, List[str]]
+    tokens: int
+    budget: int
+    included: int = 0
+    dropped: int = 0
+    deduped: int = 0
+    truncated: int = 0
+
+    def render(self) -> str:
+        parts = []
+        for section, header in PackerConfig.SECTIONS.items():
+            texts = self.sections.get(section)
+            if texts:
+                parts.append(header + "\n" + "\n\n".join(texts))
+        return "\n\n".join(parts)
+
+    def summary(self) -> dict:
+        return {
+            "tokens_est": self.tokens,
+            "budget": self.budget,
+            "included": self.included,
+            "dropped": self.dropped,
+            "deduped": self.deduped,
+            "truncated": self.truncated,
+        }
+
+
+def pack_context(items: List[ContextItem], budget: Optional[int] = None) -> PackResult:
+    """
+    必須の候補を先に、それ以外は関連度の高い順に予算まで詰める。
+    既に入れた候補と内容が重なる候補（同じ品名の重複・オーバーラップしたチャンク）は除く。
+    """
+    budget = PackerConfig.BUDGET_TOKENS if budget is None else budget
+    ordered = sorted(items, key=lambda it: (not it.required, -it.score))
+
+    result = PackResult(sections={}, tokens=0, budget=budget)
+    chosen_shingles = []
+    for item in ordered:
+        shingles = _shingles(item.text)
+        if any(_jaccard(shingles, s) >= PackerConfig.DUPLICATE_JACCARD for s in chosen_shingles):
+            result.deduped += 1
+            continue
+
+        text, tokens = item.text, item.tokens
+        remaining = budget - result.tokens
+        if not item.required and tokens > remaining:
+            # ナレッジの長いチャンクは残り予算に収まるよう切り詰める
+            if item.section == "knowledge" and remaining >= PackerConfig.MIN_TRUNCATED_TOKENS:
+                text = _truncate_to_tokens(text, remaining)
+                tokens = estimate_tokens(text)
+                result.truncated += 1
+            else:
+                result.dropped += 1
+                continue
+
+        result.sections.setdefault(item.section, []).append(text)
+        result.tokens += tokens
+        result.included += 1
+        chosen_shingles.append(shingles)
+    return result
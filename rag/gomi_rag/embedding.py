@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Embedding リクエストのマイクロバッチ化（コアレッサ）
+
+同時に来た複数ユーザのクエリ（路径A・路径B の語句・ナレッジ検索・名詞フォールバック）は
+それぞれ短いテキストを 1 件ずつ Ollama の embed API に送っている。
+数 ms の間に届いたリクエストをまとめて 1 回の embed 呼び出しにし、
+結果のベクトルを待っている呼び出し元へ振り分ける。
+
+Chroma の embedding function の下に置くので、全コレクションのクエリ・追加がこれを通る。
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import List, Optional
+
+import numpy as np
+from chromadb.utils import embedding_functions
+
+from . import ollama_client
+
+
+# ========== 設定 ==========
+
+class EmbeddingConfig:
+    """Embedding 関連の設定"""
+
+    MODEL = os.getenv("EMBED_MODEL", "kun432/cl-nagoya-ruri-large:337m")
+
+    # 0 にするとコアレッサを使わず、呼び出しごとに embed する
+    COALESCE = os.getenv("EMBED_COALESCE", "1") == "1"
+    # 1 回の embed 呼び出しに詰めるテキスト数の上限
+    MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "32"))
+    # 最初のリクエストから後続を待つ最大時間（ms）
+    MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "5"))
+    # 呼び出し元が結果を待つ上限（秒）。Ollama が応答しない・ワーカーが止まった場合に諦める
+    TIMEOUT_SEC = float(os.getenv("EMBED_TIMEOUT_SEC", "60"))
+
+    # バッチ充填数のヒストグラム境界
+    FILL_BUCKETS = [1, 2, 4, 8, 16, 32, 64]
+
+
+# ========== コアレッサ ==========
+
+class EmbeddingCoalescer:
+    """
+    embed(texts) を呼んだスレッドはブロックして待ち、
+    バックグラウンドスレッドが MAX_WAIT_MS 以内に届いた分をまとめて embed する。
+    MAX_BATCH 以上の大きな入力（コレクション構築時の add 等）はそのまま直接 embed する。
+    結果は timeout_sec まで待ち、ワーカーが止まった場合は待っている呼び出しをすべて失敗させる
+    （以降の呼び出しは直接 embed する）。
+    """
+
+    def __init__(self, model: str, max_batch: int, max_wait_ms: float,
+                 timeout_sec: float = EmbeddingConfig.TIMEOUT_SEC):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.timeout = timeout_sec
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "texts": 0, "batches": 0, "batched_texts": 0, "direct": 0, "errors": 0, "cold_loads": 0}
+        self._fill_counts = [0] * (len(EmbeddingConfig.FILL_BUCKETS) + 1)
+        self._worker = threading.Thread(target=self._run, name="embed-coalescer", daemon=True)
+        self._worker.start()
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["texts"] += len(texts)
+        if len(texts) >= self.max_batch or not self._worker.is_alive():
+            with self._lock:
+                self._stats["direct"] += 1
+            return self._embed_now(texts)
+
+        future: Future = Future()
+        self._queue.put((list(texts), future))
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # まだバッチに取り込まれていなければ取り消す（ワーカー側で読み飛ばす）
+            future.cancel()
+            with self._lock:
+                self._stats["errors"] += 1
+            raise TimeoutError(f"embed が {self.timeout}s 以内に終わりませんでした") from None
+
+    def _embed_now(self, texts: List[str]) -> List[List[float]]:
+        res = ollama_client.embed(self.model, texts)
+        if ollama_client.is_cold_load(res):
+            with self._lock:
+                self._stats["cold_loads"] += 1
+        return res["embeddings"]
+
+    def _run(self):
+        pending = []
+        try:
+            while True:
+                pending = [self._queue.get()]
+                size = len(pending[0][0])
+                deadline = time.monotonic() + self.max_wait
+
+                # 締め切りまで、またはバッチが埋まるまで後続を集める
+                while size < self.max_batch:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                    pending.append(item)
+                    size += len(item[0])
+
+                self._flush(pending, size)
+                pending = []
+        except BaseException as e:
+            print(f"⚠️ embed コアレッサのワーカーが停止しました（以降は直接 embed）: {e!r}")
+            self._fail_waiting(pending, e)
+            raise
+
+    def _fail_waiting(self, pending: list, error: BaseException):
+        """ワーカー停止時に、取り出し済み・キューに残っている呼び出しをすべて失敗させる"""
+        while True:
+            try:
+                pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for _, future in pending:
+            if not future.done():
+                future.set_exception(RuntimeError(f"embed コアレッサのワーカーが停止しました: {error!r}"))
+
+    def _flush(self, pending: list, size: int):
+        # 待ち時間切れで取り消された呼び出しは除く
+        pending = [(item, future) for item, future in pending if future.set_running_or_notify_cancel()]
+        if not pending:
+            return
+        size = sum(len(item) for item, _ in pending)
+        texts = [t for item, _ in pending for t in item]
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["batched_texts"] += size
+            idx = next(
+                (i for i, b in enumerate(EmbeddingConfig.FILL_BUCKETS) if size <= b),
+                len(EmbeddingConfig.FILL_BUCKETS),
+            )
+            self._fill_counts[idx] += 1
+        try:
+            vectors = self._embed_now(texts)
+        except Exception as e:
+            with self._lock:
+                self._stats["errors"] += 1
+            for _, future in pending:
+                future.set_exception(e)
+            return
+
+        offset = 0
+        for item, future in pending:
+            future.set_result(vectors[offset:offset + len(item)])
+            offset += len(item)
+
+    def stats(self) -> dict:
+        """バッチ充填率などの集計（/api/metrics 用）"""
+        with self._lock:
+            s = dict(self._stats)
+            fill = list(self._fill_counts)
+        labels = [f"le_{b}" for b in EmbeddingConfig.FILL_BUCKETS] + ["le_inf"]
+        avg_size = s["batched_texts"] / s["batches"] if s["batches"] else None
+        return {
+            **s,
+            "model": self.model,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "calls_per_batch": round((s["calls"] - s["direct"]) / s["batches"], 2) if s["batches"] else None,
+            "avg_batch_size": round(avg_size, 2) if avg_size is not None else None,
+            "fill_ratio": round(avg_size / self.max_batch, 3) if avg_size is not None else None,
+            "batch_fill": dict(zip(labels, fill)),
+        }
+
+
+# ========== Chroma 用 embedding function ==========
+
+class KeepAliveOllamaEmbeddingFunction(embedding_functions.OllamaEmbeddingFunction):
+    """
+    OllamaEmbeddingFunction と同じ設定名で保存され、呼び出しはプロセス共通のクライアント
+    （ollama_client.embed、keep_alive を明示）で 1 回ずつ embed する。
+    Chroma 標準の実装は keep_alive を送らないため、静かな時間帯にモデルが VRAM から追い出される。
+    """
+
+    def __init__(self, model: str = EmbeddingConfig.MODEL, **kwargs):
+        super().__init__(model_name=model, **kwargs)
+        self._model = model
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        return ollama_client.embed(self._model, texts)["embeddings"]
+
+    def __call__(self, input):
+        return [np.array(v, dtype=np.float32) for v in self._embed(list(input))]
+
+
+class CoalescingOllamaEmbeddingFunction(KeepAliveOllamaEmbeddingFunction):
+    """KeepAliveOllamaEmbeddingFunction の呼び出しをコアレッサ経由でまとめる"""
+
+    def __init__(self, coalescer: EmbeddingCoalescer, **kwargs):
+        super().__init__(coalescer.model, **kwargs)
+        self._coalescer = coalescer
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        return self._coalescer.embed(texts)
+
+
+_coalescer: Optional[EmbeddingCoalescer] = None
+_embedding_function = None
+_init_lock = threading.Lock()
+
+
+def get_coalescer() -> EmbeddingCoalescer:
+    """プロセス共通のコアレッサ"""
+    global _coalescer
+    with _init_lock:
+        if _coalescer is None:
+            _coalescer = EmbeddingCoalescer(
+                EmbeddingConfig.MODEL, EmbeddingConfig.MAX_BATCH, EmbeddingConfig.MAX_WAIT_MS
+            )
+    return _coalescer
+
+
+def get_embedding_function():
+    """
+    全コレクション共通の embedding function（どちらも keep_alive を付けて embed する）。
+    EMBED_COALESCE=0 の場合はコアレッサを通さず 1 回ずつ embed する。
+    """
+    global _embedding_function
+    if _embedding_function is None:
+        if EmbeddingConfig.COALESCE:
+            _embedding_function = CoalescingOllamaEmbeddingFunction(get_coalescer())
+        else:
+            _embedding_function = KeepAliveOllamaEmbeddingFunction(EmbeddingConfig.MODEL)
+    return _embedding_function
+
+
+def embedding_stats() -> Optional[dict]:
+    """コアレッサ未使用なら None"""
+    return _coalescer.stats() if _coalescer else None
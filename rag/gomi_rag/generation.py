@@ -0,0 +1,252 @@
+"""
+Ollama による回答生成と評価カウンタの取り出し
+"""
+
+import queue
+import threading
+import time
+
+from . import ollama_client
+from .ollama_client import ModelConfig, GenerationConfig, generation_options, is_cold_load
+from .prompt_builder import build_messages, SectionTracker, trim_to_sections
+
+
+class _Upstream:
+    """ストリームを読むスレッドの終了通知（終わるまで Ollama 側の生成は続いている）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._callbacks = []
+
+    def stopped(self):
+        with self._lock:
+            self._stopped = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def when_stopped(self, callback):
+        with self._lock:
+            if not self._stopped:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+
+class StreamCounter:
+    """
+    ストリームで届いたトークン（content のあるイベント）の数と時刻を数える。
+    最終イベント（done=True）を待たずに止めた場合（早期停止・切断）は
+    評価カウンタが届かないので、final_event() を extract_eval_stats() に渡す。
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.start = time.perf_counter()
+        self.first_at = None
+        self.last_at = None
+        self.tokens = 0
+
+    def seen(self, event):
+        if not event.get("message", {}).get("content"):
+            return
+        now = time.perf_counter()
+        if self.first_at is None:
+            self.first_at = now
+        self.last_at = now
+        self.tokens += 1
+
+    def final_event(self, done_reason):
+        """
+        ここまでの観測から Ollama の最終イベントと同じ形の dict を作る。
+        prompt_eval_duration は最初のトークンまでの時間（ロード待ちを含む）、
+        eval_duration はトークン間隔の平均 × トークン数。prompt_eval_count は分からない。
+        """
+        event = {
+            "model": self.model,
+            "done_reason": done_reason,
+            "eval_count": self.tokens,
+            "total_duration": int((time.perf_counter() - self.start) * 1e9),
+            "estimated": True,
+        }
+        if self.first_at is not None:
+            event["prompt_eval_duration"] = int((self.first_at - self.start) * 1e9)
+            if self.tokens > 1:
+                interval = (self.last_at - self.first_at) / (self.tokens - 1)
+                event["eval_duration"] = int(interval * self.tokens * 1e9)
+        return event
+
+
+class GenerationTimeout(TimeoutError):
+    """生成が deadline_sec を超えたため中断した（partial に途中までの出力）"""
+
+    def __init__(self, partial, elapsed_ms, upstream=None):
+        super().__init__(f"generation exceeded deadline after {elapsed_ms:.0f}ms")
+        self.partial = partial
+        self.elapsed_ms = elapsed_ms
+        self._upstream = upstream
+
+    def when_stopped(self, callback):
+        """
+        Ollama への接続が閉じられた（生成が止まった）ら callback を呼ぶ（読み取りスレッドから）。
+        期限切れの時点ではまだ生成中のことがあるので、LLM の実行枠はこれで解放する。
+        """
+        if self._upstream is None:
+            callback()
+        else:
+            self._upstream.when_stopped(callback)
+
+
+def ask_ollama(rag_prompt, model=None, return_stats=False, deadline_sec=None, endpoint="respond"):
+    """
+    Ollama モデルに RAG プロンプトを渡して応答を返す。
+    system プロンプトは prompt_builder.STATIC_PREFIX で固定（KV キャッシュ再利用のため）。
+
+    生成上限（num_predict / num_ctx / stop）は ollama_client.generation_options(endpoint)。
+    return_stats=True の場合は (応答本文, extract_eval_stats() の結果) を返す。
+    deadline_sec を指定すると内部で stream=True を使い、期限を過ぎた時点で
+    Ollama への接続を閉じて生成を止め、GenerationTimeout を送出する。
+    ストリーミング時は【出力形式】の4項目を出し終えた時点でも生成を止める。
+    """
+    # 固定プレフィックス（system）＋ 可変部分（user）の順。prompt_builder 参照
+    model = model or ModelConfig.ANSWER
+    messages = build_messages(rag_prompt)
+    options = generation_options(endpoint)
+    stop_reason = None
+    if deadline_sec is None:
+        res = ollama_client.chat(model=model, messages=messages, options=options)
+        content = res["message"]["content"]
+        if GenerationConfig.EARLY_STOP:
+            trimmed = trim_to_sections(content)
+            if trimmed != content:
+                content, stop_reason = trimmed, "sections"
+    else:
+        content, res, stop_reason = _chat_with_deadline(model, messages, deadline_sec, options)
+
+    if return_stats:
+        stats = extract_eval_stats(res, model=model)
+        stats["stop_reason"] = stop_reason or stats["stop_reason"]
+        return content, stats
+    return content
+
+
+def _chat_with_deadline(model, messages, deadline_sec, options=None):
+    """
+    stream=True で生成し、期限を過ぎたら接続を閉じて中断する。
+    4項目を出し終えた場合（SectionTracker）も同様に接続を閉じる。
+
+    ストリームは別スレッドで読み、こちらは残り時間をタイムアウトにしてイベントを待つ。
+    プロンプト評価中やトークン間で Ollama が止まっても期限で GenerationTimeout になる。
+    読み取り側は次のイベントが届いた時点（遅くとも OllamaConfig.TIMEOUT）で接続を閉じ、
+    そこで Ollama の生成が止まる。それまでは GPU を使っているので、呼び出し側は
+    GenerationTimeout.when_stopped で LLM の実行枠を解放する。
+    早期停止で最終イベントが届かない場合は StreamCounter の推定値を最終イベントとする。
+    Returns: (全文, 最終イベント, 早期停止なら "sections")
+    """
+    start = time.perf_counter()
+    counter = StreamCounter(model)
+    events = queue.Queue()
+    cancelled = threading.Event()
+    upstream = _Upstream()
+
+    def pump():
+        stream = None
+        try:
+            stream = ollama_client.chat(model=model, messages=messages, stream=True, options=options)
+            for event in stream:
+                if cancelled.is_set():
+                    break
+                events.put(("event", event))
+        except Exception as e:
+            events.put(("error", e))
+        finally:
+            # ジェネレータを閉じると HTTP 接続が切れ、Ollama 側の生成も止まる
+            if stream is not None:
+                stream.close()
+            events.put(("end", None))
+            upstream.stopped()
+
+    threading.Thread(target=pump, name="ollama-deadline", daemon=True).start()
+    tracker = SectionTracker() if GenerationConfig.EARLY_STOP else None
+    parts = []
+    final = {}
+    stop_reason = None
+    try:
+        while True:
+            remaining = deadline_sec - (time.perf_counter() - start)
+            try:
+                kind, event = events.get(timeout=max(0.0, remaining))
+            except queue.Empty:
+                raise GenerationTimeout("".join(parts), (time.perf_counter() - start) * 1000, upstream)
+            if kind == "end":
+                break
+            if kind == "error":
+                raise event
+            counter.seen(event)
+            content = event.get("message", {}).get("content", "")
+            if tracker:
+                content, stop = tracker.feed(content)
+                parts.append(content)
+                if stop:
+                    stop_reason = "sections"
+                    final = counter.final_event(stop_reason)
+                    break
+            else:
+                parts.append(content)
+            if event.get("done"):
+                final = event
+                break
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if elapsed_ms > deadline_sec * 1000:
+                raise GenerationTimeout("".join(parts), elapsed_ms, upstream)
+        if tracker:
+            parts.append(tracker.finish())
+    finally:
+        cancelled.set()
+    return "".join(parts), final, stop_reason
+
+
+def extract_eval_stats(res, model=None):
+    """
+    Ollama の最終メッセージ（chat の応答 / stream の done=True イベント）から
+    トークン数と評価時間を取り出す。
+
+    prompt_eval_* はプロンプト評価（入力側）、eval_* は生成（出力側）。
+    *_duration はナノ秒で返ってくるため ms に変換する。
+    値が無い場合は None。
+    """
+    def _get(key):
+        try:
+            return res.get(key)
+        except AttributeError:
+            return getattr(res, key, None)
+
+    def _ms(ns):
+        return round(ns / 1e6, 2) if ns else None
+
+    def _rate(count, ns):
+        return round(count / (ns / 1e9), 2) if count and ns else None
+
+    prompt_tokens = _get("prompt_eval_count")
+    prompt_ns = _get("prompt_eval_duration")
+    output_tokens = _get("eval_count")
+    eval_ns = _get("eval_duration")
+
+    return {
+        "model": model or _get("model"),
+        "prompt_tokens": prompt_tokens,
+        "prompt_eval_ms": _ms(prompt_ns),
+        "prompt_tokens_per_sec": _rate(prompt_tokens, prompt_ns),
+        "output_tokens": output_tokens,
+        "eval_ms": _ms(eval_ns),
+        "tokens_per_sec": _rate(output_tokens, eval_ns),
+        "load_ms": _ms(_get("load_duration")),
+        "total_ms": _ms(_get("total_duration")),
+        # モデルのロードを待った（VRAM から追い出されていた）リクエスト
+        "cold_load": is_cold_load(res),
+        # "stop"（停止条件）/ "length"（num_predict 到達）/ "sections"（4項目で早期停止）
+        "stop_reason": _get("done_reason"),
+        # 最終イベントが届かず StreamCounter で推定した値（prompt_tokens は None）
+        "estimated": bool(_get("estimated")),
+    }
@@ -0,0 +1,80 @@
+"""
+品名・町名の抽出（Hybrid Grounding + 町名の部分一致）
+"""
+
+from .hybrid_grounding import hybrid_grounding, _get_tagger
+
+
+# ========== 形態素解析で名詞を抽出 ==========
+
+def extract_nouns(text):
+    # Tagger はプロセス内で 1 つだけ作る（hybrid_grounding と共有、MeCab は初回に import）
+    node = _get_tagger().parseToNode(text)
+    nouns = []
+    while node:
+        if node.feature.startswith("名詞"):
+            nouns.append(node.surface)
+        node = node.next
+    return [n for n in nouns if n]
+
+
+# ========== 新版：Hybrid Grounding システム ==========
+def extract_keywords_hybrid(user_input, gomi_collection, known_areas=()):
+    """
+    Hybrid Grounding システムを使用した品名・町名抽出
+    - 品名: hybrid_grounding() による高精度な指称解決
+    - 町名: 従来の部分一致検索（変更なし）
+    
+    Args:
+        user_input: ユーザー入力文
+        gomi_collection: ChromaDBのごみ分類collection
+        known_areas: 既知の町名リスト（loaders.area_names(area_meta)）
+        
+    Returns:
+        dict: {"品名": str|None, "町名": str|None, "grounding_result": GroundingResult|None}
+    """
+    keywords = {"品名": None, "町名": None, "grounding_result": None}
+    
+    try:
+        # ===== 品名候補：Hybrid Grounding システム =====
+        grounding_result = hybrid_grounding(user_input, gomi_collection)
+        
+        if grounding_result.primary_candidate:
+            keywords["品名"] = grounding_result.primary_candidate.item_name
+            keywords["grounding_result"] = grounding_result
+            
+            print(f"✅ Hybrid Grounding: {grounding_result.primary_candidate.item_name}")
+            print(f"   置信度: {grounding_result.confidence_level}, 相似度: {grounding_result.primary_candidate.similarity:.3f}")
+            print(f"   使用パス: {grounding_result.path_used}, 耗時: {grounding_result.execution_time_ms:.1f}ms")
+            
+            # 歧義警告
+            if grounding_result.is_ambiguous:
+                print(f"   ⚠️ 歧義検出: Top候補が近い")
+        else:
+            print(f"⚠️ Hybrid Grounding: 品名候補が見つかりませんでした")
+            
+    except Exception as e:
+        # ========== フォールバック：簡易マッチング ==========
+        print(f"⚠️ Hybrid Grounding失敗、フォールバックモード: {e}")
+        
+        try:
+            nouns = extract_nouns(user_input)
+            print(f"   形態素解析名詞: {nouns}")
+            
+            for noun in nouns:
+                if noun:
+                    results = gomi_collection.query(query_texts=[noun], n_results=1)
+                    if results and results["metadatas"] and results["metadatas"][0]:
+                        keywords["品名"] = results["metadatas"][0][0].get("品名")
+                        print(f"   フォールバック成功: {keywords['品名']}")
+                        break
+        except Exception as fallback_error:
+            print(f"   ❌ フォールバックも失敗: {fallback_error}")
+    
+    # ===== 町名候補：従来ロジック（変更なし） =====
+    for area in known_areas:
+        if area and area in user_input:
+            keywords["町名"] = area
+            break
+    
+    return keywords
@@ -6,13 +6,23 @@ Hybrid品名指称模块
 本模块独立于现有RAG系统，可单独测试和验证
 """
 
+from __future__ import annotations
+
 import json
-from typing import List, Dict, Tuple, Optional
-import ollama
-import chromadb
+import os
+import re
+import unicodedata
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Dict, Tuple, Optional
+from . import ollama_client
+from .ollama_client import ModelConfig
+from .store import collection_space, distance_to_similarity
 from dataclasses import dataclass, asdict
 import time
 
+if TYPE_CHECKING:  # 仅用于类型注解（collection由调用方传入）
+    import chromadb
+
 
 # ========== 数据结构定义 ==========
 
@@ -21,7 +31,7 @@ class Candidate:
     """品名候选结构"""
     item_name: str          # 品名
     similarity: float       # 相似度分数
-    source: str            # 来源路径 ("path_a" | "path_b" | "both")
+    source: str            # 来源路径 ("path_a" | "path_b" | "both" | "alias")
     metadata: Dict         # 原始metadata（出し方、備考等）
     
     def to_dict(self):
@@ -36,7 +46,7 @@ class GroundingResult:
     is_ambiguous: bool             # 是否存在歧义
     confidence_level: str          # 置信度级别 ("high" | "medium" | "low")
     execution_time_ms: float       # 执行耗时
-    path_used: str                # 使用的路径 ("both" | "path_a_only" | "degraded")
+    path_used: str                # 使用的路径 ("both" | "path_a_only" | "degraded" | "alias")
     
     def to_dict(self):
         return {
@@ -61,18 +71,146 @@ class HybridConfig:
     PATH_B_MAX_CANDIDATES = 5
     PATH_B_TOP_K = 3
     PATH_B_TIMEOUT = 5  # 秒
+    # 短语提取方式: "llm"（LLM提取）| "mecab"（形态素分析的复合名词切分，不调用LLM）
+    PATH_B_EXTRACTOR = os.getenv("PATH_B_EXTRACTOR", "llm")
+    
+    # MeCab词典（与 gomi_rag.grounding.extract_nouns 相同）
+    MECAB_DIC_DIR = "/var/lib/mecab/dic/debian"
+    # 不作为品名的名词（意图・时间・场所等）
+    MECAB_STOP_NOUNS = {
+        "こと", "もの", "物", "ため", "よう", "とき", "時", "方", "方法", "場合",
+        "引っ越し", "引越し", "処分", "分別", "廃棄", "回収", "収集", "捨て方", "出し方",
+        "ごみ", "ゴミ", "今日", "明日", "今度", "家", "自宅", "部屋", "全部", "中", "前", "後",
+    }
     
     # 快速路径阈值
     SHORT_INPUT_THRESHOLD = 20  # 字符数
     
     # 置信度阈值
+    # 相似度尺度见 store.distance_to_similarity（= 2cos - 1，即旧 l2 索引的 1 - d，各距离空间一致）
     CONFIDENCE_THRESHOLD_HIGH = 0.70   # 高置信度阈值（提高以防止无效输入获得高置信度）
     CONFIDENCE_THRESHOLD_LOW = 0.45    # 低置信度阈值
     AMBIGUITY_THRESHOLD = 0.05         # 歧义判定阈值（Top1与Top2差值）
     
-    # LLM配置
-    LLM_MODEL = "swallow:latest"
+    # LLM配置（短语提取用模型，见 ollama_client.ModelConfig.EXTRACTION）
+    LLM_MODEL = ModelConfig.EXTRACTION
     LLM_TEMPERATURE = 0.1  # 低温度以提高稳定性
+    
+    # 别名表（alias_builder.py 离线生成，仅加载 status=reviewed 的条目）
+    ALIAS_FILE = Path(__file__).resolve().parents[1] / "aliases.json"
+
+
+# ========== 品名索引（精确匹配用，按collection缓存） ==========
+
+_ITEM_INDEX_CACHE: Dict[int, Dict[str, Dict]] = {}
+
+
+def get_item_index(gomi_collection: chromadb.Collection) -> Dict[str, Dict]:
+    """
+    品名 → metadata 的字典。
+    首次调用时从collection读取全部记录，之后复用（避免每次请求都 get() 全表）
+    """
+    key = id(gomi_collection)
+    index = _ITEM_INDEX_CACHE.get(key)
+    if index is None:
+        all_results = gomi_collection.get()
+        index = {
+            meta.get("品名", ""): meta
+            for meta in (all_results.get("metadatas") or [])
+        } if all_results else {}
+        _ITEM_INDEX_CACHE[key] = index
+    return index
+
+
+def clear_item_index():
+    """collection重建后调用，清空品名索引缓存"""
+    _ITEM_INDEX_CACHE.clear()
+
+
+# ========== 别名表（口语表达 → 品名，O(1)查找） ==========
+
+# 句尾的意图表达（「〜を捨てたい」「〜の出し方」等），别名查找前去除
+_REQUEST_TAIL = re.compile(
+    r"(を|は|の|って)?(捨てたい|処分したい|捨てる|処分する|捨て方|出し方|処分方法|分別方法|分別)"
+    r"(んですが|のですが|です|ですか|を教えて(ください)?|は|について)*[?？。!！]*$"
+)
+
+_ALIASES: Optional[Dict[str, str]] = None
+
+
+def normalize_alias(text: str) -> str:
+    """别名键的规范化（NFKC・小写・去空白）"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return re.sub(r"\s+", "", text)
+
+
+def load_aliases(path: Optional[Path] = None) -> Dict[str, str]:
+    """
+    加载别名表（规范化键 → 品名）。只使用人工确认过的条目（status=reviewed）。
+    文件不存在时返回空字典。
+    """
+    path = Path(path or HybridConfig.ALIAS_FILE)
+    if not path.exists():
+        return {}
+    data = json.loads(path.read_text(encoding="utf-8"))
+    return {
+        normalize_alias(alias): entry["品名"]
+        for alias, entry in data.get("aliases", {}).items()
+        if entry.get("status") == "reviewed" and entry.get("品名")
+    }
+
+
+def get_aliases() -> Dict[str, str]:
+    """别名表（进程内只加载一次）"""
+    global _ALIASES
+    if _ALIASES is None:
+        _ALIASES = load_aliases()
+        if _ALIASES:
+            print(f"  别名表: 已加载{len(_ALIASES)}条")
+    return _ALIASES
+
+
+def lookup_alias(
+    text: str,
+    gomi_collection: chromadb.Collection,
+    source: str = "alias"
+) -> Optional[Candidate]:
+    """
+    别名查找：整句 / 去除句尾意图表达后的文本，命中则直接返回品名候选（相似度1.0）
+    """
+    aliases = get_aliases()
+    if not aliases:
+        return None
+    key = normalize_alias(text)
+    for k in (key, _REQUEST_TAIL.sub("", key)):
+        item_name = aliases.get(k)
+        if item_name:
+            meta = get_item_index(gomi_collection).get(item_name)
+            if meta is not None:
+                return Candidate(item_name=item_name, similarity=1.0, source=source, metadata=meta)
+    return None
+
+
+# 无MeCab时粗略切分并列的品名（「スマホと充電器」「スマホ、イヤホン」等）
+_CHUNK_SEPARATORS = re.compile(r"[と、,，・&＆や/／]|および|及び")
+
+
+def other_noun_chunks(user_input: str, item_name: str) -> List[str]:
+    """
+    输入中别名（及品名本身）以外的名词块。
+    用于判断别名命中的输入是否还提到了其他物品。MeCab不可用时按并列助词・标点切分。
+    """
+    try:
+        chunks = _extract_phrases_with_mecab(user_input, HybridConfig.PATH_B_MAX_CANDIDATES)
+    except Exception:
+        text = _REQUEST_TAIL.sub("", normalize_alias(user_input))
+        chunks = [c for c in _CHUNK_SEPARATORS.split(text) if c]
+    aliases = get_aliases()
+    own = normalize_alias(item_name)
+    return [
+        c for c in chunks
+        if normalize_alias(c) != own and aliases.get(normalize_alias(c)) != item_name
+    ]
 
 
 # ========== 路径A：整体Embedding指称 ==========
@@ -94,22 +232,18 @@ def path_a_global_embedding(
         候选列表（Candidate对象）
     """
     try:
-        # 精确匹配检查：获取所有记录检查是否有完全匹配
-        all_results = gomi_collection.get()
-        exact_match_candidate = None
-        
-        if all_results and all_results["metadatas"]:
-            for meta in all_results["metadatas"]:
-                if meta.get("品名", "") == user_input:
-                    # 找到精确匹配，直接返回置信度1.0
-                    exact_match_candidate = Candidate(
-                        item_name=user_input,
-                        similarity=1.0,
-                        source="path_a_exact",
-                        metadata=meta
-                    )
-                    print(f"  路径A: 精确匹配命中 '{user_input}'")
-                    return [exact_match_candidate]
+        # 精确匹配检查：品名索引（缓存）中是否有完全匹配
+        meta = get_item_index(gomi_collection).get(user_input)
+        if meta is not None:
+            # 找到精确匹配，直接返回置信度1.0
+            exact_match_candidate = Candidate(
+                item_name=user_input,
+                similarity=1.0,
+                source="path_a_exact",
+                metadata=meta
+            )
+            print(f"  路径A: 精确匹配命中 '{user_input}'")
+            return [exact_match_candidate]
         
         # 没有精确匹配，执行向量搜索
         results = gomi_collection.query(
@@ -119,10 +253,10 @@ def path_a_global_embedding(
         
         candidates = []
         if results and results["metadatas"] and results["distances"]:
+            space = collection_space(gomi_collection)
             for meta, distance in zip(results["metadatas"][0], results["distances"][0]):
-                # ChromaDB返回的是距离，转换为相似度 (similarity = 1 - distance)
-                # 裁剪到[0,1]范围防止浮点精度问题
-                similarity = max(0.0, min(1.0, 1.0 - distance))
+                # ChromaDB返回的是距离，按collection的距离空间（cosine/l2/ip）换算为相似度，并裁剪到[0,1]
+                similarity = distance_to_similarity(distance, space)
                 
                 candidates.append(Candidate(
                     item_name=meta.get("品名", ""),
@@ -145,36 +279,42 @@ def path_b_llm_filter(
     user_input: str,
     gomi_collection: chromadb.Collection,
     max_candidates: int = HybridConfig.PATH_B_MAX_CANDIDATES,
-    top_k: int = HybridConfig.PATH_B_TOP_K
+    top_k: int = HybridConfig.PATH_B_TOP_K,
+    extractor: Optional[str] = None
 ) -> List[Candidate]:
     """
-    路径B：使用LLM从输入中提取可能的垃圾品名短语，然后分别Embedding匹配
+    路径B：从输入中提取可能的垃圾品名短语，然后分别Embedding匹配
     
     Args:
         user_input: 用户输入文本
         gomi_collection: ChromaDB垃圾分类collection
-        max_candidates: LLM最多提取的候选短语数
+        max_candidates: 最多提取的候选短语数
         top_k: 每个候选短语匹配的Top-K数量
+        extractor: 短语提取方式（"llm" | "mecab"，默认 HybridConfig.PATH_B_EXTRACTOR）
         
     Returns:
         候选列表（Candidate对象）
     """
+    extractor = extractor or HybridConfig.PATH_B_EXTRACTOR
     try:
-        # Step 1: LLM提取候选短语
-        extracted_phrases = _extract_phrases_with_llm(user_input, max_candidates)
+        # Step 1: 提取候选短语
+        if extractor == "mecab":
+            extracted_phrases = _extract_phrases_with_mecab(user_input, max_candidates)
+        else:
+            extracted_phrases = _extract_phrases_with_llm(user_input, max_candidates)
         
         if not extracted_phrases:
-            print(f"  路径B: LLM未提取到候选短语")
+            print(f"  路径B: {extractor}未提取到候选短语")
             return []
         
-        print(f"  路径B: LLM提取到{len(extracted_phrases)}个短语: {extracted_phrases}")
+        print(f"  路径B: {extractor}提取到{len(extracted_phrases)}个短语: {extracted_phrases}")
         
-        # Step 2: 对每个候选短语进行精确匹配和Embedding匹配
+        # Step 2: 对每个候选短语进行精确匹配/别名匹配，其余短语一次性批量Embedding匹配
         all_candidates = []
         
-        # 获取所有记录用于精确匹配检查
-        all_results = gomi_collection.get()
-        all_item_names = {meta.get("品名", ""): meta for meta in all_results["metadatas"]} if all_results else {}
+        # 品名索引用于精确匹配检查
+        all_item_names = get_item_index(gomi_collection)
+        query_phrases = []
         
         for phrase in extracted_phrases:
             # 检查是否精确匹配
@@ -188,23 +328,35 @@ def path_b_llm_filter(
                 print(f"    短语 '{phrase}' 精确匹配")
                 continue
             
-            # 没有精确匹配，执行向量搜索
+            # 别名命中（不需要Embedding）
+            alias_candidate = lookup_alias(phrase, gomi_collection, source=f"alias:{phrase}")
+            if alias_candidate:
+                all_candidates.append(alias_candidate)
+                print(f"    短语 '{phrase}' 别名命中 -> {alias_candidate.item_name}")
+                continue
+            
+            query_phrases.append(phrase)
+        
+        # 没有精确匹配的短语，一次query批量执行向量搜索
+        if query_phrases:
             results = gomi_collection.query(
-                query_texts=[phrase],
+                query_texts=query_phrases,
                 n_results=top_k
             )
             
             if results and results["metadatas"] and results["distances"]:
-                for meta, distance in zip(results["metadatas"][0], results["distances"][0]):
-                    # 裁剪到[0,1]范围防止浮点精度问题
-                    similarity = max(0.0, min(1.0, 1.0 - distance))
-                    
-                    all_candidates.append(Candidate(
-                        item_name=meta.get("品名", ""),
-                        similarity=similarity,
-                        source=f"path_b:{phrase}",  # 记录来源短语
-                        metadata=meta
-                    ))
+                space = collection_space(gomi_collection)
+                for phrase, metas, distances in zip(query_phrases, results["metadatas"], results["distances"]):
+                    for meta, distance in zip(metas, distances):
+                        # 按距离空间换算为相似度，并裁剪到[0,1]
+                        similarity = distance_to_similarity(distance, space)
+                        
+                        all_candidates.append(Candidate(
+                            item_name=meta.get("品名", ""),
+                            similarity=similarity,
+                            source=f"path_b:{phrase}",  # 记录来源短语
+                            metadata=meta
+                        ))
         
         # Step 3: 去重并排序
         unique_candidates = _deduplicate_candidates(all_candidates)
@@ -220,12 +372,85 @@ def path_b_llm_filter(
         return []
 
 
-def _extract_phrases_with_llm(
+_MECAB_TAGGER = None
+
+
+def _get_tagger():
+    """MeCab Tagger（进程内只创建一次）"""
+    global _MECAB_TAGGER
+    if _MECAB_TAGGER is None:
+        import MeCab
+        _MECAB_TAGGER = MeCab.Tagger(f"-r /etc/mecabrc -d {HybridConfig.MECAB_DIC_DIR}")
+    return _MECAB_TAGGER
+
+
+def _is_chunk_token(feature: List[str]) -> bool:
+    """复合名词的构成要素（名词・接头词・英字）"""
+    pos, sub = feature[0], feature[1] if len(feature) > 1 else ""
+    if pos == "名詞":
+        return sub not in ("非自立", "代名詞", "副詞可能")
+    if pos == "接頭詞":
+        return True
+    return pos == "記号" and sub == "アルファベット"
+
+
+def chunk_nouns(tokens: List[Tuple[str, str]]) -> List[str]:
+    """
+    把 (表层形, 词性特征) 序列切分成复合名词块。
+    连续的名词合并为一个块；以接尾词开头的块（「捨て方」的「方」等）不单独成块。
+    """
+    chunks, current = [], []
+    for surface, feature in tokens:
+        fields = feature.split(",")
+        if _is_chunk_token(fields):
+            if not current and fields[0] == "名詞" and len(fields) > 1 and fields[1] == "接尾":
+                continue
+            current.append(surface)
+        else:
+            if current:
+                chunks.append("".join(current))
+            current = []
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+
+def _extract_phrases_with_mecab(
     user_input: str,
     max_candidates: int
+) -> List[str]:
+    """
+    使用MeCab从用户输入中切分复合名词块（不调用LLM）
+    
+    Returns:
+        候选短语列表（最多max_candidates个，去除停用名词和重复）
+    """
+    node = _get_tagger().parseToNode(user_input)
+    tokens = []
+    while node:
+        if node.surface:
+            tokens.append((node.surface, node.feature))
+        node = node.next
+    
+    phrases = []
+    for chunk in chunk_nouns(tokens):
+        if chunk in HybridConfig.MECAB_STOP_NOUNS or chunk in phrases:
+            continue
+        phrases.append(chunk)
+    return phrases[:max_candidates]
+
+
+def _extract_phrases_with_llm(
+    user_input: str,
+    max_candidates: int,
+    model: Optional[str] = None
 ) -> List[str]:
     """
     使用LLM从用户输入中提取可能的垃圾品名短语
+    输出用 format="json" 约束为JSON，不需要解析代码块
+    
+    Args:
+        model: 提取用模型（默认 HybridConfig.LLM_MODEL）
     
     Returns:
         候选短语列表（最多max_candidates个）
@@ -245,8 +470,8 @@ def _extract_phrases_with_llm(
 """
 
     try:
-        response = ollama.chat(
-            model=HybridConfig.LLM_MODEL,
+        response = ollama_client.chat(
+            model=model or HybridConfig.LLM_MODEL,
             messages=[
                 {
                     "role": "system",
@@ -257,34 +482,18 @@ def _extract_phrases_with_llm(
                     "content": prompt
                 }
             ],
+            format="json",
             options={
                 "temperature": HybridConfig.LLM_TEMPERATURE
             }
         )
         
-        content = response["message"]["content"]
-        
-        # JSON解析（複数の形式に対応）
-        # Case 1: 直接JSON
-        if content.strip().startswith("{"):
-            data = json.loads(content)
-            return data.get("candidates", [])[:max_candidates]
-        
-        # Case 2: Markdown code block内のJSON
-        if "```json" in content:
-            json_str = content.split("```json")[1].split("```")[0].strip()
-            data = json.loads(json_str)
-            return data.get("candidates", [])[:max_candidates]
-        
-        # Case 3: 単に```で囲まれている場合
-        if "```" in content:
-            json_str = content.split("```")[1].strip()
-            data = json.loads(json_str)
-            return data.get("candidates", [])[:max_candidates]
-        
-        # Case 4: 解析失敗
-        print(f"⚠️ LLM出力の解析失敗: {content[:100]}")
-        return []
+        data = json.loads(response["message"]["content"])
+        candidates = data.get("candidates", []) if isinstance(data, dict) else []
+        if not isinstance(candidates, list):
+            print(f"⚠️ LLM出力の形式不正: {data}")
+            return []
+        return [c.strip() for c in candidates if isinstance(c, str) and c.strip()][:max_candidates]
         
     except json.JSONDecodeError as e:
         print(f"⚠️ JSON解析エラー: {e}")
@@ -371,7 +580,8 @@ def merge_candidates(
 def hybrid_grounding(
     user_input: str,
     gomi_collection: chromadb.Collection,
-    force_full_path: bool = False
+    force_full_path: bool = False,
+    extractor: Optional[str] = None
 ) -> GroundingResult:
     """
     Hybrid品名指称主函数
@@ -380,12 +590,29 @@ def hybrid_grounding(
         user_input: 用户输入
         gomi_collection: ChromaDB垃圾分类collection
         force_full_path: 强制执行完整双路径（用于测试）
+        extractor: 路径B的短语提取方式（"llm" | "mecab"，默认 HybridConfig.PATH_B_EXTRACTOR）
         
     Returns:
         GroundingResult对象
     """
     start_time = time.perf_counter()
     
+    # 别名表命中：在任何Embedding/LLM处理之前直接确定品名
+    # 输入中还有其他名词块时（可能提到多个物品）降为中置信度，不直接走模板回答
+    alias_candidate = lookup_alias(user_input, gomi_collection)
+    if alias_candidate:
+        others = other_noun_chunks(user_input, alias_candidate.item_name)
+        print(f"⚡ 别名命中: '{user_input}' -> {alias_candidate.item_name}"
+              + (f"（其他名词: {others}）" if others else ""))
+        return GroundingResult(
+            candidates=[alias_candidate],
+            primary_candidate=alias_candidate,
+            is_ambiguous=False,
+            confidence_level="medium" if others else "high",
+            execution_time_ms=(time.perf_counter() - start_time) * 1000,
+            path_used="alias"
+        )
+    
     # 决定是否使用快速路径
     use_fast_path = (
         not force_full_path and 
@@ -407,7 +634,7 @@ def hybrid_grounding(
         
         # 路径B（带降级）
         try:
-            candidates_b = path_b_llm_filter(user_input, gomi_collection)
+            candidates_b = path_b_llm_filter(user_input, gomi_collection, extractor=extractor)
         except Exception as e:
             print(f"⚠️ 路径B失败，降级到路径A: {e}")
             candidates_b = []
@@ -503,20 +730,16 @@ def format_grounding_result(result: GroundingResult) -> str:
 
 if __name__ == "__main__":
     import sys
-    import os
-    
-    # 添加rag目录到路径
-    sys.path.append(os.path.dirname(__file__))
     
     if len(sys.argv) < 2:
-        print("使用方法: python hybrid_grounding.py <用户输入>")
-        print('示例: python hybrid_grounding.py "ノートパソコンを捨てたい"')
+        print("使用方法: python -m gomi_rag.hybrid_grounding <用户输入>")
+        print('示例: python -m gomi_rag.hybrid_grounding "ノートパソコンを捨てたい"')
         sys.exit(1)
     
     user_input = " ".join(sys.argv[1:])
     
     # 加载collection
-    from rag_demo3 import load_jsonl, build_chroma
+    from . import load_jsonl, build_chroma
     
     print("初始化ChromaDB...")
     gomi_docs, gomi_meta = load_jsonl("rag_docs_merged.jsonl", key="品名")
@@ -0,0 +1,44 @@
+"""
+データ読み込み（JSONL / バイナリスナップショット）
+
+標準ライブラリのみ。import 時の副作用なし。
+"""
+
+import json
+
+from . import snapshot
+
+
+# ========== JSONL 読み込み ==========
+def load_jsonl(path, key="品名"):
+    """
+    JSONL ファイルを読み込み、embedding 用の docs とメタデータを返す。
+    key: embedding に使うフィールド名（ごみ: 品名, 町名: 町名）
+
+    元ファイルと一致するスナップショット（<path>.snap、gomi_rag.snapshot でビルド）が
+    あればそれを mmap して使う（meta は行を読むたびに作る遅延シーケンス snapshot.RowSequence）。
+    無い・古い場合は JSONL を読む（meta は dict のリスト）。
+    """
+    snap = snapshot.load_fresh(path, key)
+    if snap is not None:
+        return snap.docs(), snapshot.RowSequence(snap)
+    return _load_jsonl_lines(path, key)
+
+
+def _load_jsonl_lines(path, key):
+    """JSONL を 1 行ずつ json.loads する（スナップショットが使えない場合）"""
+    docs = []
+    meta = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            row = json.loads(line)
+            docs.append(row.get(key, ""))   # embedding 用テキスト
+            meta.append(row)                # 全データを保持
+    return docs, meta
+
+
+def area_names(area_meta):
+    """町名データ（load_jsonl の meta）から町名の一覧を返す"""
+    if hasattr(area_meta, "names"):  # gomi_rag.shared.TableView
+        return list(area_meta.names())
+    return [row.get("町名", "") for row in area_meta or [] if row.get("町名")]
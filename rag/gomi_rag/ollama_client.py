@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+プロセス共通の Ollama クライアント
+
+- ollama.chat 等のモジュール関数は呼び出しごとに既定クライアントを使い、keep_alive も指定しない。
+  静かな時間帯に swallow と ruri が VRAM から追い出され、次のユーザがロード時間を払うことになる。
+- ここでは設定済みのクライアント（HTTP 接続はプール）を 1 つだけ作り、
+  全呼び出しで keep_alive を明示する。
+- 起動時の warmup() で生成モデルと Embedding モデルを事前にロードする。
+- 応答の load_duration が COLD_LOAD_MS を超えたら「コールドロード」とみなす。
+
+使い方:
+    python -m gomi_rag.ollama_client    # 両モデルをロードしてロード時間を表示
+"""
+
+import os
+import threading
+import time
+from typing import Optional
+
+import ollama
+
+from .prompt_builder import STOP_SEQUENCES
+
+
+# ========== 設定 ==========
+
+class OllamaConfig:
+    """Ollama 接続の設定（環境変数で上書き可）"""
+
+    HOST = os.getenv("OLLAMA_HOST") or os.getenv("OLLAMA_BASE_URL") or "http://localhost:11434"
+    # モデルを VRAM に保持する時間（"30m" / 秒数 / "-1" で無期限）
+    KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+    # HTTP タイムアウト（秒）
+    TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "300"))
+
+    # 起動時にモデルを事前ロードするか
+    WARMUP = os.getenv("OLLAMA_WARMUP", "1") == "1"
+    # load_duration がこれを超えたらコールドロード（ms）
+    COLD_LOAD_MS = float(os.getenv("OLLAMA_COLD_LOAD_MS", "500"))
+
+
+class ModelConfig:
+    """タスク別のモデル（環境変数で上書き可）"""
+
+    # 回答生成（models/swallow/Modelfile で固定プレフィックスを焼き込んだモデル）
+    ANSWER = os.getenv("LLM_MODEL_ANSWER") or os.getenv("LLM_MODEL", "swallow:latest")
+    # 路径B の語句抽出。短い JSON を返すだけなので小さいモデル（例: qwen2.5:1.5b）で良い
+    EXTRACTION = os.getenv("LLM_MODEL_EXTRACTION") or ANSWER
+    # 領域判定（ごみ分別以外の質問の拒否）。現状は回答プロンプト内で ANSWER が行う
+    SCREENING = os.getenv("LLM_MODEL_SCREENING") or ANSWER
+
+    @classmethod
+    def all_models(cls) -> list:
+        """ウォームアップ対象（重複なし）"""
+        return list(dict.fromkeys([cls.ANSWER, cls.EXTRACTION, cls.SCREENING]))
+
+
+class GenerationConfig:
+    """
+    回答生成の上限（エンドポイント別）。
+
+    num_ctx はモデルのロード単位なので全エンドポイントで共通にする
+    （値が違うと Ollama がモデルを再ロードする）。
+    """
+
+    NUM_CTX = int(os.getenv("LLM_NUM_CTX", "4096"))
+
+    # 出力トークン数の上限（4項目の回答は通常 200 トークン前後）
+    NUM_PREDICT = {
+        "respond": int(os.getenv("LLM_NUM_PREDICT", "384")),
+        "respond_stream": int(os.getenv("LLM_NUM_PREDICT_STREAM", os.getenv("LLM_NUM_PREDICT", "384"))),
+        "answer_table": int(os.getenv("LLM_NUM_PREDICT_TABLE", "512")),
+    }
+
+    # 4項目を出し終えた時点で生成を止める（prompt_builder.SectionTracker）
+    EARLY_STOP = os.getenv("LLM_EARLY_STOP", "1") == "1"
+
+
+def generation_options(endpoint: str = "respond") -> dict:
+    """回答生成用の options（num_predict / num_ctx / stop）"""
+    return {
+        "num_predict": GenerationConfig.NUM_PREDICT.get(endpoint, GenerationConfig.NUM_PREDICT["respond"]),
+        "num_ctx": GenerationConfig.NUM_CTX,
+        "stop": list(STOP_SEQUENCES),
+    }
+
+
+# ========== クライアント ==========
+
+_client: Optional[ollama.Client] = None
+_async_client: Optional[ollama.AsyncClient] = None
+_lock = threading.Lock()
+
+
+def get_client() -> ollama.Client:
+    """同期クライアント（スレッド間で共有、接続はプールされる）"""
+    global _client
+    with _lock:
+        if _client is None:
+            _client = ollama.Client(host=OllamaConfig.HOST, timeout=OllamaConfig.TIMEOUT)
+    return _client
+
+
+def get_async_client() -> ollama.AsyncClient:
+    """非同期クライアント（バックエンドのイベントループで共有）"""
+    global _async_client
+    with _lock:
+        if _async_client is None:
+            _async_client = ollama.AsyncClient(host=OllamaConfig.HOST, timeout=OllamaConfig.TIMEOUT)
+    return _async_client
+
+
+def chat(**kwargs):
+    """get_client().chat() に keep_alive を付けて呼ぶ"""
+    kwargs.setdefault("keep_alive", OllamaConfig.KEEP_ALIVE)
+    return get_client().chat(**kwargs)
+
+
+async def async_chat(**kwargs):
+    """get_async_client().chat() に keep_alive を付けて呼ぶ"""
+    kwargs.setdefault("keep_alive", OllamaConfig.KEEP_ALIVE)
+    return await get_async_client().chat(**kwargs)
+
+
+def embed(model: str, texts: list):
+    """get_client().embed() に keep_alive を付けて呼ぶ"""
+    return get_client().embed(model=model, input=texts, keep_alive=OllamaConfig.KEEP_ALIVE)
+
+
+# ========== コールドロード判定 ==========
+
+def load_ms(res) -> Optional[float]:
+    """応答の load_duration（ns）を ms で返す"""
+    try:
+        ns = res.get("load_duration")
+    except AttributeError:
+        ns = getattr(res, "load_duration", None)
+    return round(ns / 1e6, 2) if ns else None
+
+
+def is_cold_load(res) -> bool:
+    """モデルのロードを待った応答か"""
+    ms = load_ms(res)
+    return ms is not None and ms > OllamaConfig.COLD_LOAD_MS
+
+
+# ========== 起動時ウォームアップ ==========
+
+def warmup(generation_models: Optional[list] = None, embedding_model: Optional[str] = None) -> dict:
+    """
+    生成モデル（タスク別の全モデル）と Embedding モデルを VRAM にロードしておく。
+
+    Returns:
+        モデル名 → {"load_ms", "wall_ms"}（失敗時は {"error"}）
+    """
+    from .embedding import EmbeddingConfig
+
+    client = get_client()
+    targets = [("generate", m) for m in (generation_models or ModelConfig.all_models())]
+    targets.append(("embed", embedding_model or EmbeddingConfig.MODEL))
+    results = {}
+    for kind, model in targets:
+        start = time.perf_counter()
+        try:
+            if kind == "generate":
+                # 空プロンプトの generate はモデルのロードだけ行う。
+                # 回答モデルは本番と同じ num_ctx でロードしないと最初のリクエストで再ロードになる
+                options = {"num_ctx": GenerationConfig.NUM_CTX} if model == ModelConfig.ANSWER else None
+                res = client.generate(model=model, prompt="", keep_alive=OllamaConfig.KEEP_ALIVE, options=options)
+            else:
+                res = client.embed(model=model, input=["warmup"], keep_alive=OllamaConfig.KEEP_ALIVE)
+        except Exception as e:
+            print(f"⚠️ ウォームアップ失敗: {model}: {e}")
+            results[model] = {"error": str(e)}
+            continue
+        wall_ms = round((time.perf_counter() - start) * 1000, 2)
+        results[model] = {"load_ms": load_ms(res), "wall_ms": wall_ms}
+        print(f"🔥 ウォームアップ: {model} (load={results[model]['load_ms']}ms, wall={wall_ms}ms, "
+              f"keep_alive={OllamaConfig.KEEP_ALIVE})")
+    return results
+
+
+if __name__ == "__main__":
+    warmup()
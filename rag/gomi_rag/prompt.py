@@ -0,0 +1,30 @@
+"""
+プロンプト用のコンテキスト整形
+
+固定の指示（system）とユーザメッセージの組み立ては prompt_builder を参照。
+"""
+
+from .prompt_builder import build_user_message
+
+
+# ========== コンテキスト整形 ==========
+def format_gomi_context(h):
+    """ごみデータ1件をプロンプト用に整形する"""
+    return f"品名: {h.get('品名','')}\n出し方: {h.get('出し方','')}\n備考: {h.get('備考','')}"
+
+
+def format_area_context(h):
+    """町名データ1件をプロンプト用に整形する"""
+    return (
+        f"{h.get('町名','不明')} の収集情報:\n"
+        f"- 家庭ごみ: {h.get('家庭ごみの収集日','不明')}\n"
+        f"- プラスチック: {h.get('プラスチックの収集日','不明')}\n"
+        f"- 粗大ごみ: {h.get('粗大ごみの収集日（事前申込制）','不明')}"
+    )
+
+
+def format_knowledge_context(h):
+    """ユーザナレッジ1件をプロンプト用に整形する（出典 + 本文）"""
+    source = f"ファイル: {h.get('file','')}, p.{h.get('page','?')}, chunk {h.get('chunk','?')}"
+    text = (h.get("text") or "").strip()
+    return f"{source}\n{text}" if text else source
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+プロンプト組み立て
+
+llama.cpp（Ollama）は直前のリクエストとバイト単位で一致するプレフィックス部分の
+KV キャッシュを再利用できる。そのため、固定の指示（ルール・出力形式）はすべて
+STATIC_PREFIX にまとめて system メッセージの先頭に置き、リクエストごとに変わる
+コンテキストと質問は必ず最後（user メッセージ）に置く。
+
+Blocking / Streaming の両エンドポイントとも build_messages() を使うこと。
+"""
+
+import os
+import re
+from pathlib import Path
+
+
+# ========== 設定 ==========
+
+class PromptConfig:
+    """プロンプト組み立ての設定"""
+
+    # True: STATIC_PREFIX を Modelfile の SYSTEM に焼き込み済みとみなし、
+    #       system メッセージを送らない（write_modelfile() で生成したモデルを使う場合）
+    PREFIX_IN_MODELFILE = os.getenv("PROMPT_PREFIX_IN_MODELFILE", "0") == "1"
+
+    # コンテキストが空の場合の文言
+    EMPTY_CONTEXT = "該当情報が見つかりませんでした。"
+
+
+# ========== 固定プレフィックス ==========
+# ※ この文字列を変更するとキャッシュが無効になる。動的な値を埋め込まないこと。
+
+STATIC_PREFIX = """あなたは北九州市のごみ分別案内システムです。
+北九州市のごみ分別・町名収集情報、さらにユーザが追加したナレッジ（PDF文書など）に基づいて回答します。
+
+【優先度ルール】
+1. ユーザナレッジベースに情報がある場合 → その情報を根拠に回答。本文の一部を簡潔に引用してよい（ファイル名・ページ番号・チャンク番号も添える）。
+2. ごみ分別・町名収集情報に該当する場合 → ごみ分別ルールに従って回答。
+3. 上記どちらにも該当しない場合のみ → 拒否メッセージを返す。
+
+【重要ルール】
+1. ユーザメッセージの【ごみ分別情報】のみを唯一の事実情報として使用してください。
+2. 回答で使用できる品名は【ごみ分別情報】に記載された品名のみです。
+3. 【ごみ分別情報】に記載されていない品名を新たに作ったり、置き換えたりしてはいけません。
+4. 質問内容と【ごみ分別情報】の品名が一致しない、または明らかに不自然な場合でも、
+   推測で品名を変更せず、【ごみ分別情報】に基づいて回答してください。
+   その際、回答の冒頭に必ず次の注意書きを付けてください：
+   「※ご質問の内容と提供されているごみ分別情報が一致しない可能性があります。」
+
+【出力形式】
+- 品名
+- 品名の出し方
+- 備考
+- 該当町名の収集日（不明な場合は「不明」と記載）
+"""
+
+
+# ========== 組み立て ==========
+
+def build_user_message(context: str, user_input: str) -> str:
+    """リクエストごとに変わる部分（コンテキスト → 質問の順）"""
+    context = context or PromptConfig.EMPTY_CONTEXT
+    return f"【ごみ分別情報】\n{context}\n\n【質問】\n{user_input}\n"
+
+
+def build_messages(rag_prompt: str) -> list:
+    """
+    Ollama chat に渡す messages を返す。
+
+    rag_prompt は build_user_message() の結果（rag_retrieve_extended の戻り値）。
+    """
+    if PromptConfig.PREFIX_IN_MODELFILE:
+        return [{"role": "user", "content": rag_prompt}]
+    return [
+        {"role": "system", "content": STATIC_PREFIX},
+        {"role": "user", "content": rag_prompt},
+    ]
+
+
+# ========== 出力形式（停止条件） ==========
+
+# 【出力形式】の必須項目。行の見出しにこの語が含まれていればその項目とみなす
+# （「品名の出し方」は「出し方」として扱うため、判定は後ろの項目から行う）
+OUTPUT_SECTIONS = ("品名", "出し方", "備考", "収集日")
+
+# 出力形式の後にモデルがプロンプトの見出しを書き始めたら止める
+STOP_SEQUENCES = ("【質問】", "【ごみ分別情報】", "【町名情報】", "【出力形式】", "\n\n\n")
+
+_BULLET = re.compile(r"^[\s\-・*●]+")
+
+
+def _section_of(line: str):
+    label = re.split(r"[:：]", _BULLET.sub("", line), maxsplit=1)[0]
+    for section in reversed(OUTPUT_SECTIONS):
+        if section in label:
+            return section
+    return None
+
+
+def _starts_new_item(text: str):
+    """
+    次の品目ブロック（「- 品名: …」）の始まりか。
+    True / False、まだ判断できないほど短ければ None
+    """
+    head = _BULLET.sub("", text)
+    if not head:
+        return None
+    if head.startswith("品名") and not head.startswith("品名の"):
+        return True
+    if "\n" not in text and ("品名"[:len(head)] == head or head == "品名の"[:len(head)]):
+        return None
+    return False
+
+
+class SectionTracker:
+    """
+    ストリーミング出力から【出力形式】の4項目（品名・出し方・備考・収集日）の出現を追跡し、
+    すべて出し終えたら、その項目のブロックが終わった時点で生成を止める。
+
+    4項目の後は行頭ごとに判定する:
+        インデントされた行（収集日の内訳「  - 家庭ごみ: 月・木」など）  直前の項目の続きとして送出
+        次の品目ブロック（「- 品名」）                                   送出して項目の追跡をやり直す
+        空行の後の行・トップレベルの「- 」項目                          破棄して停止
+        それ以外（空行を挟まない地の文）                                 送出して続行
+
+        tracker = SectionTracker()
+        for chunk in stream:
+            text, stop = tracker.feed(chunk)
+            ...
+    """
+
+    def __init__(self):
+        self.seen = set()
+        self.stopped = False
+        self._line = ""
+        self._held = ""
+
+    @property
+    def block_complete(self) -> bool:
+        return self.seen.issuperset(OUTPUT_SECTIONS)
+
+    @staticmethod
+    def _after_block(held: str):
+        """
+        4項目の後の行頭（保留中のテキスト）の判定。
+        "continue" / "new_item" / "stop"、まだ判断できなければ None
+        """
+        rest = held.lstrip("\n")
+        if not rest:
+            return None
+        if rest[0] in " \t\u3000":
+            # インデントされたブロックの途中では止めない
+            return "continue"
+        decision = _starts_new_item(rest)
+        if decision is None:
+            return None
+        if decision:
+            return "new_item"
+        if held.startswith("\n") or _BULLET.match(rest):
+            return "stop"
+        return "continue"
+
+    def _end_line(self):
+        section = _section_of(self._line)
+        if section:
+            self.seen.add(section)
+        self._line = ""
+
+    def feed(self, chunk: str):
+        """
+        Returns:
+            (送出してよいテキスト, 生成を止めるか)
+        """
+        if self.stopped:
+            return "", True
+        out = []
+        for ch in chunk:
+            if self.block_complete and not self._line:
+                self._held += ch
+                decision = self._after_block(self._held)
+                if decision is None:
+                    continue
+                if decision == "stop":
+                    self.stopped = True
+                    self._held = ""
+                    return "".join(out), True
+                if decision == "new_item":
+                    self.seen = set()
+                # 保留分を送出し、残りの行は通常どおり追跡する
+                out.append(self._held)
+                self._line = self._held.lstrip("\n")
+                self._held = ""
+                if self._line.endswith("\n"):
+                    self._line = self._line[:-1]
+                    self._end_line()
+                continue
+            out.append(ch)
+            if ch == "\n":
+                self._end_line()
+            else:
+                self._line += ch
+        return "".join(out), False
+
+    def finish(self) -> str:
+        """生成終了時に、保留していた末尾を返す（未完の見出し等）"""
+        held, self._held = self._held, ""
+        return "" if self.stopped else held
+
+
+def trim_to_sections(text: str) -> str:
+    """生成済みの全文を、4項目を出し終えた位置で切る（非ストリーミング用）"""
+    tracker = SectionTracker()
+    out, _ = tracker.feed(text)
+    return out + tracker.finish()
+
+
+# ========== Modelfile への焼き込み ==========
+
+_SYSTEM_BLOCK = re.compile(r'^SYSTEM\s+""".*?"""\s*$', re.DOTALL | re.MULTILINE)
+
+
+def render_modelfile(modelfile_text: str) -> str:
+    """Modelfile の SYSTEM ブロックを STATIC_PREFIX に置き換えた文字列を返す"""
+    block = f'SYSTEM """{STATIC_PREFIX}"""'
+    if _SYSTEM_BLOCK.search(modelfile_text):
+        return _SYSTEM_BLOCK.sub(lambda _: block, modelfile_text, count=1)
+    return modelfile_text.rstrip("\n") + "\n\n" + block + "\n"
+
+
+def write_modelfile(path) -> Path:
+    """
+    Modelfile を書き換える。反映するには:
+        ollama create swallow -f models/swallow/Modelfile
+    その後 PROMPT_PREFIX_IN_MODELFILE=1 で起動する。
+    """
+    path = Path(path)
+    path.write_text(render_modelfile(path.read_text(encoding="utf-8")), encoding="utf-8")
+    return path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="固定プロンプトプレフィックスの表示 / Modelfile への焼き込み")
+    parser.add_argument("--write-modelfile", metavar="PATH", help="SYSTEM を STATIC_PREFIX に置き換える Modelfile")
+    args = parser.parse_args()
+
+    if args.write_modelfile:
+        print(f"✅ 書き換えました: {write_modelfile(args.write_modelfile)}")
+    else:
+        print(STATIC_PREFIX)
@@ -0,0 +1,337 @@
+"""
+ナレッジ用の量子化ベクトル層（int8 / binary ＋ float での再ランク、または float32 の全件走査）
+
+ナレッジコレクションは PDF のアップロードで増え続け、ruri-large の 1 ベクトルは
+float32 × 1024 = 4KB になる。ここでは
+
+    1. 量子化したコード（int8: 1 バイト/次元、binary: 1 ビット/次元）を連続配列で全件走査し、
+    2. 上位 k × RERANK_FACTOR 件だけを float32 の埋め込み行列（mmap）から読んで厳密に再ランクする。
+
+走査で触るのはコードだけなので、常駐が必要なメモリは int8 で 1/4、binary で 1/32 になる
+（float の行列は再ランク候補のページだけ読む）。書き出しは gomi_rag.shared と共通。
+
+    float32 量子化しない（mmap した float の行列を全件走査する SharedCollection。既定）
+    int8    次元ごとの対称スケール（max|x| / 127）。近似スコアは内積
+    binary  符号ビットを 8 次元ずつ詰める。近似スコアはハミング距離
+
+量子化はメモリを減らすためのもので、速くはならない。numpy には int8 の BLAS が無く、
+int8 はチャンクごとに float32 へ写してから行列×ベクトルを計算するので、float の行列が
+ページキャッシュに収まっていれば float32 の全件走査と同等か遅い（benchmark_quantized.py）。
+float の行列がメモリに収まらないときに int8 / binary を使う。
+
+近似スコアは正規化済みベクトル（Ollama の /api/embed）を前提にする。再ランクはコレクションの space で行う。
+アップロードの通知（shared.mark_changed）があったとき、または CHECK_SEC ごとに Chroma 側の件数と比べ、
+増えていれば裏で書き出し直して差し替える（書き出しが終わるまでは Chroma に問い合わせる）。
+
+使い方:
+    python -m gomi_rag.quantized knowledge --kind int8     # 書き出し・量子化して件数とサイズを表示
+"""
+
+import os
+import threading
+import time
+from pathlib import Path
+
+from .shared import SharedCollection, _export_paths, changed_at, open_export, vector_distances
+
+# 量子化コードを作る種類
+CODES = ("int8", "binary")
+KINDS = ("float32",) + CODES
+
+
+def _rerank_factor(kind: str, default: int) -> int:
+    """QUANT_RERANK_FACTOR_<KIND>、無ければ QUANT_RERANK_FACTOR、どちらも無ければ default"""
+    return int(os.getenv(f"QUANT_RERANK_FACTOR_{kind.upper()}") or os.getenv("QUANT_RERANK_FACTOR") or default)
+
+
+class QuantConfig:
+    """量子化層の設定（環境変数で上書き可）"""
+
+    # ナレッジコレクションに使う層（float32 / int8 / binary。空なら Chroma のまま）
+    KNOWLEDGE = os.getenv("KNOWLEDGE_QUANTIZATION", "")
+    # 再ランクする候補数 = k × 倍率（種類ごと）。合成 2 万件 × 1024 次元の recall@5:
+    # int8 は ×4 以上で 1.0、binary は ×8 で 0.87・×16 で 0.99
+    RERANK_FACTOR = {"int8": _rerank_factor("int8", 8), "binary": _rerank_factor("binary", 16)}
+    # Chroma 側の件数を確かめる間隔（秒）。アップロードの通知（shared.mark_changed）があればすぐ確かめる
+    CHECK_SEC = float(os.getenv("QUANT_CHECK_SEC", "30"))
+    # 書き出し直しに失敗したとき、次に試すまでの秒数（その間は Chroma に問い合わせる）
+    RETRY_SEC = float(os.getenv("QUANT_RETRY_SEC", "60"))
+    # 走査を区切る行数（int8 を写す float32 のバッファ。1024 次元で 4MB なので CPU キャッシュに収まる）
+    SCAN_CHUNK = 1024
+
+
+# ========== 量子化 ==========
+
+def quantize_int8(matrix) -> tuple:
+    """(n, d) float32 → (int8 コード, 次元ごとのスケール)"""
+    import numpy as np
+
+    scale = np.abs(matrix).max(axis=0) / 127.0
+    scale = np.where(scale > 0, scale, 1.0).astype(np.float32)
+    codes = np.clip(np.rint(matrix / scale), -127, 127).astype(np.int8)
+    return codes, scale
+
+
+def quantize_binary(matrix):
+    """(n, d) float32 → (n, ceil(d/8)) uint8（符号ビット）"""
+    import numpy as np
+
+    return np.packbits(np.asarray(matrix) > 0, axis=1)
+
+
+class Scanner:
+    """量子化コードの全件走査（近似スコアの上位 n 件の行番号を返す）"""
+
+    def __init__(self, kind: str, codes, scale=None):
+        import numpy as np
+
+        self._np = np
+        self.kind = kind
+        self.codes = codes
+        self.scale = scale
+        if kind == "binary":
+            self._popcount = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+    @property
+    def nbytes(self) -> int:
+        """走査で常駐するバイト数"""
+        return int(self.codes.nbytes + (self.scale.nbytes if self.scale is not None else 0))
+
+    def scores(self, query):
+        """近似距離 (n,)（小さいほど近い）"""
+        np = self._np
+        out = np.empty(len(self.codes), dtype=np.float32)
+        if self.kind == "binary":
+            bits = np.packbits(query > 0)
+        else:
+            # スケールはクエリ側に掛け、符号も反転しておく（距離 = -内積）
+            weighted = -(query * self.scale).astype(np.float32)
+            # チャンクごとに一時配列を確保せず、同じバッファに写してから BLAS で計算する
+            buf = np.empty((min(QuantConfig.SCAN_CHUNK, len(self.codes)), self.codes.shape[1]), dtype=np.float32)
+        for start in range(0, len(self.codes), QuantConfig.SCAN_CHUNK):
+            chunk = self.codes[start:start + QuantConfig.SCAN_CHUNK]
+            if self.kind == "binary":
+                out[start:start + len(chunk)] = self._popcount[np.bitwise_xor(chunk, bits)].sum(axis=1)
+            else:
+                block = buf[:len(chunk)]
+                np.copyto(block, chunk, casting="unsafe")
+                np.matmul(block, weighted, out=out[start:start + len(chunk)])
+        return out
+
+    def candidates(self, query, n: int):
+        np = self._np
+        scores = self.scores(query)
+        if n >= len(scores):
+            return np.arange(len(scores))
+        return np.argpartition(scores, n - 1)[:n]
+
+
+def build_scanner(kind: str, matrix) -> Scanner:
+    if kind == "int8":
+        return Scanner(kind, *quantize_int8(matrix))
+    if kind == "binary":
+        return Scanner(kind, quantize_binary(matrix))
+    raise ValueError(f"量子化コードは {'/'.join(CODES)} のいずれか: {kind!r}")
+
+
+def _code_paths(vec_path: Path, kind: str, export_id: str) -> tuple:
+    """書き出しごとのコードのパス（別の書き出しの埋め込み行列と組み合わせないよう export_id を含める）"""
+    base = f"{vec_path.stem}.{kind}.{export_id}"
+    return vec_path.with_name(f"{base}.npy"), vec_path.with_name(f"{base}.scale.npy")
+
+
+def _remove_old_codes(vec_path: Path, kind: str, export_id: str):
+    """以前の書き出しのコードを消す（開いているワーカーの mmap はそのまま読める）"""
+    for path in vec_path.parent.glob(f"{vec_path.stem}.{kind}.*.npy"):
+        if export_id not in path.name:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+
+def load_scanner(kind: str, vec_path: Path, matrix, export_id: str) -> Scanner:
+    """
+    量子化コードを開く（mmap。全ワーカーでページキャッシュを共有）。
+    この書き出しのコードが無ければ作って保存する。
+    """
+    import numpy as np
+
+    codes_path, scale_path = _code_paths(vec_path, kind, export_id)
+    if not codes_path.exists() or (kind == "int8" and not scale_path.exists()):
+        scanner = build_scanner(kind, np.asarray(matrix))
+        for path, array in ((codes_path, scanner.codes), (scale_path, scanner.scale)):
+            if array is None:
+                continue
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp, path)
+        _remove_old_codes(vec_path, kind, export_id)
+    codes = np.load(codes_path, mmap_mode="r")
+    scale = np.load(scale_path) if kind == "int8" else None
+    return Scanner(kind, codes, scale)
+
+
+def search(scanner: Scanner, matrix, space: str, query, k: int, rerank_factor: int = None) -> tuple:
+    """
+    1 クエリの上位 k 件 (行番号, 距離)。量子化コードで k × rerank_factor 件に絞り、
+    その行だけ float の行列（mmap）から読んで space の距離で並べ直す。
+    rerank_factor の既定は QuantConfig.RERANK_FACTOR[scanner.kind]。
+    """
+    import numpy as np
+
+    factor = QuantConfig.RERANK_FACTOR[scanner.kind] if rerank_factor is None else rerank_factor
+    cand = np.sort(scanner.candidates(query, k * max(1, factor)))
+    # 昇順に並べた候補の行だけ読む（ページを順に触る）
+    rows = np.asarray(matrix[cand])
+    distances = vector_distances(query[None, :], rows, space, np.einsum("ij,ij->i", rows, rows))[0]
+    order = np.argsort(distances, kind="stable")[:k]
+    return cand[order], distances[order]
+
+
+# ========== コレクション ==========
+
+class QuantizedCollection(SharedCollection):
+    """量子化コードで候補を絞り、float の埋め込み行列で再ランクする SharedCollection（1 回の書き出し分）"""
+
+    # 全行のノルムを先に計算すると float の行列を全部読むことになるので、候補の行だけで計算する
+    PRECOMPUTE_NORMS = False
+
+    def __init__(self, collection, info: dict, matrix, snap, docs, scanner: Scanner):
+        super().__init__(collection, info, matrix, snap, docs)
+        self.scanner = scanner
+
+    def _search(self, queries, k: int, rows=None) -> list:
+        # where で絞った行は量子化せずに float で厳密に検索する
+        if rows is not None:
+            return super()._search(queries, k, rows)
+        return [search(self.scanner, self._matrix, self.space, query, k) for query in queries]
+
+
+def open_quantized(collection, key: str, kind: str) -> SharedCollection:
+    """
+    書き出し（無い・古ければ作る）と量子化コードを開く。空のコレクションなら None。
+    kind が float32 なら量子化せず SharedCollection（float の行列の全件走査）を返す。
+    """
+    info, matrix, snap, docs = open_export(collection, key)
+    if not info["count"]:
+        return None
+    rows_mb = (snap.path.stat().st_size + docs.path.stat().st_size) / 1e6
+    if kind == "float32":
+        print(f"🗜️ {collection.name}: float32 全件走査 {info['count']} 件 | 走査 {matrix.nbytes / 1e6:.1f}MB（mmap）| "
+              f"メタデータ・ID・文書 {rows_mb:.1f}MB（mmap、結果の行だけ読む）")
+        return SharedCollection(collection, info, matrix, snap, docs)
+    scanner = load_scanner(kind, _export_paths(collection.name)[0], matrix, info["export_id"])
+    print(f"🗜️ {collection.name}: {kind} 量子化 {info['count']} 件 | 走査 {scanner.nbytes / 1e6:.1f}MB | "
+          f"メタデータ・ID・文書 {rows_mb:.1f}MB（mmap、結果の行だけ読む）"
+          f" | float {matrix.nbytes / 1e6:.1f}MB（mmap、再ランク時のみ読む）")
+    return QuantizedCollection(collection, info, matrix, snap, docs, scanner)
+
+
+class RefreshingCollection:
+    """
+    open_quantized の結果（QuantizedCollection / SharedCollection）を Chroma のコレクションと同じように使うためのラッパー。
+    Chroma 側の件数と書き出しの件数を比べ、違っていれば（アップロード後）裏のスレッドで
+    書き出し直して差し替える。それまでは元のコレクションに問い合わせる。
+    件数（Chroma への問い合わせ）を確かめるのは、アップロードの通知があったときと QuantConfig.CHECK_SEC ごと。
+    """
+
+    def __init__(self, collection, key: str, kind: str, current: SharedCollection = None):
+        self._collection = collection
+        self._key = key
+        self._kind = kind
+        self._current = current
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._retry_at = 0.0
+        # 最後に確かめた Chroma 側の件数・次に確かめる時刻・そのときのアップロード通知の時刻
+        self._chroma_count = None
+        self._check_at = 0.0
+        self._changed_at = changed_at(collection.name)
+
+    def __getattr__(self, name):
+        # name / id / metadata などは元のコレクションのもの
+        return getattr(self._collection, name)
+
+    def count(self) -> int:
+        return self._collection.count()
+
+    def _target(self):
+        """問い合わせ先（書き出しが Chroma と一致していれば open_quantized の結果、違えば元のコレクション）"""
+        current = self._current
+        changed = changed_at(self._collection.name)
+        now = time.monotonic()
+        if self._chroma_count is None or changed != self._changed_at or now >= self._check_at:
+            self._changed_at = changed
+            self._check_at = now + QuantConfig.CHECK_SEC
+            self._chroma_count = self._collection.count()
+        if current is not None and current.count() == self._chroma_count:
+            return current
+        if self._chroma_count:
+            self._start_refresh()
+        return self._collection
+
+    def _start_refresh(self):
+        with self._lock:
+            if self._refreshing or time.monotonic() < self._retry_at:
+                return
+            self._refreshing = True
+        print(f"⚠️ {self._collection.name}: Chroma 側の件数が変わったため書き出し直します（終わるまで Chroma で検索）")
+        threading.Thread(target=self._refresh, name=f"quantize-{self._collection.name}", daemon=True).start()
+
+    def _refresh(self):
+        try:
+            self._current = open_quantized(self._collection, self._key, self._kind)
+            # 書き出し中に増えた分があれば次の問い合わせで気づくよう、件数を確かめ直す
+            self._check_at = 0.0
+        except Exception as e:
+            self._retry_at = time.monotonic() + QuantConfig.RETRY_SEC
+            print(f"⚠️ {self._collection.name}: 書き出しに失敗（{QuantConfig.RETRY_SEC:.0f}秒後に再試行）: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def query(self, *args, **kwargs) -> dict:
+        return self._target().query(*args, **kwargs)
+
+    def get(self, *args, **kwargs) -> dict:
+        return self._target().get(*args, **kwargs)
+
+
+def quantized_collection(collection, key: str, kind: str = None):
+    """
+    コレクションを量子化層（RefreshingCollection）に置き換える（kind 省略時は KNOWLEDGE_QUANTIZATION）。
+    量子化が無効ならそのまま返す。書き出しに失敗した場合は Chroma で検索しながら後で再試行する。
+    """
+    kind = kind or QuantConfig.KNOWLEDGE
+    if not kind:
+        return collection
+    if kind not in KINDS:
+        raise ValueError(f"量子化層は {'/'.join(KINDS)} のいずれか: {kind!r}")
+    wrapped = RefreshingCollection(collection, key, kind)
+    try:
+        wrapped._current = open_quantized(collection, key, kind)
+    except Exception as e:
+        wrapped._retry_at = time.monotonic() + QuantConfig.RETRY_SEC
+        print(f"⚠️ {collection.name}: 量子化層を使えないため Chroma で検索します: {e}")
+    return wrapped
+
+
+def main():
+    import argparse
+
+    from .store import get_collection
+
+    parser = argparse.ArgumentParser(description="コレクションを書き出して量子化する")
+    parser.add_argument("collection", nargs="?", default="knowledge")
+    parser.add_argument("--kind", choices=KINDS, default="float32")
+    parser.add_argument("--key", default="file", help="メタデータのスナップショットのキー列")
+    parser.add_argument("--persist-dir", help="embedded モードの保存先")
+    args = parser.parse_args()
+
+    quantized_collection(get_collection(args.collection, args.persist_dir), args.key, args.kind)
+
+
+if __name__ == "__main__":
+    main()
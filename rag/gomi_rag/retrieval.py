@@ -0,0 +1,185 @@
+"""
+RAG 検索（品名 Grounding・ごみ/ナレッジ検索・町名照合）とユーザメッセージの組み立て
+"""
+
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .context_packer import ContextItem, pack_context
+
+from .grounding import extract_keywords_hybrid, extract_nouns
+from .loaders import area_names
+from .prompt import build_user_message, format_area_context, format_gomi_context, format_knowledge_context
+from .store import query_chroma
+
+
+# ナレッジ検索を品名 Grounding と並行して実行するためのスレッドプール
+# （初回の検索で作る。import 時にはスレッドを起動しない）
+_retrieval_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_retrieval_pool():
+    global _retrieval_pool
+    with _pool_lock:
+        if _retrieval_pool is None:
+            _retrieval_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="retrieval")
+    return _retrieval_pool
+
+
+def _item_differs_from_input(item_name, user_input):
+    """
+    Grounding された品名が入力文と実質的に異なるか（＝品名での再検索に意味があるか）。
+    「（…）」の補足を除いた品名が入力に含まれていれば同じとみなす。
+    """
+    core = re.sub(r"[（(].*?[）)]", "", item_name or "").strip()
+    return bool(core) and core not in user_input
+
+
+def _merge_knowledge_hits(*hit_lists, n=3):
+    """複数回のナレッジ検索結果を (file, page, chunk) で重複除去し、距離の小さい順に n 件"""
+    best = {}
+    for hits in hit_lists:
+        for h in hits:
+            key = (h.get("file"), h.get("page"), h.get("chunk"))
+            if key not in best or (h.get("distance") or 0) < (best[key].get("distance") or 0):
+                best[key] = h
+    return sorted(best.values(), key=lambda h: h.get("distance") or 0)[:n]
+
+
+def rag_retrieve_extended(
+    user_input,
+    gomi_collection,
+    area_collection,
+    known_items=None,  # ← Hybrid システムでは不要（後方互換性のため残す）
+    area_meta=None,
+    knowledge_collection=None,
+    known_areas=None,
+    top_k=3,
+    return_details=False,
+    context_budget=None
+):
+    """
+    拡張RAG検索（Hybrid Grounding システム統合版）
+    
+    変更点：
+    - known_items は不要になりました（Hybrid システムが直接 collection を使用）
+    - 品名抽出に extract_keywords_hybrid() を使用
+    - grounding_result を references に追加
+    
+    return_details=True の場合は (prompt, references, details) を返す。
+    details: {"品名", "町名", "grounding_result", "area_rows", "knowledge_hits", "context"}
+    （LLM を使わずに回答できるかの判定に使う。answer_template 参照）
+
+    known_areas: 町名の一覧（None なら area_meta から作る）
+    context_budget: コンテキストのトークン予算（None なら CONTEXT_TOKEN_BUDGET）。
+    details["context"] に推定トークン数と採用・除外件数が入る。
+    """
+    references = []  # ← WebUIに渡す用
+
+    # ナレッジ検索は入力文そのもので投機的に先行開始し、Grounding と並行させる
+    knowledge_future = None
+    if knowledge_collection:
+        knowledge_future = _get_retrieval_pool().submit(query_chroma, knowledge_collection, user_input, top_k)
+
+    # ========== 新版：Hybrid Grounding システム使用 ==========
+    if known_areas is None:
+        known_areas = area_names(area_meta)
+    keys = extract_keywords_hybrid(user_input, gomi_collection, known_areas)
+    
+    # Grounding結果を取得
+    grounding_result = keys.get("grounding_result")
+    
+    # 歧義または低置信度の場合、候補リストを references に追加
+    if grounding_result:
+        if grounding_result.is_ambiguous or grounding_result.confidence_level in ["low", "medium"]:
+            references.append({
+                "type": "grounding_info",
+                "confidence": grounding_result.confidence_level,
+                "is_ambiguous": grounding_result.is_ambiguous,
+                "candidates": [c.item_name for c in grounding_result.candidates[:3]],
+                "execution_time_ms": grounding_result.execution_time_ms
+            })
+
+    # ========= 品名検索 =========
+    combined_hits = []
+    knowledge_hits = []
+
+    if keys["品名"]:
+        query_text = keys["品名"]
+        gomi_hits = query_chroma(gomi_collection, query_text, n=top_k)
+        combined_hits.extend(gomi_hits)
+
+        if knowledge_future:
+            knowledge_hits = knowledge_future.result()
+            # 品名が入力文と大きく異なる場合（別名・言い換え）のみ品名で追加検索する
+            if _item_differs_from_input(query_text, user_input):
+                item_hits = query_chroma(knowledge_collection, query_text, n=top_k)
+                knowledge_hits = _merge_knowledge_hits(knowledge_hits, item_hits, n=top_k)
+            combined_hits.extend(knowledge_hits)
+    else:
+        nouns = extract_nouns(user_input)
+        print(f"⚠️ 品名が見つかりませんでした。名詞候補: {nouns}")
+
+        if gomi_collection:
+            for noun in nouns:
+                results = gomi_collection.query(query_texts=[noun], n_results=1)
+                metas = results.get("metadatas", [])
+                if metas and metas[0]:
+                    combined_hits.append(metas[0][0])
+                    break
+
+        if knowledge_future:
+            knowledge_hits = knowledge_future.result()
+            combined_hits.extend(knowledge_hits)
+
+    # ========= コンテキスト候補 =========
+    # ヒットごとのトークン見積もり・重複除去・予算内への詰め込みは context_packer が行う
+    items = []
+    for h in combined_hits:
+        score = h.get("similarity", 0.0)  # 距離空間に応じて store.query_chroma が換算済み
+        if "品名" in h:  # ごみデータ（Grounding された品名は必ず入れる）
+            items.append(ContextItem("gomi", format_gomi_context(h), score, required=h.get("品名") == keys["品名"]))
+        elif "file" in h:  # ユーザナレッジ
+            items.append(ContextItem("knowledge", format_knowledge_context(h), score))
+
+    # ========= 町名検索 =========
+    matched = []
+    if keys["町名"] and area_meta:
+        if hasattr(area_meta, "find_all"):  # 共有テーブル（gomi_rag.shared.TableView）は索引で引く
+            matched = area_meta.find_all(keys["町名"])
+        else:
+            matched = [h for h in area_meta if h.get("町名") == keys["町名"]]
+        items.extend(ContextItem("area", format_area_context(h), required=True) for h in matched)
+
+    packed = pack_context(items, budget=context_budget)
+    print(f"📦 コンテキスト: {packed.tokens}/{packed.budget} tokens (推定) | "
+          f"採用 {packed.included} / 重複 {packed.deduped} / 切詰 {packed.truncated} / 除外 {packed.dropped}")
+
+    # ========= 参考情報を格納（上位2件） =========
+    for h in knowledge_hits[:2]:
+        references.append({
+            "file": h.get("file", "?"),
+            "page": h.get("page", "?"),
+            "chunk": h.get("chunk", "?"),
+            "text": h.get("text", "")[:300]
+        })
+
+    # ========= コンテキスト生成 =========
+    context = packed.render() or "該当情報が見つかりませんでした。"
+
+    # 固定の指示は prompt_builder.STATIC_PREFIX（system）側に置き、
+    # ここではリクエストごとに変わる部分だけを返す
+    prompt = build_user_message(context, user_input)
+    if return_details:
+        details = {
+            "品名": keys["品名"],
+            "町名": keys["町名"],
+            "grounding_result": grounding_result,
+            "area_rows": matched,
+            "knowledge_hits": knowledge_hits,
+            "context": packed.summary(),
+        }
+        return prompt, references, details
+    return prompt, references
@@ -0,0 +1,435 @@
+"""
+ワーカープロセス間で共有する読み取り専用データ
+
+uvicorn を複数ワーカーで動かすと、各ワーカーが gomi_meta / area_meta の dict のリストと
+Chroma の HNSW セグメント（品目・町名の埋め込み）をそれぞれヒープに持つため、
+メモリがワーカー数に比例して増える。
+
+ここではそれらをファイルに書き出して mmap する（OS のページキャッシュを全ワーカーで共有する）。
+
+    TableView         スナップショット（gomi_rag.snapshot）上の読み取り専用の行シーケンス
+    SharedCollection  埋め込み行列（.npy を mmap_mode="r"）＋メタデータと ID・文書のスナップショットで
+                      Chroma コレクションの query / get / count を置き換える（全件の厳密検索）
+
+品目・町名は千件未満なので全件の内積で足りる（HNSW より正確で、インデックスの読み込みも不要）。
+ナレッジコレクションは増え続けるため対象外（Chroma のまま）。
+"""
+
+import json
+import os
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Optional
+
+from .snapshot import RowSequence, Snapshot, build_snapshot, load_fresh, snapshot_path, write_snapshot
+from .store import collection_space
+
+# 0 にすると従来どおり各ワーカーがリスト・Chroma コレクションをそのまま使う
+ENABLED = os.getenv("SHARED_DATA", "1") == "1"
+# 埋め込み行列とメタデータの書き出し先
+DATA_DIR = Path(os.getenv("SHARED_DATA_DIR", Path(__file__).resolve().parents[2] / "backend" / "shared_data"))
+# 書き出しで Chroma から一度に読む件数（全件を 1 回の get で読むと埋め込みの list がまるごとヒープに載る）
+EXPORT_PAGE = int(os.getenv("SHARED_EXPORT_PAGE", "1000"))
+
+EXPORT_VERSION = 3
+
+
+# ========== 行テーブル ==========
+
+class TableView(RowSequence):
+    """
+    スナップショットの行を list[dict] のように読むビュー（RowSequence）に、
+    キー列の一覧と索引による検索を加えたもの。
+    """
+
+    def __init__(self, snap: Snapshot):
+        super().__init__(snap)
+        self._names: Optional[List[str]] = None
+
+    def names(self) -> List[str]:
+        """キー列の値（空は除く）"""
+        if self._names is None:
+            self._names = [n for n in self.snap.docs() if n]
+        return self._names
+
+    def find_all(self, name: str) -> List[dict]:
+        """キー列が name の行（索引の二分探索）"""
+        return [self.snap.row(i) for i in self.snap.find_all(name)]
+
+
+def open_table(source, key: str) -> TableView:
+    """JSONL に対応するスナップショットを開く（無い・古い場合はビルドする）"""
+    snap = load_fresh(source, key)
+    if snap is None:
+        build_snapshot(source, key)
+        snap = Snapshot.open(snapshot_path(source))
+    return TableView(snap)
+
+
+# ========== 埋め込み行列 ==========
+
+def _export_paths(name: str) -> tuple:
+    """(埋め込み行列, メタデータ, ID・文書, 書き出しの情報)"""
+    base = DATA_DIR / name
+    return (base.with_suffix(".vec.npy"), base.with_suffix(".meta.snap"), base.with_suffix(".docs.snap"),
+            base.with_suffix(".export.json"))
+
+
+@contextmanager
+def export_lock(name: str, exclusive: bool = False):
+    """
+    書き出しのロック（書き出しは排他、読み込みは共有）。
+    4 つのファイルはそれぞれ置き換えるので、書き出し中に開くと別々の書き出しの組になりうる。
+    fcntl の無い環境ではロックしない。
+    """
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    with open(DATA_DIR / f"{name}.lock", "a+b") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _export_pages(collection):
+    """collection.get を EXPORT_PAGE 件ずつ読む"""
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings", "metadatas", "documents"], limit=EXPORT_PAGE, offset=offset)
+        if len(page["ids"]):
+            yield page
+        if len(page["ids"]) < EXPORT_PAGE:
+            return
+        offset += len(page["ids"])
+
+
+def export_collection(collection, key: str) -> dict:
+    """
+    Chroma コレクションの埋め込み・メタデータ・ID と文書を書き出す（初回のみ。以降のワーカーはファイルを開くだけ）。
+    export_lock(exclusive=True) を取ってから呼ぶこと。
+
+    埋め込みはページごとに float32 で一時ファイルに書き、最後に .npy へ写す（行列全体をヒープに持たない）。
+    ID と文書はキー列 id のスナップショット（文字列は参照時にデコード）に入れ、各ワーカーは mmap で読む。
+    Returns: 書き出しの情報（export.json の内容）
+    """
+    import numpy as np
+
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    vec_path, meta_path, docs_path, info_path = _export_paths(collection.name)
+    raw_path = vec_path.with_name(f"{vec_path.name}.{os.getpid()}.raw")
+    rows, docs = [], []
+    dim = 0
+    try:
+        with open(raw_path, "wb") as raw:
+            for page in _export_pages(collection):
+                block = np.asarray(page["embeddings"], dtype=np.float32)
+                dim = block.shape[1]
+                raw.write(np.ascontiguousarray(block).tobytes())
+                rows += [dict(m or {}) for m in page["metadatas"]]
+                documents = page["documents"] or [None] * len(page["ids"])
+                docs += [{"id": i, "document": d} for i, d in zip(page["ids"], documents)]
+
+        tmp = vec_path.with_name(f"{vec_path.name}.{os.getpid()}.tmp")
+        matrix = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=(len(rows), dim))
+        if len(rows):
+            pages = np.memmap(raw_path, dtype=np.float32, mode="r", shape=(len(rows), dim))
+            for start in range(0, len(rows), EXPORT_PAGE):
+                matrix[start:start + EXPORT_PAGE] = pages[start:start + EXPORT_PAGE]
+            del pages
+        matrix.flush()
+        del matrix
+        os.replace(tmp, vec_path)
+    finally:
+        raw_path.unlink(missing_ok=True)
+
+    # 4 つのファイルが同じ書き出しのものかを開くときに確かめる
+    export_id = uuid.uuid4().hex
+    source_info = {
+        "source": f"chroma:{collection.name}",
+        "source_size": len(rows),
+        "source_mtime_ns": 0,
+        "source_sha1": str(collection.id),
+        "export_id": export_id,
+    }
+    write_snapshot(rows, key, meta_path, source_info)
+    write_snapshot(docs, "id", docs_path, source_info, lazy_strings=True)
+    info = {
+        "version": EXPORT_VERSION,
+        "export_id": export_id,
+        "collection": collection.name,
+        "collection_id": str(collection.id),
+        "count": len(rows),
+        "dim": dim,
+        "space": collection_space(collection),
+    }
+    tmp = info_path.with_name(f"{info_path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(info, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, info_path)
+    return info
+
+
+def vector_distances(queries, matrix, space: str, sq_norms):
+    """
+    queries (q, d) と matrix (n, d) の距離 (q, n)。Chroma の hnswlib と同じ定義
+    （l2: 二乗距離 / cosine: 1 - cos / ip: 1 - 内積）。sq_norms は matrix の各行の二乗ノルム。
+    """
+    import numpy as np
+
+    dots = queries @ matrix.T
+    if space == "cosine":
+        q_norm = np.linalg.norm(queries, axis=1, keepdims=True)
+        m_norm = np.sqrt(sq_norms)[None, :]
+        return 1.0 - dots / np.maximum(q_norm * m_norm, 1e-12)
+    if space == "ip":
+        return 1.0 - dots
+    return (queries * queries).sum(axis=1, keepdims=True) + sq_norms[None, :] - 2.0 * dots
+
+
+class SharedCollection:
+    """
+    Chroma コレクションの読み取り API（query / get / count）を、
+    mmap した埋め込み行列に対する全件検索で提供する。距離はコレクションの space に合わせる。
+    """
+
+    PRECOMPUTE_NORMS = True
+
+    def __init__(self, collection, info: dict, matrix, snap: Snapshot, docs: Snapshot):
+        import numpy as np
+
+        self._np = np
+        self._collection = collection
+        self.name = info["collection"]
+        self.id = collection.id
+        self.metadata = getattr(collection, "metadata", None)
+        self.space = info["space"]
+        self._matrix = matrix              # (n, d) float32、読み取り専用 mmap
+        self._snap = snap                  # メタデータ
+        self._docs = docs                  # ID（キー列）と文書
+        self._embed = None
+        # ノルムは n 個の float だけなのでワーカーごとに持つ
+        self._sq_norms = None
+        if self.PRECOMPUTE_NORMS:
+            self._sq_norms = np.einsum("ij,ij->i", matrix, matrix) if len(matrix) else np.zeros(0, np.float32)
+
+    def count(self) -> int:
+        return len(self._docs)
+
+    def _result_rows(self, indices, include) -> dict:
+        """行番号のリスト → Chroma の結果の 1 件分（include に無いフィールドは None）"""
+        return {
+            "ids": [self._docs.value(i, "id") for i in indices],
+            "metadatas": [self._snap.row(i) for i in indices] if "metadatas" in include else None,
+            "documents": [self._docs.value(i, "document") for i in indices] if "documents" in include else None,
+            "embeddings": self._np.asarray(self._matrix[indices]).tolist() if "embeddings" in include else None,
+        }
+
+    def _filter(self, where) -> Optional[list]:
+        """where に合う行番号（where が無ければ None = 全行）"""
+        if not where:
+            return None
+        return [i for i in range(self.count()) if _matches(self._snap.row(i), where)]
+
+    def get(self, ids=None, where=None, limit=None, offset=None, where_document=None, include=None) -> dict:
+        if where_document:
+            raise NotImplementedError(f"{self.name}: where_document は SharedCollection では使えません")
+        include = _check_include(GET_INCLUDE if include is None else include, GET_FIELDS)
+        if ids is None:
+            indices = list(range(self.count()))
+        else:
+            found = (self._docs.find(v) for v in ([ids] if isinstance(ids, str) else ids))
+            indices = [i for i in found if i is not None]
+        allowed = self._filter(where)
+        if allowed is not None:
+            allowed = set(allowed)
+            indices = [i for i in indices if i in allowed]
+        indices = indices[offset or 0:]
+        if limit is not None:
+            indices = indices[:limit]
+        return self._result_rows(indices, include)
+
+    def _embed_queries(self, query_texts, query_embeddings):
+        if query_embeddings is None:
+            if self._embed is None:
+                from .embedding import get_embedding_function
+                self._embed = get_embedding_function()
+            query_embeddings = self._embed(list(query_texts))
+        queries = self._np.asarray(query_embeddings, dtype=self._np.float32)
+        return queries[None, :] if queries.ndim == 1 else queries
+
+    def _search(self, queries, k: int, rows=None) -> list:
+        """
+        クエリごとの上位 k 件 [(行番号, 距離)]（距離の昇順）。
+        rows（行番号の配列）を渡すとその行だけを対象にする。
+        """
+        np = self._np
+        matrix, sq_norms = self._matrix, self._sq_norms
+        if rows is not None:
+            matrix = np.asarray(matrix[rows])
+            sq_norms = sq_norms[rows] if sq_norms is not None else np.einsum("ij,ij->i", matrix, matrix)
+        found = []
+        for row in vector_distances(queries, matrix, self.space, sq_norms):
+            top = np.argpartition(row, k - 1)[:k] if k < len(row) else np.arange(len(row))
+            top = top[np.argsort(row[top], kind="stable")]
+            found.append((top if rows is None else rows[top], row[top]))
+        return found
+
+    def query(self, query_texts=None, query_embeddings=None, n_results=10, where=None, where_document=None,
+              include=None) -> dict:
+        if where_document:
+            raise NotImplementedError(f"{self.name}: where_document は SharedCollection では使えません")
+        include = _check_include(QUERY_INCLUDE if include is None else include, QUERY_FIELDS)
+        queries = self._embed_queries(query_texts, query_embeddings)
+        rows = self._filter(where)
+        if rows is not None:
+            rows = self._np.asarray(rows, dtype=self._np.int64)
+        k = min(n_results, self.count() if rows is None else len(rows))
+
+        result = {field: ([] if field == "ids" or field in include else None) for field in QUERY_FIELDS}
+        if k == 0:
+            found = [(self._np.zeros(0, self._np.int64), [])] * len(queries)
+        else:
+            found = self._search(queries, k, rows)
+        for top, distances in found:
+            one = self._result_rows(top.tolist(), include)
+            for field in ("ids", "metadatas", "documents", "embeddings"):
+                if result[field] is not None:
+                    result[field].append(one[field])
+            if result["distances"] is not None:
+                result["distances"].append([float(d) for d in distances])
+        return result
+
+
+# Chroma の既定と同じ（embeddings は明示したときだけ返す）
+GET_INCLUDE = ("metadatas", "documents")
+QUERY_INCLUDE = ("metadatas", "documents", "distances")
+GET_FIELDS = ("ids", "metadatas", "documents", "embeddings")
+QUERY_FIELDS = GET_FIELDS + ("distances",)
+
+_WHERE_OPS = {
+    "$eq": lambda a, b: a == b,
+    "$ne": lambda a, b: a != b,
+    "$gt": lambda a, b: a > b,
+    "$gte": lambda a, b: a >= b,
+    "$lt": lambda a, b: a < b,
+    "$lte": lambda a, b: a <= b,
+    "$in": lambda a, b: a in b,
+    "$nin": lambda a, b: a not in b,
+}
+
+
+def _check_include(include, fields: tuple) -> tuple:
+    unknown = [f for f in include if f not in fields or f == "ids"]
+    if unknown:
+        raise NotImplementedError(f"include={unknown} は SharedCollection では使えません")
+    return tuple(include)
+
+
+def _matches(meta: dict, where: dict) -> bool:
+    """
+    Chroma の where 句の評価（$and / $or と $eq / $ne / $gt / $gte / $lt / $lte / $in / $nin）。
+    キーの無い行はどの条件にも合わない。
+    """
+    for field, cond in where.items():
+        if field == "$and":
+            ok = all(_matches(meta, c) for c in cond)
+        elif field == "$or":
+            ok = any(_matches(meta, c) for c in cond)
+        elif field.startswith("$"):
+            raise NotImplementedError(f"where の演算子 {field} は SharedCollection では使えません")
+        elif field not in meta:
+            ok = False
+        elif isinstance(cond, dict):
+            ok = True
+            for op, value in cond.items():
+                if op not in _WHERE_OPS:
+                    raise NotImplementedError(f"where の演算子 {op} は SharedCollection では使えません")
+                try:
+                    ok = ok and _WHERE_OPS[op](meta[field], value)
+                except TypeError:
+                    ok = False
+        else:
+            ok = meta[field] == cond
+        if not ok:
+            return False
+    return True
+
+
+def _open_files(vec_path: Path, meta_path: Path, docs_path: Path, info_path: Path) -> Optional[tuple]:
+    """
+    書き出しの 4 ファイルを開く。欠けている・同じ書き出しの組でない場合は None。
+    export_lock の中で呼ぶ（開いた後は置き換えられても mmap は元のファイルを指す）。
+    """
+    import numpy as np
+
+    if not all(path.exists() for path in (info_path, vec_path, meta_path, docs_path)):
+        return None
+    info = json.loads(info_path.read_text(encoding="utf-8"))
+    if info.get("version") != EXPORT_VERSION:
+        return None
+    try:
+        matrix = np.load(vec_path, mmap_mode="r")
+        snap = Snapshot.open(meta_path)
+        docs = Snapshot.open(docs_path)
+    except (ValueError, OSError):
+        # 旧版のスナップショットなど
+        return None
+    for part in (snap, docs):
+        if part.header.get("export_id") != info.get("export_id") or len(part) != info.get("count"):
+            return None
+    if len(matrix) != info.get("count"):
+        return None
+    return info, matrix, snap, docs
+
+
+def _is_current(info: dict, collection) -> bool:
+    return info.get("collection_id") == str(collection.id) and info.get("count") == collection.count()
+
+
+def open_export(collection, key: str) -> tuple:
+    """
+    書き出し済みの (情報, 埋め込み行列の mmap, メタデータのスナップショット, ID・文書のスナップショット) を開く。
+    書き出しが無い・古い（コレクション ID か件数が違う）場合は書き出してから開く。
+    """
+    paths = _export_paths(collection.name)
+    with export_lock(collection.name):
+        opened = _open_files(*paths)
+    if opened is not None and _is_current(opened[0], collection):
+        return opened
+    with export_lock(collection.name, exclusive=True):
+        # ロックを待つ間に他のワーカーが書き出していればそれを使う
+        opened = _open_files(*paths)
+        if opened is None or not _is_current(opened[0], collection):
+            print(f"📤 埋め込みを書き出し: {collection.name} → {DATA_DIR}")
+            export_collection(collection, key)
+            opened = _open_files(*paths)
+    return opened
+
+
+def mark_changed(name: str):
+    """コレクションを書き換えたことを他のプロセスに知らせる（アップロードの後に呼ぶ）"""
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    (DATA_DIR / f"{name}.changed").touch()
+
+
+def changed_at(name: str) -> int:
+    """mark_changed の最終時刻（ns。一度も呼ばれていなければ 0）。stat だけなので問い合わせごとに呼べる"""
+    try:
+        return (DATA_DIR / f"{name}.changed").stat().st_mtime_ns
+    except OSError:
+        return 0
+
+
+def shared_collection(collection, key: str):
+    """
+    コレクションを SharedCollection に置き換える（必要なら書き出してから開く）。
+    SHARED_DATA=0 の場合はそのまま返す。
+    """
+    if not ENABLED:
+        return collection
+    return SharedCollection(collection, *open_export(collection, key))
@@ -0,0 +1,447 @@
+"""
+ごみ・町名データのバイナリスナップショット
+
+load_jsonl は起動・ベンチマーク・テストのたびに JSONL を 1 行ずつ json.loads している。
+ビルド時に列指向のバイナリ（.snap）へ変換しておき、読み込み時は mmap するだけにする。
+
+ファイル構成（<source>.snap、例: rag_docs_merged.snap）:
+    b"GSNP" | u32 ヘッダ長 | ヘッダ JSON | 8 バイト境界まで 0 埋め
+    strings   重複を除いた文字列（UTF-8、"\\0" 区切り）。値はすべてこの番号で参照する
+    string_offsets  （lazy_strings のみ）文字列ごとの開始位置 u64 × (文字列数 + 1)。
+              読み込み時に文字列表をデコードせず、参照した文字列だけをデコードする
+    typed     文字列以外の値（int / float / bool。Chroma のメタデータのページ番号など）の JSON 配列
+    columns   列ごとに u32 × 行数（文字列番号。TYPED ビットが立っていれば typed の番号。キーが無い行は MISSING）
+    name_idx  キー列（品名 / 町名）の値でソートした行番号 u32 × 行数
+
+ヘッダにはスキーマ版数と元 JSONL のサイズ・mtime・SHA-1 を持ち、
+読み込み時に元ファイルと比べて古ければ使わない（load_jsonl は JSONL を読み直す）。
+
+使い方（rag/ で実行）:
+    python -m gomi_rag.snapshot                 # rag_docs_merged.jsonl / area.jsonl をビルド
+    python -m gomi_rag.snapshot --bench         # JSONL との読み込み時間の比較
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from collections.abc import Sequence
+from itertools import accumulate
+from pathlib import Path
+from typing import Dict, List, Optional
+
+SCHEMA_VERSION = 2
+MAGIC = b"GSNP"
+MISSING = 0xFFFFFFFF
+# 文字列以外の値の番号に立てるビット
+TYPED = 0x80000000
+SUFFIX = ".snap"
+
+# 0 にするとスナップショットを使わず常に JSONL を読む
+ENABLED = os.getenv("GOMI_SNAPSHOT", "1") == "1"
+
+# ビルド対象（JSONL, キー列）
+DEFAULT_SOURCES = [("rag_docs_merged.jsonl", "品名"), ("area.jsonl", "町名")]
+
+
+def snapshot_path(source) -> Path:
+    return Path(source).with_suffix(SUFFIX)
+
+
+def _sha1(path: Path) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _u32(values) -> array:
+    arr = array("I", values)
+    assert arr.itemsize == 4
+    return arr
+
+
+# ========== ビルド ==========
+
+def build_snapshot(source, key: str, out=None) -> Path:
+    """JSONL からスナップショットを作る（一時ファイルに書いてから置き換える）"""
+    source = Path(source)
+    out = Path(out) if out else snapshot_path(source)
+
+    rows = []
+    with open(source, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                rows.append(json.loads(line))
+
+    stat = source.stat()
+    return write_snapshot(rows, key, out, {
+        "source": source.name,
+        "source_size": stat.st_size,
+        "source_mtime_ns": stat.st_mtime_ns,
+        "source_sha1": _sha1(source),
+    })
+
+
+def write_snapshot(rows: List[dict], key: str, out, source_info: dict, lazy_strings: bool = False) -> Path:
+    """
+    行（dict のリスト）をスナップショットとして書き出す。
+    source_info: 鮮度判定用の元データ情報（source / source_size / source_mtime_ns / source_sha1）
+    lazy_strings: 文字列表を開くときに全部デコードしない（文書の本文など、大きく重複の少ない値向け）
+    """
+    out = Path(out)
+
+    # 列は出現順（JSONL の行ごとのキー順を保つため、行ごとの列順も記録する）
+    columns: List[str] = []
+    for row in rows:
+        for col in row:
+            if col not in columns:
+                columns.append(col)
+
+    strings: List[str] = []
+    string_ids: Dict[str, int] = {}
+    typed: list = []
+    typed_ids: Dict[tuple, int] = {}
+
+    def intern(value) -> int:
+        if isinstance(value, str):
+            if value not in string_ids:
+                string_ids[value] = len(strings)
+                strings.append(value)
+            return string_ids[value]
+        if value is not None and not isinstance(value, (int, float)):
+            raise TypeError(f"文字列・数値・真偽値・None 以外の値には未対応: {value!r}")
+        # 1 / 1.0 / True を区別する
+        typed_key = (type(value), value)
+        if typed_key not in typed_ids:
+            typed_ids[typed_key] = len(typed)
+            typed.append(value)
+        return TYPED | typed_ids[typed_key]
+
+    column_ids = {col: _u32(intern(row[col]) if col in row else MISSING for row in rows) for col in columns}
+    # 行ごとのキー順（列番号の並び）。全行が columns と同じ順なら空
+    orders = [[columns.index(c) for c in row] for row in rows]
+    row_orders = {}
+    for i, order in enumerate(orders):
+        expected = [j for j, c in enumerate(columns) if c in rows[i]]
+        if order != expected:
+            row_orders[i] = order
+
+    # 索引はキー列の文字列で引く（文字列でない値は "" として並べる）
+    key_values = [row.get(key, "") if isinstance(row.get(key), str) else "" for row in rows]
+    name_idx = _u32(sorted(range(len(rows)), key=lambda i: key_values[i]))
+
+    encoded = [value.encode("utf-8") for value in strings]
+    blob = b"\0".join(encoded)
+    sections = {}
+    offset = 0
+    payload = []
+
+    def add_section(name: str, data: bytes):
+        nonlocal offset
+        sections[name] = [offset, len(data)]
+        payload.append(data)
+        offset += len(data)
+        pad = (-offset) % 8
+        if pad:
+            payload.append(b"\0" * pad)
+            offset += pad
+
+    add_section("strings", blob)
+    if lazy_strings:
+        # 文字列 i は blob[offsets[i]:offsets[i + 1] - 1]
+        add_section("string_offsets", array("Q", accumulate((len(e) + 1 for e in encoded), initial=0)).tobytes())
+    add_section("typed", json.dumps(typed).encode("utf-8"))
+    for col in columns:
+        add_section(f"col:{col}", column_ids[col].tobytes())
+    add_section("name_idx", name_idx.tobytes())
+
+    header = {
+        "schema": SCHEMA_VERSION,
+        "byteorder": sys.byteorder,
+        **source_info,
+        "key": key,
+        "rows": len(rows),
+        "strings": len(strings),
+        "lazy_strings": lazy_strings,
+        "columns": columns,
+        "row_orders": {str(i): o for i, o in row_orders.items()},
+        "sections": sections,
+        "built_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    prefix_len = 8 + len(header_bytes)
+    prefix_pad = (-prefix_len) % 8
+
+    # 複数ワーカーが同時にビルドしても壊れないよう、一時ファイルはプロセスごとに分ける
+    tmp = out.with_suffix(f"{out.suffix}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(header_bytes)) + header_bytes + b"\0" * prefix_pad)
+        for part in payload:
+            f.write(part)
+    os.replace(tmp, out)
+    return out
+
+
+# ========== 読み込み ==========
+
+class Snapshot:
+    """mmap したスナップショット。行の dict は読むたびに列から作る（呼び出し側が変更してもよい）"""
+
+    def __init__(self, path: Path, data: mmap.mmap, header: dict, base: int):
+        self.path = path
+        self.header = header
+        self._data = data
+        view = memoryview(data)
+
+        def section(name):
+            start, length = header["sections"][name]
+            return view[base + start:base + start + length]
+
+        # 文字列表は一度だけデコードする（値はすべてこのリストを共有する＝インターン済み）。
+        # lazy_strings なら参照のたびに mmap からデコードする（ヒープに載せない）
+        if header.get("lazy_strings"):
+            self.strings: Sequence = LazyStrings(section("strings"), section("string_offsets").cast("Q"))
+        else:
+            self.strings = bytes(section("strings")).decode("utf-8").split("\0")
+        self.typed: list = json.loads(bytes(section("typed")).decode("utf-8"))
+        self.columns: List[str] = header["columns"]
+        self._cols = {col: section(f"col:{col}").cast("I") for col in self.columns}
+        self._name_idx = section("name_idx").cast("I")
+        self._row_orders = {int(i): o for i, o in header.get("row_orders", {}).items()}
+
+    @classmethod
+    def open(cls, path) -> "Snapshot":
+        path = Path(path)
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if data[:4] != MAGIC:
+            raise ValueError(f"スナップショットではありません: {path}")
+        (header_len,) = struct.unpack_from("<I", data, 4)
+        header = json.loads(data[8:8 + header_len].decode("utf-8"))
+        if header.get("schema") != SCHEMA_VERSION:
+            raise ValueError(f"スキーマ版数の不一致: {header.get('schema')} (期待値 {SCHEMA_VERSION})")
+        if header.get("byteorder") != sys.byteorder:
+            raise ValueError(f"バイトオーダーの不一致: {header.get('byteorder')}")
+        base = 8 + header_len + (-(8 + header_len)) % 8
+        return cls(path, data, header, base)
+
+    def __len__(self):
+        return self.header["rows"]
+
+    @property
+    def key(self) -> str:
+        return self.header["key"]
+
+    def _decode(self, sid: int):
+        return self.typed[sid & ~TYPED] if sid & TYPED else self.strings[sid]
+
+    def value(self, i: int, col: str):
+        sid = self._cols[col][i]
+        return None if sid == MISSING else self._decode(sid)
+
+    def row(self, i: int) -> dict:
+        """i 行目の新しい dict（値の文字列はインターン済みのものを共有する）"""
+        order = self._row_orders.get(i)
+        cols = [self.columns[j] for j in order] if order is not None else self.columns
+        row = {}
+        for col in cols:
+            sid = self._cols[col][i]
+            if sid != MISSING:
+                row[col] = self.typed[sid & ~TYPED] if sid & TYPED else self.strings[sid]
+        return row
+
+    def rows(self) -> List[dict]:
+        """全行（load_jsonl の meta と同じ形の新しい list）"""
+        return [self.row(i) for i in range(len(self))]
+
+    def docs(self) -> List[str]:
+        """キー列（load_jsonl の docs と同じ。キーが無い行は ""）"""
+        ids = self._cols.get(self.key)
+        if ids is None:
+            return [""] * len(self)
+        return ["" if sid == MISSING or sid & TYPED else self.strings[sid] for sid in ids]
+
+    def _key_at(self, k: int) -> str:
+        sid = self._cols[self.key][self._name_idx[k]]
+        return "" if sid == MISSING or sid & TYPED else self.strings[sid]
+
+    def _lower_bound(self, name: str) -> int:
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_at(mid) < name:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, name: str) -> Optional[int]:
+        """キー列の値が name の行番号（事前ソート済みの索引を二分探索）"""
+        if self.key not in self._cols:
+            return None
+        k = self._lower_bound(name)
+        if k < len(self) and self._key_at(k) == name:
+            return self._name_idx[k]
+        return None
+
+    def find_all(self, name: str) -> List[int]:
+        """キー列の値が name の行番号すべて（元の行順）"""
+        if self.key not in self._cols:
+            return []
+        k = self._lower_bound(name)
+        found = []
+        while k < len(self) and self._key_at(k) == name:
+            found.append(self._name_idx[k])
+            k += 1
+        return sorted(found)
+
+    def is_fresh(self, source=None) -> bool:
+        """元の JSONL と一致するか（サイズ・mtime が同じなら一致、違えば SHA-1 で確認）"""
+        source = Path(source) if source else self.path.with_name(self.header["source"])
+        try:
+            stat = source.stat()
+        except FileNotFoundError:
+            return False
+        if stat.st_size == self.header["source_size"] and stat.st_mtime_ns == self.header["source_mtime_ns"]:
+            return True
+        return stat.st_size == self.header["source_size"] and _sha1(source) == self.header["source_sha1"]
+
+
+class LazyStrings(Sequence):
+    """lazy_strings のスナップショットの文字列表（添字のたびに mmap からデコードする）"""
+
+    def __init__(self, blob: memoryview, offsets: memoryview):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return bytes(self._blob[self._offsets[i]:self._offsets[i + 1] - 1]).decode("utf-8")
+
+
+class RowSequence(Sequence):
+    """
+    スナップショットの行を list[dict] のように読む遅延シーケンス（load_jsonl の meta）。
+    起動時に全行の dict を作らず、添字・反復のたびに Snapshot.row で 1 行ずつ作る。
+    """
+
+    def __init__(self, snap: Snapshot):
+        self.snap = snap
+
+    def __len__(self):
+        return len(self.snap)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.snap.row(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.snap.row(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.snap.row(i)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, RowSequence)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+
+def load_fresh(source, key: str) -> Optional[Snapshot]:
+    """
+    source に対応する新しいスナップショットがあれば返す。
+    無い・古い・キー列が違う・壊れている場合は None（呼び出し側で JSONL を読む）。
+    """
+    if not ENABLED:
+        return None
+    path = snapshot_path(source)
+    if not path.exists():
+        return None
+    try:
+        snap = Snapshot.open(path)
+    except (ValueError, OSError, KeyError) as e:
+        print(f"⚠️ スナップショットを使えません: {path.name}: {e}")
+        return None
+    if snap.key != key:
+        return None
+    if not snap.is_fresh(source):
+        print(f"⚠️ スナップショットが古いため JSONL を読み込みます: {path.name}"
+              f"（python -m gomi_rag.snapshot で再ビルド）")
+        return None
+    return snap
+
+
+# ========== ベンチマーク ==========
+
+def benchmark(sources, repeat: int = 20) -> dict:
+    """JSONL（json.loads）とスナップショット（mmap）の読み込み時間（ms, 中央値）"""
+    import statistics
+    from .loaders import _load_jsonl_lines
+
+    results = {}
+    for source, key in sources:
+        snap_file = snapshot_path(source)
+        if not snap_file.exists():
+            build_snapshot(source, key)
+        jsonl_ms, open_ms, full_ms = [], [], []
+        for _ in range(repeat):
+            t = time.perf_counter()
+            docs, meta = _load_jsonl_lines(source, key)
+            jsonl_ms.append((time.perf_counter() - t) * 1000)
+
+            t = time.perf_counter()
+            snap = load_fresh(source, key)
+            open_ms.append((time.perf_counter() - t) * 1000)
+            s_docs, s_meta = snap.docs(), snap.rows()
+            full_ms.append((time.perf_counter() - t) * 1000)
+        assert s_docs == docs and s_meta == meta, f"内容の不一致: {source}"
+        results[str(source)] = {
+            "rows": len(meta),
+            "jsonl_ms": round(statistics.median(jsonl_ms), 3),
+            "snapshot_open_ms": round(statistics.median(open_ms), 3),
+            "snapshot_full_ms": round(statistics.median(full_ms), 3),
+            "jsonl_bytes": Path(source).stat().st_size,
+            "snapshot_bytes": snap_file.stat().st_size,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ごみ・町名データのスナップショットをビルドする")
+    parser.add_argument("sources", nargs="*", help="JSONL:キー列（省略時は rag_docs_merged.jsonl:品名 area.jsonl:町名）")
+    parser.add_argument("--bench", action="store_true", help="JSONL との読み込み時間を比較する")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    sources = [tuple(s.rsplit(":", 1)) for s in args.sources] or DEFAULT_SOURCES
+    if args.bench:
+        for source, r in benchmark(sources, args.repeat).items():
+            print(f"{source}: {r['rows']}行 | JSONL {r['jsonl_ms']}ms | "
+                  f"snapshot open {r['snapshot_open_ms']}ms / 全行 {r['snapshot_full_ms']}ms | "
+                  f"{r['jsonl_bytes']} → {r['snapshot_bytes']} bytes")
+        return
+
+    for source, key in sources:
+        t = time.perf_counter()
+        out = build_snapshot(source, key)
+        snap = Snapshot.open(out)
+        print(f"✅ {out} ({len(snap)}行, 文字列 {snap.header['strings']}種, "
+              f"{(time.perf_counter() - t) * 1000:.1f}ms)")
+
+
+if __name__ == "__main__":
+    main()
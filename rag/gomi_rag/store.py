@@ -0,0 +1,335 @@
+"""
+ベクトル DB（ChromaDB）の接続・構築・検索
+
+接続先は CHROMA_MODE で切り替える:
+    embedded  プロセス内の PersistentClient（ローカル SQLite。既定）
+    http      Chroma サーバ（`chroma run --path backend/chroma_db --port 8001`）への HttpClient
+
+http では複数のバックエンドプロセスと Streamlit のアップロードが 1 つのインデックスを共有し、
+SQLite の書き込みロックを取り合わない。クライアントはプロセスごとに 1 つ（HTTP 接続はプールされる）。
+コレクションの呼び出しは一時的なエラー（Chroma への接続断・タイムアウト・SQLite のロック）のみ再試行する。
+テキストの Embedding（Ollama）は再試行の外で計算するので、Ollama の失敗は再試行しない。
+
+chromadb と embedding（Ollama クライアント）は初回使用時に import する。
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+
+# ========== 設定 ==========
+
+class StoreConfig:
+    """ベクトル DB 接続の設定（環境変数で上書き可）"""
+
+    MODE = os.getenv("CHROMA_MODE", "embedded")
+    # embedded: 保存先（build_chroma / add_file_to_chroma の persist_dir が優先）
+    PERSIST_DIR = os.getenv("CHROMA_PERSIST_DIR", "./chroma_db")
+    # http: Chroma サーバ
+    HOST = os.getenv("CHROMA_HOST", "localhost")
+    PORT = int(os.getenv("CHROMA_PORT", "8001"))
+    SSL = os.getenv("CHROMA_SSL", "0") == "1"
+    # HTTP タイムアウト（秒）と接続プールの上限
+    TIMEOUT = float(os.getenv("CHROMA_TIMEOUT", "10"))
+    POOL_SIZE = int(os.getenv("CHROMA_POOL_SIZE", "16"))
+    # 使っていない keep-alive 接続を閉じるまでの秒数（httpx のみ）
+    KEEPALIVE_SEC = float(os.getenv("CHROMA_KEEPALIVE_SEC", "30"))
+    # 一時的なエラーの再試行（回数・初回の待ち時間。以降は倍々）
+    RETRIES = int(os.getenv("CHROMA_RETRIES", "3"))
+    RETRY_BACKOFF_SEC = float(os.getenv("CHROMA_RETRY_BACKOFF_SEC", "0.2"))
+
+
+class IndexConfig:
+    """
+    コレクション別の HNSW 設定（環境変数で上書き可）。
+
+    HNSW_<項目> で全コレクション、HNSW_<コレクション名>_<項目> で個別に上書きする
+    （例: HNSW_SEARCH_EF=64 / HNSW_KNOWLEDGE_M=32）。値は作成時にコレクションの
+    メタデータ（hnsw:*）に書き込まれ、既存のコレクションには効かない（変えるには再構築する）。
+    設定の比較は rag/benchmark_hnsw.py（recall@k と p50 / p99）。
+    """
+
+    # Chroma の既定は l2 / M=16 / construction_ef=100 / search_ef=10
+    DEFAULTS = {"space": "cosine", "M": 16, "construction_ef": 100, "search_ef": 64}
+    # 品目・町名は千件未満なので既定のまま。ナレッジはアップロードで増え続けるのでグラフを密にする
+    PER_COLLECTION = {
+        "knowledge": {"M": 32, "construction_ef": 200, "search_ef": 100},
+    }
+    FIELDS = ("space", "M", "construction_ef", "search_ef")
+    SPACES = ("cosine", "l2", "ip")
+
+    @classmethod
+    def for_collection(cls, name: str) -> dict:
+        settings = {**cls.DEFAULTS, **cls.PER_COLLECTION.get(name, {})}
+        for field in cls.FIELDS:
+            for env in (f"HNSW_{field.upper()}", f"HNSW_{name.upper()}_{field.upper()}"):
+                if env in os.environ:
+                    settings[field] = os.environ[env] if field == "space" else int(os.environ[env])
+        if settings["space"] not in cls.SPACES:
+            raise ValueError(f"hnsw:space は {'/'.join(cls.SPACES)} のいずれか: {settings['space']!r}")
+        return settings
+
+
+# ========== 接続 ==========
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def _configure_http(client):
+    """
+    HttpClient 内部の HTTP セッションにタイムアウトと接続プールの上限を設定する。
+    chromadb の版によって httpx.Client / requests.Session のどちらか（見つからなければ何もしない）。
+    """
+    server = getattr(client, "_server", None)
+    session = getattr(server, "_session", None)
+    if session is None:
+        return
+    try:
+        import httpx
+        if isinstance(session, httpx.Client):
+            # httpx の接続プールの上限は作成時にしか渡せないので、同じ接続先・ヘッダで作り直す
+            settings = getattr(server, "_settings", None)
+            verify = getattr(settings, "chroma_server_ssl_verify", None)
+            server._session = httpx.Client(
+                base_url=session.base_url,
+                headers=session.headers,
+                cookies=session.cookies,
+                timeout=httpx.Timeout(StoreConfig.TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=StoreConfig.POOL_SIZE,
+                    max_keepalive_connections=StoreConfig.POOL_SIZE,
+                    keepalive_expiry=StoreConfig.KEEPALIVE_SEC,
+                ),
+                verify=True if verify is None else verify,
+            )
+            session.close()
+            return
+    except ImportError:
+        pass
+    try:
+        import requests
+        from requests.adapters import HTTPAdapter
+        if isinstance(session, requests.Session):
+            adapter = HTTPAdapter(pool_connections=StoreConfig.POOL_SIZE, pool_maxsize=StoreConfig.POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            # requests.Session には既定のタイムアウトが無いので request に渡す
+            request = session.request
+            session.request = lambda *a, **kw: request(*a, **{"timeout": StoreConfig.TIMEOUT, **kw})
+    except ImportError:
+        pass
+
+
+def get_client(persist_dir=None):
+    """
+    プロセス共通の Chroma クライアント（モード・保存先ごとに 1 つ）。
+    http モードでは persist_dir は無視する（保存先はサーバ側で指定する）。
+    """
+    import chromadb
+
+    mode = StoreConfig.MODE
+    key = (mode, str(persist_dir or StoreConfig.PERSIST_DIR)) if mode == "embedded" else (mode,)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            if mode == "http":
+                client = chromadb.HttpClient(host=StoreConfig.HOST, port=StoreConfig.PORT, ssl=StoreConfig.SSL)
+                _configure_http(client)
+                with_retry(client.heartbeat)  # サーバに届かなければここで失敗させる
+                print(f"🔗 Chroma サーバに接続: {StoreConfig.HOST}:{StoreConfig.PORT}")
+            elif mode == "embedded":
+                client = chromadb.PersistentClient(path=key[1])
+            else:
+                raise ValueError(f"CHROMA_MODE は embedded / http のいずれか: {mode!r}")
+            _clients[key] = client
+    return client
+
+
+def _transient_errors() -> tuple:
+    """
+    再試行する例外（Chroma クライアントの接続断・タイムアウトと SQLite のロック）。
+    組み込みの ConnectionError / TimeoutError は Ollama（Embedding）の失敗でも
+    送出されるので含めない（RetryingCollection は Embedding を再試行の外で計算する）。
+    """
+    errors = [sqlite3.OperationalError]
+    try:
+        import httpx
+        errors.append(httpx.TransportError)
+    except ImportError:
+        pass
+    try:
+        import requests
+        errors += [requests.ConnectionError, requests.Timeout]
+    except ImportError:
+        pass
+    return tuple(errors)
+
+
+def with_retry(fn, *args, **kwargs):
+    """fn を呼び、一時的なエラーなら StoreConfig.RETRIES 回まで待ってから再試行する"""
+    errors = _transient_errors()
+    delay = StoreConfig.RETRY_BACKOFF_SEC
+    for attempt in range(StoreConfig.RETRIES + 1):
+        try:
+            return fn(*args, **kwargs)
+        except errors as e:
+            # SQLite はロック待ちのみ（スキーマ不一致などは再試行しない）
+            if attempt == StoreConfig.RETRIES or (isinstance(e, sqlite3.OperationalError) and "locked" not in str(e)):
+                raise
+            print(f"⚠️ Chroma 呼び出し失敗（{attempt + 1}/{StoreConfig.RETRIES} 回目の再試行）: {e}")
+            time.sleep(delay)
+            delay *= 2
+
+
+class RetryingCollection:
+    """
+    コレクションの読み書きを with_retry で包む（その他の属性はそのまま）。
+    テキストの Embedding は再試行の外で先に計算し、Chroma の呼び出しだけを再試行する
+    （Ollama の失敗は Chroma の失敗として再試行・ログ出力しない）。
+    """
+
+    RETRIED = {"query", "get", "count", "peek", "add", "upsert", "update", "delete"}
+    # メソッド → (テキストの引数, ベクトルの引数)
+    EMBEDDED = {
+        "query": ("query_texts", "query_embeddings"),
+        "add": ("documents", "embeddings"),
+        "upsert": ("documents", "embeddings"),
+        "update": ("documents", "embeddings"),
+    }
+
+    def __init__(self, collection, embedding_function=None):
+        self._collection = collection
+        self._embedding_function = embedding_function
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name not in self.RETRIED:
+            return attr
+
+        def call(*args, **kwargs):
+            self._embed_texts(name, kwargs)
+            return with_retry(attr, *args, **kwargs)
+        return call
+
+    def _embed_texts(self, name, kwargs):
+        texts_arg, vectors_arg = self.EMBEDDED.get(name, (None, None))
+        if self._embedding_function is None or texts_arg is None:
+            return
+        texts = kwargs.get(texts_arg)
+        if texts is None or kwargs.get(vectors_arg) is not None:
+            return
+        if isinstance(texts, str):
+            texts = [texts]
+        kwargs[vectors_arg] = self._embedding_function(list(texts))
+        if name == "query":
+            # query_texts と query_embeddings は同時に渡せない（documents は保存するので残す）
+            del kwargs[texts_arg]
+
+
+def index_metadata(name: str, settings: dict = None) -> dict:
+    """
+    コレクション作成時のメタデータ。HNSW 設定と Embedding モデルを記録し、
+    どの設定で構築したかをコレクション自体から再現できるようにする。
+    """
+    from .embedding import EmbeddingConfig
+
+    settings = settings or IndexConfig.for_collection(name)
+    meta = {f"hnsw:{field}": settings[field] for field in IndexConfig.FIELDS}
+    meta["embedding_model"] = EmbeddingConfig.MODEL
+    meta["built_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    return meta
+
+
+def get_collection(name, persist_dir=None, create=False, embedding_function=None):
+    """
+    コレクションを取得する（create=True なら無ければ IndexConfig の HNSW 設定で作成）。
+    embedding_function を省略すると embedding.get_embedding_function() を使う。
+    存在せず create=False の場合は chromadb の例外をそのまま送出する。
+    """
+    if embedding_function is None:
+        from .embedding import get_embedding_function
+        embedding_function = get_embedding_function()
+    client = get_client(persist_dir)
+    try:
+        collection = with_retry(client.get_collection, name, embedding_function=embedding_function)
+    except Exception:
+        if not create:
+            raise
+        # get_or_create_collection は既存コレクションのメタデータを上書きし得るので、無い場合だけ作る
+        try:
+            collection = with_retry(
+                client.create_collection, name,
+                metadata=index_metadata(name), embedding_function=embedding_function,
+            )
+        except Exception:  # 他のプロセスが先に作成した
+            collection = with_retry(client.get_collection, name, embedding_function=embedding_function)
+    return RetryingCollection(collection, embedding_function)
+
+
+def collection_space(collection) -> str:
+    """コレクションの距離空間（メタデータが無ければ Chroma の既定の l2）"""
+    return (getattr(collection, "metadata", None) or {}).get("hnsw:space", "l2")
+
+
+def distance_to_similarity(distance: float, space: str) -> float:
+    """
+    Chroma の距離を [0, 1] の類似度に変換する。
+
+    HybridConfig / TemplateConfig の閾値は、Chroma 既定の l2 で構築した既存コレクションの
+    1 - distance で調整されている。Ollama の /api/embed は L2 正規化したベクトルを返すので
+    l2 の distance（二乗距離）は 2 - 2cos で、この尺度は 2cos - 1 になる。
+    どの空間でも同じ 2cos - 1 を返し、既存の l2 コレクションの値は変えず、
+    cosine で再構築したコレクションにも同じ閾値を使えるようにする:
+        l2      distance = 2 - 2cos  →  1 - distance
+        cosine  distance = 1 - cos   →  1 - 2 * distance
+        ip      distance = 1 - 内積（正規化済みベクトルでは 1 - cos）→  1 - 2 * distance
+    cos が 0.5 以下のものは 0。
+    """
+    similarity = 1.0 - distance if space == "l2" else 1.0 - 2.0 * distance
+    return max(0.0, min(1.0, similarity))
+
+
+# ========== ベクトル DB 構築 ==========
+def build_chroma(docs, meta, name="collection", persist_dir="./chroma_db"):
+    """
+    ChromaDB コレクションを作成し（HNSW 設定は IndexConfig）、embedding を保存する。
+    """
+    # 既存のコレクションを削除
+    try:
+        #client.delete_collection(name)
+        collection = get_collection(name, persist_dir)
+        return collection
+    except:
+        # 無ければ新規作成
+        # 新しいコレクションを作成
+        collection = get_collection(name, persist_dir, create=True)
+
+        # ドキュメントを追加
+        collection.add(
+            documents=list(docs),
+            metadatas=[dict(m) for m in meta],  # スナップショットの遅延シーケンスも dict のリストにする
+            ids=[f"{name}_{i}" for i in range(len(docs))]
+        )
+    return collection
+
+
+# ========== クエリ ==========
+def query_chroma(collection, query, n=3):
+    results = collection.query(query_texts=[query], n_results=n)
+    if results and results["metadatas"]:
+        hits = []
+        distances = (results.get("distances") or [[]])[0] or [None] * len(results["metadatas"][0])
+        space = collection_space(collection)
+        # documents と metadatas をペアにして返す
+        for meta, doc, dist in zip(results["metadatas"][0], results["documents"][0], distances):
+            m = dict(meta)
+            m["text"] = doc   # ← documents から本文を付与
+            if dist is not None:
+                m["distance"] = dist
+                m["similarity"] = distance_to_similarity(dist, space)
+            hits.append(m)
+        return hits
+    return []
@@ -4,17 +4,36 @@ Hybrid品名指称系统单元测试
 独立测试模块，不依赖现有系统
 """
 
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
 import pytest
 import chromadb
-from hybrid_grounding import (
+from gomi_rag.hybrid_grounding import (
     hybrid_grounding,
     path_a_global_embedding,
     path_b_llm_filter,
     merge_candidates,
+    lookup_alias,
+    load_aliases,
+    chunk_nouns,
+    normalize_alias,
     HybridConfig,
-    Candidate
+    Candidate,
+    GroundingResult
 )
-from rag_demo3 import load_jsonl, build_chroma
+from gomi_rag import load_jsonl, build_chroma
+from answer_template import can_render, render_answer
+from answer_table import PLACEHOLDER_AREA, AnswerTable, _input_hash, _vet, plan_entries, variant_key
+from gomi_rag.context_packer import ContextItem, pack_context
+from gomi_rag.prompt_builder import SectionTracker, trim_to_sections
+from gomi_rag import embedding, generation, quantized, shared, snapshot
+from gomi_rag import store
+from gomi_rag.store import RetryingCollection, distance_to_similarity
 
 
 # ========== Fixtures ==========
@@ -252,6 +271,502 @@ def test_performance_benchmark(gomi_collection):
     print(f"\n短输入性能: {short_time:.2f}ms (目标: <300ms)")
 
 
+# ========== 模板回答测试 ==========
+
+def _grounding(candidates, confidence="high", ambiguous=False):
+    return GroundingResult(
+        candidates=candidates,
+        primary_candidate=candidates[0] if candidates else None,
+        is_ambiguous=ambiguous,
+        confidence_level=confidence,
+        execution_time_ms=0.0,
+        path_used="path_a_only"
+    )
+
+
+def test_template_render_with_area():
+    """测试模板回答 - 带町名收集日"""
+    meta = {"品名": "ハーモニカ", "出し方": "家庭ごみ"}
+    area = {"町名": "石坪町", "家庭ごみの収集日": "火曜日・金曜日"}
+    answer = render_answer(meta, area)
+
+    assert "- 品名: ハーモニカ" in answer
+    assert "- 品名の出し方: 家庭ごみ" in answer
+    assert "- 備考: 特になし" in answer
+    assert "石坪町の家庭ごみは火曜日・金曜日です。" in answer
+
+
+def test_template_can_render_rules():
+    """测试模板回答判定 - 高置信度才允许，歧义/多品名/知识库交给LLM"""
+    meta = {"品名": "冷蔵庫", "出し方": "市が収集しないもの"}
+    high = _grounding([Candidate("冷蔵庫", 0.9, "path_a", meta)])
+    assert can_render({"grounding_result": high})[0]
+
+    assert not can_render({"grounding_result": _grounding([Candidate("冷蔵庫", 0.5, "path_a", meta)], "medium")})[0]
+    assert not can_render({"grounding_result": _grounding([Candidate("冷蔵庫", 0.9, "path_a", meta)], ambiguous=True)})[0]
+
+    multi = _grounding([
+        Candidate("冷蔵庫", 0.9, "path_b:冷蔵庫", meta),
+        Candidate("プリンター", 0.8, "path_b:プリンター", {}),
+    ])
+    assert can_render({"grounding_result": multi}) == (False, "multi_item")
+
+    knowledge = {"grounding_result": high, "knowledge_hits": [{"file": "a.pdf", "distance": 0.2, "similarity": 0.8}]}
+    assert can_render(knowledge) == (False, "knowledge")
+    # l2 空间的距离 1.2（相似度 0.4）不是相关知识，不应阻止模板回答
+    unrelated = {"grounding_result": high, "knowledge_hits": [{"file": "a.pdf", "distance": 0.6, "similarity": 0.4}]}
+    assert can_render(unrelated)[0]
+
+
+def test_answer_table_fills_area():
+    """测试回答表 - 收集日变体在查询时把占位町名替换为用户的町名"""
+    item = "回答A"
+    day = f"{PLACEHOLDER_AREA}の家庭ごみは火曜日です。"
+    data = (item + day).encode("utf-8")
+    meta = {"品名": "ハーモニカ", "出し方": "家庭ごみ"}
+    entries = {
+        variant_key("ハーモニカ"): [0, len(item.encode("utf-8")), _input_hash(meta, None, "swallow")],
+        variant_key("ハーモニカ", "火曜日"): [
+            len(item.encode("utf-8")), len(day.encode("utf-8")), _input_hash(meta, "火曜日", "swallow"),
+        ],
+    }
+    table = AnswerTable(entries, data, {"model": "swallow"})
+
+    answer = table.lookup(meta, {"町名": "石坪町", "家庭ごみの収集日": "火曜日"})
+    assert answer == "石坪町の家庭ごみは火曜日です。"
+    assert PLACEHOLDER_AREA not in answer
+    assert table.lookup(meta) == "回答A"
+    # 没有对应收集日的变体时交给模板/LLM
+    assert table.lookup(meta, {"町名": "石坪町", "家庭ごみの収集日": "水曜日"}) is None
+    # 源数据变化后（哈希不一致）不再使用旧回答
+    assert table.lookup({**meta, "備考": "電池は外す"}) is None
+
+
+def test_answer_table_plan_dedupes_keys():
+    """测试回答表 - 同一品名的重复行只生成一次（避免 .dat 中残留无用数据）"""
+    gomi_meta = [
+        {"品名": "ハーモニカ", "出し方": "家庭ごみ"},
+        {"品名": "ハーモニカ", "出し方": "家庭ごみ", "備考": "重複"},
+        {"品名": "たんす", "出し方": "粗大ごみ"},
+    ]
+    area_meta = [{"町名": "石坪町", "家庭ごみの収集日": "火曜日"}, {"町名": "東町", "家庭ごみの収集日": "金曜日"}]
+    plan = plan_entries(gomi_meta, area_meta, with_days=True)
+    keys = [key for key, _, _ in plan]
+    assert len(keys) == len(set(keys))
+    assert variant_key("ハーモニカ", "金曜日") in keys
+    assert next(row for key, row, _ in plan if key == "ハーモニカ") is gomi_meta[0]
+
+
+# ========== 别名表测试 ==========
+
+@pytest.fixture
+def reviewed_aliases(tmp_path, monkeypatch):
+    """测试用别名表（reviewed 条目），不依赖 aliases.json 的内容"""
+    from gomi_rag import hybrid_grounding
+
+    path = tmp_path / "aliases.json"
+    path.write_text(json.dumps({"version": 1, "aliases": {
+        "ノートPC": {"品名": "ノートパソコン", "status": "reviewed", "count": 3},
+        "スマホ": {"品名": "携帯電話（スマートフォン・ガラホ含む）", "status": "reviewed", "count": 5},
+        "ガラケー": {"品名": "携帯電話（スマートフォン・ガラホ含む）", "status": "pending", "count": 1},
+    }}, ensure_ascii=False), encoding="utf-8")
+    aliases = load_aliases(path)
+    monkeypatch.setattr(hybrid_grounding, "_ALIASES", aliases)
+    return aliases
+
+
+def test_alias_lookup(gomi_collection, reviewed_aliases):
+    """测试别名表 - 口语表达在Embedding/LLM之前直接映射到品名"""
+    assert normalize_alias("ノートＰＣ ") == "ノートpc"
+    # pending 条目不加载
+    assert "ガラケー" not in reviewed_aliases
+
+    candidate = lookup_alias("ノートPCを捨てたい", gomi_collection)
+    assert candidate is not None
+    assert candidate.item_name == "ノートパソコン"
+    assert candidate.source == "alias"
+    assert candidate.similarity == 1.0
+
+    result = hybrid_grounding("スマホの捨て方", gomi_collection)
+    assert result.path_used == "alias"
+    assert result.confidence_level == "high"
+
+
+def test_alias_with_other_nouns(gomi_collection, reviewed_aliases, monkeypatch):
+    """测试别名表 - 输入中还有其他名词块时降为中置信度（不直接走模板）"""
+    from gomi_rag import hybrid_grounding as hg
+
+    assert hg.other_noun_chunks("スマホの捨て方", "携帯電話（スマートフォン・ガラホ含む）") == []
+
+    monkeypatch.setattr(hg, "_extract_phrases_with_mecab", lambda text, n: ["スマホ", "充電器"])
+    assert hg.other_noun_chunks("スマホの捨て方", "携帯電話（スマートフォン・ガラホ含む）") == ["充電器"]
+    result = hybrid_grounding("スマホの捨て方", gomi_collection)
+    assert result.path_used == "alias"
+    assert result.confidence_level == "medium"
+    assert not can_render({"grounding_result": result})[0]
+
+
+def test_mecab_noun_chunks():
+    """测试MeCab复合名词切分 - 连续名词合并，接尾词开头不成块"""
+    tokens = [
+        ("ノート", "名詞,一般,*,*"), ("パソコン", "名詞,一般,*,*"), ("と", "助詞,並立助詞,*,*"),
+        ("古い", "形容詞,自立,*,*"), ("プリンター", "名詞,一般,*,*"), ("、", "記号,読点,*,*"),
+        ("壊れ", "動詞,自立,*,*"), ("た", "助動詞,*,*,*"),
+        ("電子", "名詞,一般,*,*"), ("レンジ", "名詞,一般,*,*"), ("の", "助詞,連体化,*,*"),
+        ("捨て", "動詞,自立,*,*"), ("方", "名詞,接尾,一般,*"),
+    ]
+    assert chunk_nouns(tokens) == ["ノートパソコン", "プリンター", "電子レンジ"]
+
+
+# ========== 提前停止测试 ==========
+
+def _feed_in_chunks(text, size=3):
+    """模拟流式输出：按小块喂给 SectionTracker，返回 (送出的文本, 是否停止)"""
+    tracker = SectionTracker()
+    out = []
+    for i in range(0, len(text), size):
+        chunk, stop = tracker.feed(text[i:i + size])
+        out.append(chunk)
+        if stop:
+            return "".join(out), True
+    return "".join(out) + tracker.finish(), False
+
+
+def test_section_tracker_keeps_multiline_schedule():
+    """测试提前停止 - 收集日是标题加缩进行时，缩进块全部保留，到空行后的补充才停止"""
+    block = (
+        f"- 品名: たんす\n- 品名の出し方: 粗大ごみ\n- 備考: 事前申込制\n"
+        f"- 該当町名の収集日:\n  - 家庭ごみ: 月・木\n  - プラスチック: 水\n"
+    )
+    text, stop = _feed_in_chunks(block + "\nなお、ご不明な点があればお問い合わせください。\n")
+    assert stop and text == block
+    assert trim_to_sections(block + "\n- 補足: 電話で申し込んでください\n") == block
+    # 收集日变体的回答表条目保留了收集日，可以通过检验
+    row = {"品名": "たんす", "出し方": "粗大ごみ"}
+    assert _vet(block.replace("該当町名", PLACEHOLDER_AREA), row, "月・木")
+
+
+def test_section_tracker_multiple_items():
+    """测试提前停止 - 多个品名时继续输出下一个品名块（空行分隔或紧接），之后的顶层补充项才停止"""
+    first = "- 品名: たんす\n- 出し方: 粗大ごみ\n- 備考: なし\n- 収集日: 月曜日\n"
+    second = "- 品名: いす\n- 出し方: 粗大ごみ\n- 備考: なし\n- 収集日:\n  - 粗大ごみ: 火曜日\n"
+    text, stop = _feed_in_chunks(first + "\n" + second + "- 補足: 以上です\n")
+    assert stop and text == first + "\n" + second
+    text, stop = _feed_in_chunks(first + second)
+    assert not stop and text == first + second
+
+
+def test_context_packer_budget():
+    """测试上下文打包 - 必需项优先，重复chunk去除，超出预算的知识chunk被截断"""
+    chunk = "粗大ごみは事前申込制です。申込センターに電話してください。" * 10
+    items = [
+        ContextItem("knowledge", "ファイル: a.pdf\n" + chunk, score=0.9),
+        ContextItem("knowledge", "ファイル: b.pdf\n" + chunk, score=0.8),
+        ContextItem("gomi", "品名: たんす\n出し方: 粗大ごみ\n備考: ", score=0.1, required=True),
+        ContextItem("knowledge", "ファイル: c.csv\n" + "区分 収集日 " * 200, score=0.5),
+    ]
+    packed = pack_context(items, budget=300)
+    assert packed.sections["gomi"][0].startswith("品名: たんす")
+    assert packed.deduped == 1
+    assert packed.tokens <= 300
+    assert packed.included + packed.deduped + packed.dropped == len(items)
+    assert packed.render().startswith("【ごみ分別情報】")
+
+
+# ========== Embedding 合并测试 ==========
+
+class FakeEmbed:
+    """替换 Ollama 的 embed：记录每次调用的批次，向量为 [文本长度]；before 在返回前调用（模拟失败/阻塞）"""
+
+    def __init__(self):
+        self.calls = []
+        self.before = None
+
+    def __call__(self, model, texts):
+        self.calls.append(list(texts))
+        if self.before:
+            self.before(texts)
+        return {"embeddings": [[float(len(t))] for t in texts]}
+
+
+@pytest.fixture
+def fake_embed(monkeypatch):
+    fake = FakeEmbed()
+    monkeypatch.setattr(embedding.ollama_client, "embed", fake)
+    return fake
+
+
+def _embed_concurrently(coalescer, inputs):
+    with ThreadPoolExecutor(len(inputs)) as pool:
+        futures = [pool.submit(coalescer.embed, texts) for texts in inputs]
+        return [f.exception() or f.result() for f in futures]
+
+
+def test_coalescer_batches_up_to_max_batch(fake_embed):
+    """测试 Embedding 合并 - 同时到达的请求合并为一次调用，每批不超过 MAX_BATCH，结果按调用者分发"""
+    coalescer = embedding.EmbeddingCoalescer("ruri", max_batch=4, max_wait_ms=300)
+    inputs = [["a" * (i + 1)] for i in range(6)]
+    results = _embed_concurrently(coalescer, inputs)
+    assert results == [[[float(i + 1)]] for i in range(6)]
+    assert sorted(len(batch) for batch in fake_embed.calls) == [2, 4]
+    # MAX_BATCH 以上的输入（如构建 collection）直接调用
+    coalescer.embed(["x"] * 4)
+    assert fake_embed.calls[-1] == ["x"] * 4
+    assert coalescer.stats()["direct"] == 1
+
+
+def test_coalescer_flushes_after_max_wait(fake_embed):
+    """测试 Embedding 合并 - 批次未满时等待 MAX_WAIT_MS 后发送"""
+    coalescer = embedding.EmbeddingCoalescer("ruri", max_batch=32, max_wait_ms=50)
+    start = time.perf_counter()
+    assert coalescer.embed(["ごみ"]) == [[2.0]]
+    elapsed = time.perf_counter() - start
+    assert 0.04 <= elapsed < 1.0
+    assert fake_embed.calls == [["ごみ"]]
+
+
+def test_coalescer_error_reaches_all_waiters(fake_embed):
+    """测试 Embedding 合并 - 批量调用失败时同一批的所有调用者都收到异常"""
+
+    def fail(texts):
+        raise ConnectionError("Ollama 未启动")
+
+    fake_embed.before = fail
+    coalescer = embedding.EmbeddingCoalescer("ruri", max_batch=32, max_wait_ms=100)
+    results = _embed_concurrently(coalescer, [["a"], ["b"], ["c"]])
+    assert all(isinstance(r, ConnectionError) for r in results)
+    assert len(fake_embed.calls) == 1
+    assert coalescer.stats()["errors"] == 1
+
+
+def test_coalescer_timeout(fake_embed):
+    """测试 Embedding 合并 - Ollama 无响应时调用者在 timeout_sec 后收到 TimeoutError"""
+    release = threading.Event()
+    fake_embed.before = lambda texts: release.wait(2)
+    coalescer = embedding.EmbeddingCoalescer("ruri", max_batch=32, max_wait_ms=1, timeout_sec=0.1)
+    try:
+        with pytest.raises(TimeoutError):
+            coalescer.embed(["たんす"])
+    finally:
+        release.set()
+
+
+def test_deadline_holds_slot_until_upstream_closes(monkeypatch):
+    """测试生成截止 - Ollama 停滞时按截止时间超时，但要等读取线程关闭连接（生成停止）后才通知释放执行槽"""
+    release = threading.Event()
+    closed = []
+
+    def fake_chat(**kwargs):
+        def stream():
+            try:
+                release.wait(2)
+                yield {"message": {"content": "- 品名: たんす"}, "done": False}
+                yield {"message": {"content": ""}, "done": True}
+            finally:
+                closed.append(1)
+        return stream()
+
+    monkeypatch.setattr(generation.ollama_client, "chat", fake_chat)
+    with pytest.raises(generation.GenerationTimeout) as info:
+        generation._chat_with_deadline("swallow", [], deadline_sec=0.1)
+    stopped = threading.Event()
+    info.value.when_stopped(stopped.set)
+    assert not stopped.is_set()
+
+    release.set()
+    assert stopped.wait(2)
+    assert closed == [1]
+
+
+def test_early_stop_keeps_eval_stats(monkeypatch):
+    """测试提前停止 - 不等最终事件就停止时，按已收到的token数和时间估算评价计数"""
+    answer = "- 品名: たんす\n- 出し方: 粗大ごみ\n- 備考: なし\n- 収集日: 月曜日\n"
+    tokens = [answer[i:i + 3] for i in range(0, len(answer), 3)] + ["\n", "- 補足", ": 以上"]
+
+    def fake_chat(**kwargs):
+        for tok in tokens:
+            yield {"message": {"content": tok}, "done": False}
+        yield {"message": {"content": ""}, "done": True, "eval_count": 999}
+
+    monkeypatch.setattr(generation.ollama_client, "chat", fake_chat)
+    monkeypatch.setattr(generation.GenerationConfig, "EARLY_STOP", True)
+    content, stats = generation.ask_ollama("質問", model="swallow", return_stats=True, deadline_sec=5)
+    assert content == answer
+    assert stats["stop_reason"] == "sections" and stats["estimated"]
+    assert 0 < stats["output_tokens"] <= len(tokens) - 1
+    assert stats["total_ms"] is not None and stats["prompt_tokens"] is None
+
+
+def test_snapshot_roundtrip(tmp_path):
+    """测试二进制快照 - 与JSONL内容一致，名称索引可查，源文件变化后判定为过期"""
+    source = tmp_path / "area.jsonl"
+    source.write_text(Path("area.jsonl").read_text(encoding="utf-8"), encoding="utf-8")
+    docs, meta = load_jsonl(source, key="町名")
+
+    snapshot.build_snapshot(source, "町名")
+    snap = snapshot.load_fresh(source, "町名")
+    assert snap is not None
+    assert snap.docs() == docs and snap.rows() == meta
+    assert snap.row(snap.find(docs[10]))["町名"] == docs[10]
+    assert snap.find("存在しない町") is None
+
+    # 快照可用时 meta 为按需构建行的惰性序列；返回的行是副本，修改不影响快照
+    lazy_docs, lazy_meta = load_jsonl(source, key="町名")
+    assert isinstance(lazy_meta, snapshot.RowSequence)
+    assert lazy_docs == docs and lazy_meta == meta and lazy_meta[-1] == meta[-1]
+    lazy_meta[0]["町名"] = "書き換え"
+    assert lazy_meta[0]["町名"] == docs[0]
+
+    with open(source, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"町名": "新町"}, ensure_ascii=False) + "\n")
+    assert snapshot.load_fresh(source, "町名") is None
+
+
+class ArrayCollection:
+    """测试用的最小 Chroma collection（只实现导出用到的 get / count，以及固定返回 "chroma" 的 query）"""
+
+    def __init__(self, name, embeddings, metadatas, space="l2"):
+        self.name = name
+        self.id = f"{name}-id"
+        self.metadata = {"hnsw:space": space}
+        self.embeddings = embeddings
+        self.metadatas = metadatas
+
+    def count(self):
+        return len(self.embeddings)
+
+    def get(self, include=None, limit=None, offset=0):
+        rows = range(self.count())[offset:None if limit is None else offset + limit]
+        return {
+            "ids": [f"id{i}" for i in rows],
+            "embeddings": [self.embeddings[i] for i in rows],
+            "metadatas": [self.metadatas[i] for i in rows],
+            "documents": [f"doc{i}" for i in rows],
+        }
+
+    def query(self, **kwargs):
+        return {"ids": [["chroma"]], "metadatas": [[{}]], "documents": [[""]], "distances": [[0.0]]}
+
+
+def test_shared_collection_where_include(tmp_path, monkeypatch):
+    """测试共享collection - 分页导出；where 过滤与 include 字段选择和 Chroma 一致，不支持的参数报错"""
+    monkeypatch.setattr(shared, "DATA_DIR", tmp_path)
+    monkeypatch.setattr(shared, "EXPORT_PAGE", 3)
+    embeddings = [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0], [0.6, 0.8, 0.0]]
+    metadatas = [{"file": f"f{i}.pdf", "kind": "a" if i % 2 else "b"} for i in range(4)]
+    collection = shared.shared_collection(ArrayCollection("items", embeddings, metadatas), "file")
+
+    res = collection.get(where={"kind": "a"})
+    assert res["ids"] == ["id1", "id3"] and res["embeddings"] is None
+    assert res["documents"] == ["doc1", "doc3"] and res["metadatas"][1] == metadatas[3]
+    assert collection.get(ids=["id3", "missing", "id0"])["ids"] == ["id3", "id0"]
+    # ID 与文档放在 mmap 的快照里，export.json 只有概要
+    info = json.loads((tmp_path / "items.export.json").read_text(encoding="utf-8"))
+    assert info["count"] == 4 and "documents" not in info and "ids" not in info
+    assert collection.get(ids=["id2"], include=["embeddings"])["embeddings"] == [[0.0, 0.0, 1.0]]
+
+    res = collection.query(query_embeddings=[[1.0, 0.0, 0.0]], n_results=1, where={"kind": {"$in": ["a"]}})
+    assert res["ids"] == [["id3"]] and res["metadatas"][0][0]["file"] == "f3.pdf"
+    res = collection.query(query_embeddings=[[1.0, 0.0, 0.0]], n_results=2, include=["distances"])
+    assert res["ids"] == [["id0", "id3"]] and res["documents"] is None
+
+    with pytest.raises(NotImplementedError):
+        collection.query(query_embeddings=[[1.0, 0.0, 0.0]], where_document={"$contains": "doc"})
+    with pytest.raises(NotImplementedError):
+        collection.get(include=["uris"])
+
+
+def test_quantized_typed_metadata_and_refresh(tmp_path, monkeypatch):
+    """测试量化层 - PDF 的整数元数据按原类型导出；不是每次查询都问 Chroma 条数；上传通知后改查 Chroma 并在后台重新导出"""
+    monkeypatch.setattr(shared, "DATA_DIR", tmp_path)
+    embeddings = [[1.0 if j == i else 0.0 for j in range(8)] for i in range(4)]
+    metadatas = [{"file": "a.pdf", "page": i // 2 + 1, "chunk": i % 2} for i in range(3)]
+    metadatas.append({"file": "b.csv", "row_start": 0, "index": 3})
+    source = ArrayCollection("knowledge", embeddings, metadatas)
+    collection = quantized.quantized_collection(source, "file", "int8")
+
+    counts = []
+    monkeypatch.setattr(source, "count", lambda: counts.append(1) or len(source.embeddings))
+    res = collection.query(query_embeddings=[embeddings[2]], n_results=1)
+    assert res["ids"] == [["id2"]] and res["metadatas"][0][0] == {"file": "a.pdf", "page": 2, "chunk": 0}
+    assert collection.get(where={"page": {"$gte": 2}})["ids"] == ["id2"]
+    assert len(counts) == 1
+
+    # 上传后（add_file_to_chroma 发出通知）：导出完成前查询 Chroma，完成后换成新的导出
+    source.embeddings.append([0.0] * 7 + [1.0])
+    source.metadatas.append({"file": "c.pdf", "page": 1, "chunk": 0})
+    # 通知前（CHECK_SEC 内）は条数不确认，仍使用旧的导出
+    assert collection.query(query_embeddings=[source.embeddings[4]], n_results=1)["ids"] != [["chroma"]]
+    assert len(counts) == 1
+    shared.mark_changed("knowledge")
+    assert collection.query(query_embeddings=[source.embeddings[4]], n_results=1)["ids"] == [["chroma"]]
+    for _ in range(100):
+        if collection._current.count() == 5:
+            break
+        time.sleep(0.05)
+    res = collection.query(query_embeddings=[source.embeddings[4]], n_results=1)
+    assert res["ids"] == [["id4"]] and res["metadatas"][0][0]["page"] == 1
+
+
+def test_quantized_kinds(tmp_path, monkeypatch):
+    """测试量化层 - int8 扫描（跨块复用缓冲区）与逐行计算一致；float32 为全量精确检索；binary 默认重排倍率 16"""
+    import numpy as np
+
+    monkeypatch.setattr(shared, "DATA_DIR", tmp_path)
+    monkeypatch.setattr(quantized.QuantConfig, "SCAN_CHUNK", 7)
+    rng = np.random.default_rng(0)
+    matrix = rng.standard_normal((30, 8)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    scanner = quantized.build_scanner("int8", matrix)
+    expected = -(scanner.codes.astype(np.float32) * scanner.scale) @ matrix[4]
+    assert np.allclose(scanner.scores(matrix[4]), expected, atol=1e-5)
+    assert quantized.QuantConfig.RERANK_FACTOR == {"int8": 8, "binary": 16}
+
+    source = ArrayCollection("knowledge", matrix.tolist(), [{"file": f"f{i}.pdf"} for i in range(30)])
+    collection = quantized.quantized_collection(source, "file", "float32")
+    assert isinstance(collection._current, shared.SharedCollection)
+    assert collection.query(query_embeddings=[matrix[4].tolist()], n_results=1)["ids"] == [["id4"]]
+
+
+def test_distance_to_similarity():
+    """测试距离→相似度换算 - 同一对单位向量在 cosine / ip / l2 空间下得到相同的相似度，且与旧 l2 索引的 1 - d 一致"""
+    cos = 0.8
+    legacy = 1 - (2 - 2 * cos)  # 阈值调参时使用的旧换算（l2 索引上的 1 - d）
+    assert distance_to_similarity(2 - 2 * cos, "l2") == pytest.approx(legacy)
+    assert distance_to_similarity(1 - cos, "cosine") == pytest.approx(legacy)
+    assert distance_to_similarity(1 - cos, "ip") == pytest.approx(legacy)
+    assert distance_to_similarity(3.5, "l2") == 0.0
+    assert distance_to_similarity(0.6, "cosine") == 0.0
+
+
+def test_retry_covers_chroma_only(monkeypatch):
+    """测试重试 - Chroma 的临时错误（SQLite 锁）会重试；Embedding（Ollama）的失败在重试之外，直接上抛"""
+    monkeypatch.setattr(store.StoreConfig, "RETRY_BACKOFF_SEC", 0)
+    calls = []
+
+    class FlakyCollection:
+        def query(self, **kwargs):
+            calls.append(kwargs)
+            if len(calls) == 1:
+                raise sqlite3.OperationalError("database is locked")
+            return {"ids": [["0"]]}
+
+    def embed(texts):
+        return [[float(len(t))] for t in texts]
+
+    collection = RetryingCollection(FlakyCollection(), embed)
+    assert collection.query(query_texts=["たんす"], n_results=1) == {"ids": [["0"]]}
+    assert calls == [{"query_embeddings": [[3.0]], "n_results": 1}] * 2
+
+    def ollama_down(texts):
+        raise ConnectionError("Failed to connect to Ollama")
+
+    calls.clear()
+    with pytest.raises(ConnectionError):
+        RetryingCollection(FlakyCollection(), ollama_down).query(query_texts=["たんす"], n_results=1)
+    assert calls == []
+
+
 # ========== 配置测试 ==========
 
 def test_config_values():
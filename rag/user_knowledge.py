@@ -1,11 +1,8 @@
 # user_knowledge.py
+# pandas / chromadb / PyPDF2 / langchain は重いので、使う関数の中で import する
+# （フロントエンドはアップロードが無い限りこれらを読み込まない）
 import json
-import pandas as pd
 from pathlib import Path
-import chromadb
-from chromadb.utils import embedding_functions
-from PyPDF2 import PdfReader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 
 # ========== ファイルごとのチャンク戦略 ==========
@@ -13,6 +10,8 @@ def chunk_pdf(file_path: Path, chunk_size=500):
     """
     PDFを読み込み、テキストをchunk_size文字ごとに分割する
     """
+    from PyPDF2 import PdfReader
+
     reader = PdfReader(str(file_path))
     chunks = []
     for i, page in enumerate(reader.pages):
@@ -37,6 +36,8 @@ def chunk_pdf(file_path: Path, chunk_size=500):
 
 
 def chunk_txt(file_path: Path):
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
     text = file_path.read_text(encoding="utf-8")
     splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
     return [
@@ -46,6 +47,8 @@ def chunk_txt(file_path: Path):
 
 
 def chunk_csv(file_path: Path, batch_size=50):
+    import pandas as pd
+
     df = pd.read_csv(file_path)
     chunks = []
     for i in range(0, len(df), batch_size):
@@ -107,17 +110,17 @@ def add_file_to_chroma(file_path: Path, persist_dir="./chroma_db", collection_na
         print(f"⚠️ {file_path} からテキストを抽出できませんでした")
         return None
 
-    # DB 接続
-    client = chromadb.PersistentClient(path=persist_dir)
-
-    # コレクション取得 or 作成
     try:
-        collection = client.get_collection(collection_name)
-    except:
-        embed = embedding_functions.OllamaEmbeddingFunction(
-            model_name="kun432/cl-nagoya-ruri-large:337m"
-        )
-        collection = client.create_collection(collection_name, embedding_function=embed)
+        from .embedding import get_embedding_function
+    except ImportError:  # rag/ から直接実行した場合
+        from gomi_rag.embedding import get_embedding_function
+    from gomi_rag.shared import mark_changed
+    from gomi_rag.store import get_collection
+
+    # コレクション取得 or 作成（CHROMA_MODE=http ならバックエンドと同じ Chroma サーバに書き込む）
+    collection = get_collection(
+        collection_name, persist_dir, create=True, embedding_function=get_embedding_function()
+    )
 
     # 追加
     collection.add(
@@ -126,5 +129,8 @@ def add_file_to_chroma(file_path: Path, persist_dir="./chroma_db", collection_na
         ids=[f"{file_path.stem}_{i}" for i in range(len(chunks))]
     )
 
+    # バックエンドの量子化層（gomi_rag.quantized）に書き出し直しを促す
+    mark_changed(collection_name)
+
     print(f"✅ {file_path.name} を {collection_name} に追加しました ({len(chunks)} チャンク)")
     return collection